@@ -0,0 +1,156 @@
+# -*- encoding: utf-8 -*-
+"""
+synthetic exported trees for benchmarks
+
+    root = generate(depth=4, fanout=3, mix=MIXED, seed=1)
+    name = register("ai2.bench.generated.t0", root)
+    loader.load_btree(name)  # with loader.prefix == ""
+
+a generated tree is an exported tree (see the *_btree.py modules) made of
+the composites and leaves of mix. leaves run actions of BenchAgent:
+bench_sync finishes at once, bench_async blocks until completed from
+outside. the tree is a sequence of the generated subtree (always True)
+and a wait for "tick", so the real root restarts it once per tick event.
+"""
+import sys
+import types
+import random
+
+import ai2.runtime.defs as defs
+
+TICK = "tick"  # event restarting the tree
+PING = "ping"  # event waited for by wait leaves
+
+COMPOSITES = ("seq", "sel", "psel", "rseq", "parl", "if", "not", "always")
+LEAVES = ("act", "async", "wait", "cond", "comp")
+
+# kind -> weight
+SYNC = {"seq": 2, "sel": 2, "act": 3, "cond": 2, "comp": 2}
+MIXED = {
+    "seq": 3, "sel": 3, "psel": 1, "rseq": 1, "parl": 1, "if": 1, "not": 1, "always": 1,
+    "act": 4, "async": 2, "wait": 1, "cond": 2, "comp": 2,
+}
+
+_CATEGORIES = {
+    "seq": defs.NT_SEQ,
+    "sel": defs.NT_SEL,
+    "psel": defs.NT_PSEL,
+    "rseq": defs.NT_RSEQ,
+    "parl": defs.NT_PARL,
+    "if": defs.NT_IF,
+    "not": defs.NT_NOT,
+    "always": defs.NT_ALWAYS,
+}
+
+_X = [defs.PAR_BB, "x", "x"]
+_COND = compile("x > 0.5", "<string>", "eval")
+_COMP = compile("x = (x * 7.3 + 0.1) % 1.0", "<string>", "exec")
+
+
+class _Generator(object):
+    def __init__(self, name, mix, seed):
+        self.name = name
+        self.rng = random.Random(seed)
+        self.composites = self._pick(mix, COMPOSITES)
+        self.leaves = self._pick(mix, LEAVES)
+        assert self.leaves, "mix has no leaves"
+        self.uid = 0
+
+    @staticmethod
+    def _pick(mix, kinds):
+        ret = []
+        for k in kinds:
+            w = mix.get(k, 0)
+            if w > 0:
+                ret.append((k, w))
+        return ret
+
+    def _choose(self, choices):
+        kinds = [i[0] for i in choices]
+        weights = [i[1] for i in choices]
+        return self.rng.choices(kinds, weights)[0]
+
+    def node(self, category, data, children):
+        # location like the exporter's (source file, uid)
+        self.uid += 1
+        return category, data, tuple(children), (self.name, self.uid)
+
+    def leaf(self, kind):
+        if kind == "act":
+            return self.node(defs.NT_ACT, (["bench_sync"], [""]), ())
+        elif kind == "async":
+            return self.node(defs.NT_ACT, (["bench_async"], ["bench_async_leave"]), ())
+        elif kind == "wait":
+            return self.node(defs.NT_WAIT, PING, ())
+        elif kind == "cond":
+            return self.node(defs.NT_COND, (_COND, [_X]), ())
+        elif kind == "comp":
+            return self.node(defs.NT_COMP, (_COMP, [_X], [_X]), ())
+        assert False, kind
+
+    def subtree(self, depth, fanout):
+        if depth <= 0 or not self.composites:
+            return self.leaf(self._choose(self.leaves))
+        kind = self._choose(self.composites)
+        category = _CATEGORIES[kind]
+        if kind in ("not", "always"):
+            child = self.subtree(depth - 1, fanout)
+            return self.node(category, True if kind == "always" else (), (child,))
+        if kind == "if":
+            children = (
+                self.leaf("cond"),
+                self.subtree(depth - 1, fanout),
+                self.subtree(depth - 1, fanout))
+            return self.node(category, (), children)
+        children = [self.subtree(depth - 1, fanout) for _ in range(0, fanout)]
+        data = ()
+        if kind == "psel":
+            data = tuple(float(i) for i in range(1, fanout + 1))  # cumulative weights
+        return self.node(category, data, children)
+
+
+def generate(depth, fanout, mix=MIXED, seed=0, name="<generated>"):
+    """
+    :param depth: levels of composites above the leaves
+    :param fanout: children of sequences, selects, parallels...
+    :param mix: node kind -> weight, see COMPOSITES and LEAVES
+    :return: exported root node tuple
+    """
+    g = _Generator(name, mix, seed)
+    body = g.subtree(depth, fanout)
+    # the real root restarts its child forever, block on every pass
+    # whatever the result of body
+    body = g.node(defs.NT_ALWAYS, True, (body,))
+    seq = g.node(defs.NT_SEQ, (), (body, g.node(defs.NT_WAIT, TICK, ())))
+    return g.node(defs.NT_ROOT, (), (seq,))
+
+
+def count_nodes(raw):
+    return 1 + sum(count_nodes(i) for i in raw[2])
+
+
+def register(name, root):
+    """
+    make root importable as btree module name
+    :return: name
+    """
+    m = types.ModuleType(name)
+    m.info = "<generated>"
+    m.root = root
+    sys.modules[name] = m
+    return name
+
+
+def register_fsm(name, tree_name):
+    """
+    make an fsm module pushing tree tree_name importable as name
+    :return: name
+    """
+    m = types.ModuleType(name)
+    m.info = "<generated>"
+    m.states = (((("push_tree", (defs.PAR_CONST, tree_name)),), (), "bench"),)
+    m.initial_state_index = 0
+    m.events = ()
+    m.graph = {}
+    sys.modules[name] = m
+    return name
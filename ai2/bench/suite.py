@@ -0,0 +1,267 @@
+# -*- encoding: utf-8 -*-
+"""
+benchmark suite over synthetic trees (see ai2.bench.generator)
+
+    python run.py ai2.bench.suite                    # compare with baseline.json if any
+    python run.py ai2.bench.suite --save             # save results as baseline.json
+    python run.py ai2.bench.suite --quick --jit -s mixed
+
+every scenario runs agents in a World for a number of rounds, a round
+completes the pending async actions of every agent, fires "ping" and
+"tick" to it and ticks the world. timing is the best of a few repeats
+without tracemalloc, memory is measured by one more traced run.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+import ai2.runtime.loader as loader
+import ai2.runtime.world as world
+import ai2.bench.generator as generator
+from ai2.runtime.action_agent import ActionAgent
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+MODULE_PREFIX = "ai2.bench.generated."
+
+# name, depth, fanout, mix
+SCENARIOS = (
+    ("sync", 4, 3, generator.SYNC),
+    ("mixed", 5, 3, generator.MIXED),
+    ("wide", 2, 16, dict(generator.MIXED, **{"if": 0, "not": 0, "always": 0})),
+    ("deep", 10, 2, generator.MIXED),
+)
+
+# metric -> whether higher is better, only these are compared
+COMPARED = {
+    "visits_per_sec": True,
+    "events_per_sec": True,
+    "peak_bytes": False,
+    "alloc_blocks": False,
+    "alloc_bytes": False,
+}
+
+
+class BenchAgent(ActionAgent):
+    def __init__(self):
+        super(BenchAgent, self).__init__()
+        self.pending = []  # blocked bench_async nodes
+
+    def bench_sync(self, node):
+        node.finish(True)
+
+    def bench_async(self, node):
+        self.pending.append(node)
+
+    def bench_async_leave(self, node):
+        pass
+
+
+def prepare(name, depth, fanout, mix, seed=0):
+    """
+    generate and register the tree and fsm of a scenario
+    :return: fsm name, number of nodes
+    """
+    tree_name = MODULE_PREFIX + name + "_btree"
+    fsm_name = MODULE_PREFIX + name + "_fsm"
+    root = generator.generate(depth, fanout, mix, seed, tree_name)
+    generator.register(tree_name, root)
+    generator.register_fsm(fsm_name, tree_name)
+    loader.load_btree(tree_name, force=True)
+    loader.load_fsm(fsm_name, force=True)
+    return fsm_name, generator.count_nodes(root)
+
+
+def spawn(fsm_name, n_agents, seed=0, flyweight=False):
+    w = world.World()
+    agents = []
+    for i in range(0, n_agents):
+        a = BenchAgent()
+        a.flyweight = flyweight
+        a.seed_rng(i, seed)
+        a.blackboard["x"] = (i % 10) / 10.0
+        a.set_fsm(fsm_name)
+        a.enable(True)
+        w.add_agent(a)
+        agents.append(a)
+    return w, agents
+
+
+def drive(w, agents, rounds, seed=0):
+    """
+    :return: node visits, events and completions fed to the agents
+    """
+    rng = random.Random(seed)
+    visits = 0
+    events = 0
+    for _ in range(0, rounds):
+        for a in agents:
+            pending, a.pending = a.pending, []
+            for node in pending:
+                node.finish(rng.random() < 0.8)
+            events += len(pending) + 2
+            a.fire_event(generator.PING)
+            a.fire_event(generator.TICK)
+        w.tick()
+        visits += w.last_visits
+        while w.dirty:
+            # out of budget agents, not used by default
+            w.tick()
+            visits += w.last_visits
+    return visits, events
+
+
+def run_scenario(name, depth, fanout, mix, n_agents=100, rounds=50, repeat=3,
+                 memory=True, seed=0, flyweight=False):
+    """
+    :return: dict of results
+    """
+    old_prefix = loader.prefix
+    loader.prefix = ""
+    try:
+        fsm_name, n_nodes = prepare(name, depth, fanout, mix, seed)
+        best = None
+        for _ in range(0, repeat):
+            w, agents = spawn(fsm_name, n_agents, seed, flyweight)
+            t0 = time.perf_counter()
+            visits, events = drive(w, agents, rounds, seed)
+            t = time.perf_counter() - t0
+            if best is None or t < best:
+                best = t
+        result = {
+            "nodes": n_nodes,
+            "agents": n_agents,
+            "rounds": rounds,
+            "visits": visits,
+            "events": events,
+            "seconds": best,
+            "visits_per_sec": visits / best,
+            "events_per_sec": events / best,
+        }
+        if memory:
+            result.update(measure_memory(fsm_name, n_agents, rounds, seed, flyweight))
+        return result
+    finally:
+        loader.prefix = old_prefix
+
+
+def measure_memory(fsm_name, n_agents, rounds, seed=0, flyweight=False):
+    """
+    memory of spawning and driving the agents, blocks and bytes are those
+    still allocated at the end (the agents are alive)
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        w, agents = spawn(fsm_name, n_agents, seed, flyweight)
+        drive(w, agents, rounds, seed)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    blocks = sum(i.count_diff for i in diff)
+    size = sum(i.size_diff for i in diff)
+    return {
+        "peak_bytes": peak - base,
+        "alloc_blocks": blocks,
+        "alloc_bytes": size,
+        "bytes_per_agent": size / n_agents,
+    }
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    :param tolerance: relative change tolerated
+    :return: [(scenario, metric, baseline value, value)] of regressions
+    """
+    regressions = []
+    for name, r in sorted(results.items()):
+        b = baseline.get(name)
+        if b is None:
+            continue
+        for metric, higher_is_better in sorted(COMPARED.items()):
+            if metric not in r or not b.get(metric):
+                continue
+            old, new = b[metric], r[metric]
+            if higher_is_better:
+                worse = new < old * (1 - tolerance)
+            else:
+                worse = new > old * (1 + tolerance)
+            if worse:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+
+
+def _format(name, r, b):
+    line = "%-8s nodes %4d  visits/s %10.0f  events/s %9.0f" % (
+        name, r["nodes"], r["visits_per_sec"], r["events_per_sec"])
+    if "peak_bytes" in r:
+        line += "  peak %8.1fKB  alloc %7d blocks %8.1fKB" % (
+            r["peak_bytes"] / 1024.0, r["alloc_blocks"], r["alloc_bytes"] / 1024.0)
+    if b and b.get("visits_per_sec"):
+        line += "  (x%.2f)" % (r["visits_per_sec"] / b["visits_per_sec"])
+    return line
+
+
+def run():
+    parser = argparse.ArgumentParser(prog="python run.py ai2.bench.suite")
+    parser.add_argument("-s", "--scenario", action="append",
+                        help="run only these scenarios: " + ", ".join(i[0] for i in SCENARIOS))
+    parser.add_argument("-n", "--agents", type=int, default=100)
+    parser.add_argument("-m", "--rounds", type=int, default=50)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="10 agents, 10 rounds, 1 repeat")
+    parser.add_argument("--jit", action="store_true", help="load trees with loader.use_jit")
+    parser.add_argument("--flyweight", action="store_true", help="run trees as flyweight instances")
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="save the results as baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args(sys.argv[2:])
+    if args.quick:
+        args.agents, args.rounds, args.repeat = 10, 10, 1
+
+    baseline = {}
+    if not args.save and os.path.exists(args.baseline):
+        baseline = load_baseline(args.baseline)
+    old_jit = loader.use_jit
+    loader.use_jit = args.jit
+    results = {}
+    try:
+        for name, depth, fanout, mix in SCENARIOS:
+            if args.scenario and name not in args.scenario:
+                continue
+            r = run_scenario(name, depth, fanout, mix, args.agents, args.rounds,
+                             args.repeat, not args.no_memory, flyweight=args.flyweight)
+            results[name] = r
+            print(_format(name, r, baseline.get(name)))
+    finally:
+        loader.use_jit = old_jit
+
+    if args.save:
+        save_baseline(args.baseline, results)
+        print("baseline saved to %s" % args.baseline)
+        return
+    if not baseline:
+        return
+    regressions = compare(results, baseline, args.tolerance)
+    for name, metric, old, new in regressions:
+        print("REGRESSION %s %s: %g -> %g" % (name, metric, old, new))
+    if regressions:
+        sys.exit(1)
@@ -39,6 +39,8 @@ else:
 
 enable_register4export()
 
+# set_blackboard expression -> code object
+_compiled_expressions = {}
 
 
 @register4export
@@ -71,7 +73,11 @@ class ActionAgent(Agent):
 
     @register4export
     def set_blackboard(self, node, dst_name, expression):
-        val = eval(expression, None, None)
+        code = _compiled_expressions.get(expression)
+        if code is None:
+            code = _compiled_expressions[expression] = \
+                compile(expression, "<string>", "eval")
+        val = eval(code, None, None)
         self.set_value((defs.PAR_BB, dst_name, val))
         node.finish(True)
 
@@ -100,3 +106,13 @@ class ActionAgent(Agent):
     @register4export
     def test_action_leave(self, node, para):
         self.blackboard[para] = False
+
+    @register4export
+    def wait_blackboard_enter(self, node, key):
+        def on_change(value):
+            node.finish(True)
+        node.node_state = self.blackboard.watch(key, on_change)
+
+    @register4export
+    def wait_blackboard_leave(self, node):
+        self.blackboard.unwatch(node.node_state)
@@ -6,6 +6,15 @@ import ai2.runtime.fsm as fsm
 import ai2.runtime.nodes as nodes
 import ai2.runtime.defs as defs
 import ai2.runtime.loader as loader
+import ai2.runtime.pool as pool
+import ai2.runtime.expr as expr
+import ai2.runtime.blackboard as blackboard
+import ai2.runtime.mode as mode
+import ai2.runtime.metrics as metrics
+import ai2.runtime.rand as rand
+import ai2.runtime.dispatch as dispatch
+import ai2.runtime.props as props
+import ai2.runtime.flyweight as flyweight
 
 logger = logging.getLogger(__name__)
 
@@ -27,13 +36,45 @@ class Agent(object):
         # behavior tree related
         self.btree = None
         self.fronts = set()
+        # nodes that became NEW/AWAKEN and wait to be visited
+        self.ready_queue = collections.deque()
+        # recycled DEAD nodes
+        self.node_pool = pool.NodePool()
+        # event name -> WaitFor nodes blocked on it (dict used as ordered set)
+        self.event_waiters = {}
+        # run trees as flyweight.Instance, set before pushing trees
+        self.flyweight = False
 
         # blackboard
-        self.blackboard = {}
+        self.blackboard = blackboard.Blackboard()
+
+        # random source of stochastic nodes, see seed_rng
+        self.rng = rand.AgentRandom(rand.next_seed())
+
+        # world(scheduler) the agent is ticked by, None to poll on demand
+        self.world = None
+        # sampling.PickBatch Probability nodes defer their pick to, set by
+        # the world while it settles the agent
+        self.pick_batch = None
+        # stopped polling until the pick of a Probability node is made
+        self.suspended = False
+        self.poll_count = 0
+        # tick_cached property name -> (tick stamp, value), see props
+        self.prop_cache = {}
 
         # debug
         self.debugger = None
         self.debug_id = None
+        # mixins of the node classes pushed by this agent, see nodes.get_variant
+        self.node_mixins = ()
+        self.profiler = None
+        # metrics.AgentMetrics, None when not measured
+        self.metrics = None
+        self.recorder = None  # replay.Recorder
+
+        # TreeDesc -> action dispatch table of the class, see relink
+        self.action_links = None
+        self.relink()
 
     def enable(self, on_off):
         """
@@ -50,22 +91,43 @@ class Agent(object):
 
     def fire_event(self, event):
         """
-        ai execution will be triggered during this call
+        ai execution will be triggered during this call, or deferred to the
+        next world tick if the agent belongs to a world
         :param event: event to be received
         :return: None
         """
         if not self._enabled:
             return
+        if self.metrics is not None:
+            self.metrics.events_fired.inc()
+        if self.world is not None and not self.processing:
+            self.world.post_event(self, event)
+            return
         self.event_queue.append(event)
         if not self.processing:
             self.poll()
 
     def _btree_check_event(self, event):
-        for n in self.fronts:
-            ret = n.try_swallow(event)
-            if ret:
-                return True
-        return False
+        waiters = self.event_waiters.get(event)
+        if not waiters:
+            return False
+        # the earliest blocked node swallows the event
+        n = next(iter(waiters))
+        return n.try_swallow(event)
+
+    def add_event_waiter(self, event, node):
+        waiters = self.event_waiters.get(event)
+        if waiters is None:
+            self.event_waiters[event] = waiters = {}
+        waiters[node] = None
+
+    def remove_event_waiter(self, event, node):
+        waiters = self.event_waiters.get(event)
+        if waiters is None:
+            return
+        waiters.pop(node, None)
+        if not waiters:
+            del self.event_waiters[event]
 
     def _fsm_check_event(self, event):
         swallowed, new_state_index = False, None
@@ -93,9 +155,103 @@ class Agent(object):
     def set_fsm(self, fsm_name):
         self.fsm_name = fsm_name
 
-    @staticmethod
-    def enable_debug(self):
-        raise NotImplemented
+    def seed_rng(self, agent_id, base_seed=None):
+        """
+        seed the random source from a stable agent id, so runs do not depend
+        on the order agents are created in
+        """
+        self.rng = rand.AgentRandom(rand.seed_for(agent_id, base_seed))
+
+    def attach_debugger(self, debugger):
+        """
+        nodes pushed from now on report their state transitions to debugger
+        """
+        self.debugger = debugger
+        if mode.debug_hooks and nodes.DebugHooks not in self.node_mixins:
+            self.node_mixins = (nodes.DebugHooks,) + self.node_mixins
+
+    def detach_debugger(self):
+        self.debugger = None
+        self.node_mixins = tuple(
+            i for i in self.node_mixins if i is not nodes.DebugHooks)
+
+    def attach_metrics(self, registry):
+        """
+        report to registry(metrics.Registry), it may be shared by agents
+        """
+        self.metrics = metrics.AgentMetrics(registry)
+
+    def detach_metrics(self):
+        self.metrics = None
+
+    def attach_recorder(self, recorder):
+        """
+        log the inputs of the agent with recorder(replay.Recorder), attach
+        before enabling the agent
+        """
+        assert self.recorder is None
+        self.recorder = recorder
+        recorder.instrument(self)
+        self.relink()
+        self.node_mixins = self.node_mixins + (nodes.RecordHooks,)
+
+    def detach_recorder(self):
+        self.recorder.uninstrument(self)
+        self.recorder = None
+        self.relink()
+        self.node_mixins = tuple(
+            i for i in self.node_mixins if i is not nodes.RecordHooks)
+
+    def attach_profiler(self, profiler):
+        """
+        time nodes pushed from now on with profiler(ai2.runtime.profiler.Profiler)
+        """
+        assert self.profiler is None
+        self.profiler = profiler
+        profiler.instrument(self)
+        self.relink()
+        self.node_mixins = self.node_mixins + (nodes.ProfileHooks,)
+
+    def detach_profiler(self):
+        self.profiler.uninstrument(self)
+        self.profiler = None
+        self.relink()
+        self.node_mixins = tuple(
+            i for i in self.node_mixins if i is not nodes.ProfileHooks)
+
+    def relink(self):
+        """
+        call the actions of nodes through the dispatch tables of the class
+        (see ai2.runtime.dispatch), unless agent_action is overridden or
+        wrapped, then every action goes through agent_action. so does an
+        agent setting actions of its trees on the instance, call relink
+        after setting one while its tree runs
+        """
+        if type(self).agent_action is Agent.agent_action \
+                and "agent_action" not in self.__dict__:
+            links = dispatch.class_links(type(self))
+            if any(self._overrides_actions(i) for i in links):
+                links = None
+            self.action_links = links
+        else:
+            self.action_links = None
+
+    def link_tree(self, tree):
+        """
+        resolve the actions of tree(defs.TreeDesc) for the class
+        :raise dispatch.LinkError: if actions are missing
+        """
+        links = self.action_links
+        if links is None:
+            return
+        if tree not in links:
+            dispatch.link_tree(type(self), tree)
+        if self._overrides_actions(tree):
+            # the class tables would bypass them
+            self.action_links = None
+
+    def _overrides_actions(self, tree):
+        return not self.__dict__.keys().isdisjoint(dispatch.action_names(tree))
 
     def agent_action(self, node, method_name, arg_list):
         if method_name == "":
@@ -110,10 +266,33 @@ class Agent(object):
         elif tup[0] == defs.PAR_BB:
             return self.blackboard[tup[1]]
         elif tup[0] == defs.PAR_PROP:
-            return getattr(self, tup[1])
+            return self.get_property(tup[1])
         else:
             assert False
 
+    def tick_stamp(self):
+        """
+        :return: current tick, for tick_cached properties
+        """
+        w = self.world
+        return self.poll_count if w is None else w.tick_count
+
+    def invalidate(self, name):
+        """
+        forget the tick_cached properties depending on name (an attribute or
+        a tick_cached property), and name itself if it is tick_cached
+        """
+        cache = self.prop_cache
+        for k in props.dependents(type(self), name):
+            if cache.pop(k, None) is not None and k != name:
+                self.invalidate(k)
+
+    def get_property(self, name):
+        """
+        read an agent property(PAR_PROP) for expressions and action arguments
+        """
+        return getattr(self, name)
+
     def set_value(self, tup):
         if tup[0] == defs.PAR_BB:
             self.blackboard[tup[1]] = tup[2]
@@ -128,7 +307,10 @@ class Agent(object):
         assert(len(self.fsm_stack) == 0)
         nfsm = fsm.Fsm(self.fsm_name)
         nfsm.push_self(self)
-        self.poll()
+        if self.world is not None:
+            self.world.mark_dirty(self)
+        else:
+            self.poll()
 
     def _stop(self):
         self._enabled = False
@@ -145,23 +327,27 @@ class Agent(object):
         return len(self.event_queue)
 
     def execute(self, dst, formula, src):
-        local = {}
-        for tp, var_name, expr_name in src:
-            local[expr_name] = self.get_value((tp, var_name))
-        exec(formula, {}, local)
-        for tp, var_name, expr_name in dst:
-            self.set_value((tp, var_name, local[expr_name]))
+        self.compute(expr.bind(formula, src, dst))
 
     def evaluate(self, formula, src):
-        local = {}
-        for tp, var_name, expr_name in src:
-            local[expr_name] = self.get_value((tp, var_name))
-        r = eval(formula, {}, local)
-        return r
+        return self.condition(expr.bind(formula, src))
+
+    def compute(self, e):
+        """
+        run a bound exec expression(expr.Expression) and store its outputs
+        """
+        e.run(self)
+
+    def condition(self, e):
+        """
+        evaluate a bound eval expression(expr.Expression)
+        """
+        return e.run(self)
 
     def stop_btree(self):
         if self.btree:
             self.btree.interrupt()
+            self.node_pool.release(self.btree)
         self.btree = None
 
     def stop_all_fsm(self):
@@ -178,59 +364,103 @@ class Agent(object):
             # we are pushing a root
             # we are changing to a new btree
             self.stop_btree()
-        clz = nodes.get_node_class(node_desc[0])
-        new_node = clz(parent, child_index, node_desc, self)
+        clz = node_desc.node_class
+        if clz is nodes.Root and self.flyweight and not any(
+                i in flyweight.NODE_HOOKS for i in self.node_mixins):
+            clz = flyweight.Instance
+        if self.node_mixins:
+            clz = nodes.get_variant(clz, self.node_mixins)
+        new_node = self.node_pool.acquire(clz, parent, child_index, node_desc, self)
+        self.ready_queue.append(new_node)
         if parent is None:
             self.btree = new_node
 
-    def poll_fronts(self):
-        need_process = False
-        for n in self.fronts:
-            if n.state in n.READY_STATES:
-                need_process = True
-                break
-        if not need_process:
-            return False
-        # note that self.front will change during iteration
-        # process each front until all fronts are blocking
+    def poll_fronts(self, max_visits=None):
+        """
+        :param max_visits: stop after visiting this many nodes, None for no limit
+        :return: number of visited nodes
+        """
+        queue = self.ready_queue
+        if not queue:
+            self.node_pool.flush()
+            return 0
+        # nodes pushed during visiting are appended to the queue and
+        # processed in FIFO order until all fronts are blocking
         assert(self.processing is False)
         self.processing = True
-        has_ready = True
-        while has_ready:
-            has_ready = False
-            visit_set = set(self.fronts)
-            for n in visit_set:
-                # note that when parallel return, some node in visit_set
-                # will become DEAD before visited
-                if n.state in n.READY_STATES:
-                    has_ready = True
-                    n.visit()
+        visits = 0
+        while queue:
+            if max_visits is not None and visits >= max_visits:
+                break
+            n = queue.popleft()
+            # an entry may be stale: the node could have been visited through
+            # an earlier entry, or died (e.g. interrupted when parallel returns)
+            if n.state in n.READY_STATES and n in self.fronts:
+                visits += 1
+                n.visit()
+                if self.suspended:
+                    break
         self.processing = False
-        return True  # processed something
+        if not queue:
+            # no stale entry can refer to the nodes released meanwhile
+            self.node_pool.flush()
+        return visits
 
     def poll_events(self):
         assert(self.processing is False)
         self.processing = True
         processed = False
+        m = self.metrics
         while len(self.event_queue):
             event = self.event_queue.popleft()
             ret = self._btree_check_event(event)
             if ret:
+                if m is not None:
+                    m.events_swallowed.inc()
                 processed = True
                 break
             ret = self._fsm_check_event(event)
             if not ret:
                 logger.info("event with no receiver:%s" % event)
+                if m is not None:
+                    m.events_unreceived.inc()
+            elif m is not None:
+                m.fsm_transitions.inc()
             processed = True
         self.processing = False
         return processed
 
-    def poll(self):
-        while True:
+    def poll(self, max_visits=None):
+        """
+        process events and fronts until settled
+        :param max_visits: node visit budget, None for no limit
+        :return: number of visited nodes
+        """
+        self.poll_count += 1
+        m = self.metrics
+        if m is not None:
+            t0 = m.clock()
+        visits = 0
+        while max_visits is None or visits < max_visits:
             ret0 = self.poll_events()
-            ret1 = self.poll_fronts()
-            if ret0 is False and ret1 is False:
+            if max_visits is None:
+                ret1 = self.poll_fronts()
+            else:
+                ret1 = self.poll_fronts(max_visits - visits)
+            visits += ret1
+            if (ret0 is False and ret1 == 0) or self.suspended:
                 break
+        if m is not None:
+            m.poll_time.observe(m.clock() - t0)
+            m.poll_visits.observe(visits)
+            m.fronts.observe(len(self.fronts))
+        return visits
+
+    def has_pending(self):
+        """
+        whether the agent has work left, e.g. after running out of budget
+        """
+        return len(self.event_queue) > 0 or len(self.ready_queue) > 0
 
     def get_exec_state(self):
         # stack info
@@ -0,0 +1,130 @@
+# -*- encoding: utf-8 -*-
+
+# keys are resolved to integer slots shared by every blackboard, so trees can
+# resolve the keys they use once at load time
+_key_to_slot = {}
+_slot_to_key = []
+
+MISSING = object()  # value of a slot that is not set
+
+
+def slot_of(key):
+    slot = _key_to_slot.get(key)
+    if slot is None:
+        slot = _key_to_slot[key] = len(_slot_to_key)
+        _slot_to_key.append(key)
+    return slot
+
+
+def key_of(slot):
+    return _slot_to_key[slot]
+
+
+class Blackboard(object):
+    """
+    array backed agent blackboard
+
+    the dict like interface (bb[key]) is kept for actions and tests, the
+    runtime uses get_slot/set_slot with slots resolved by slot_of
+    """
+    __slots__ = ("values", "watchers")
+
+    def __init__(self, init=None):
+        self.values = []  # slot -> value or MISSING
+        self.watchers = {}  # slot -> [callback(value)]
+        if init:
+            self.update(init)
+
+    def get_slot(self, slot):
+        try:
+            v = self.values[slot]
+        except IndexError:
+            v = MISSING
+        if v is MISSING:
+            raise KeyError(_slot_to_key[slot])
+        return v
+
+    def set_slot(self, slot, value):
+        values = self.values
+        n = len(values)
+        if slot >= n:
+            values.extend([MISSING] * (slot + 1 - n))
+        old = values[slot]
+        values[slot] = value
+        if slot in self.watchers and (old is not value and old != value):
+            # callbacks may unwatch themselves
+            for cb in list(self.watchers[slot]):
+                cb(value)
+
+    def del_slot(self, slot):
+        self.get_slot(slot)  # raise KeyError if not set
+        self.values[slot] = MISSING
+
+    ###########################################################################
+    # change notification
+    ###########################################################################
+    def watch(self, key, callback):
+        """
+        call callback(value) every time key is set to a different value
+        :return: handle for unwatch
+        """
+        slot = slot_of(key)
+        self.watchers.setdefault(slot, []).append(callback)
+        return slot, callback
+
+    def unwatch(self, handle):
+        slot, callback = handle
+        callbacks = self.watchers[slot]
+        callbacks.remove(callback)
+        if not callbacks:
+            del self.watchers[slot]
+
+    def is_watched(self, key):
+        return _key_to_slot.get(key) in self.watchers
+
+    ###########################################################################
+    # dict like interface
+    ###########################################################################
+    def __getitem__(self, key):
+        slot = _key_to_slot.get(key)
+        if slot is None:
+            raise KeyError(key)
+        return self.get_slot(slot)
+
+    def __setitem__(self, key, value):
+        self.set_slot(slot_of(key), value)
+
+    def __delitem__(self, key):
+        slot = _key_to_slot.get(key)
+        if slot is None:
+            raise KeyError(key)
+        self.del_slot(slot)
+
+    def __contains__(self, key):
+        slot = _key_to_slot.get(key)
+        return slot is not None and slot < len(self.values) \
+            and self.values[slot] is not MISSING
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def keys(self):
+        return [_slot_to_key[i] for i, v in enumerate(self.values) if v is not MISSING]
+
+    def items(self):
+        return [(_slot_to_key[i], v) for i, v in enumerate(self.values) if v is not MISSING]
+
+    def update(self, other):
+        for k, v in other.items():
+            self[k] = v
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return "Blackboard(%r)" % dict(self.items())
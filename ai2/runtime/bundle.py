@@ -0,0 +1,179 @@
+# -*- encoding: utf-8 -*-
+"""
+single file bundle of exported trees and fsms
+
+    write_bundle("ai.bundle", modules)  # see ai2.tools.bundle_exporter
+    loader.open_bundle("ai.bundle")
+
+the file is mapped read only, so processes opening the same bundle (e.g.
+ShardedWorld workers) share its pages. layout:
+
+    HEADER
+    marshal'd values (node data, debug info, fsm entries), each stored once
+    node records (RECORD) and their child tables (CHILD per child)
+    marshal'd index {module name: entry}
+
+a node record refers to its children and values by file offset, a node
+tuple used twice in a module is stored once. nothing is unmarshal'd
+before loader asks for a module, then only the records of its tree are
+read. values are unmarshal'd once per bundle and shared by every tree
+using them (e.g. the code objects of equal NT_COMP/NT_COND expressions).
+"""
+import mmap
+import types
+import struct
+import marshal
+
+import ai2.runtime.defs as defs
+import ai2.runtime.expr as expr
+
+MAGIC = b"AI2B"
+VERSION = 3
+HEADER = struct.Struct("<4sIQQ")  # magic, version, index offset, index size
+# category code, child count, child table offset,
+# data offset, data size, debug info offset, debug info size
+RECORD = struct.Struct("<BHIIIII")
+CHILD = struct.Struct("<I")  # record offset
+
+# index entries
+# (kind, info, root record offset, expression sources, see expr.module_sources)
+KIND_BTREE = 0
+KIND_FSM = 1  # (kind, value offset, value size) of the FSM_FIELDS values
+
+FSM_FIELDS = ("info", "states", "initial_state_index", "events", "graph")
+
+CATEGORIES = (
+    defs.NT_ROOT, defs.NT_SEQ, defs.NT_RSEQ, defs.NT_SEL, defs.NT_PSEL,
+    defs.NT_IF, defs.NT_PARL, defs.NT_UNTIL, defs.NT_NOT, defs.NT_TRUE,
+    defs.NT_ALWAYS, defs.NT_CALL, defs.NT_ACT, defs.NT_COMP, defs.NT_COND,
+    defs.NT_WAIT)
+CATEGORY_CODES = dict((c, i) for i, c in enumerate(CATEGORIES))
+
+
+class _Writer(object):
+    def __init__(self, f):
+        self.f = f
+        self.offset = HEADER.size
+        self.values = {}  # marshal'd value -> offset
+        self.raws = {}  # id of node tuple -> (node tuple, offset)
+
+    def _write(self, body):
+        offset = self.offset
+        self.f.write(body)
+        self.offset += len(body)
+        return offset
+
+    def value(self, v):
+        body = marshal.dumps(v)
+        offset = self.values.get(body)
+        if offset is None:
+            offset = self.values[body] = self._write(body)
+        return offset, len(body)
+
+    def record(self, raw):
+        known = self.raws.get(id(raw))
+        if known is not None:
+            return known[1]
+        category, data, children, debug_info = raw
+        table = b"".join(CHILD.pack(self.record(c)) for c in children)
+        table_offset = self._write(table) if table else 0
+        data_offset, data_size = self.value(data)
+        debug_offset, debug_size = self.value(debug_info)
+        packed = RECORD.pack(
+            CATEGORY_CODES[category], len(children), table_offset,
+            data_offset, data_size, debug_offset, debug_size)
+        offset = self._write(packed)
+        # keep raw alive so its id is not reused
+        self.raws[id(raw)] = raw, offset
+        return offset
+
+    def module(self, m):
+        """
+        :param m: imported _btree/_fsm module
+        :return: index entry
+        """
+        if hasattr(m, "root"):
+            return KIND_BTREE, getattr(m, "info", None), self.record(m.root), \
+                tuple(expr.module_sources(m))
+        offset, size = self.value(tuple(getattr(m, i) for i in FSM_FIELDS))
+        return KIND_FSM, offset, size
+
+
+def write_bundle(path, modules):
+    """
+    :param modules: imported _btree/_fsm modules
+    """
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        w = _Writer(f)
+        index = {}
+        for m in modules:
+            index[m.__name__] = w.module(m)
+        body = marshal.dumps(index)
+        offset = w._write(body)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, offset, len(body)))
+
+
+class Bundle(object):
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, offset, size = HEADER.unpack_from(self.map, 0)
+        assert magic == MAGIC, "%s is not a bundle" % path
+        assert version == VERSION, version
+        self.index = marshal.loads(self.map[offset:offset + size])
+        self.values = {}  # offset -> unmarshal'd value
+
+    def close(self):
+        self.values.clear()
+        self.map.close()
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def value(self, offset, size):
+        try:
+            return self.values[offset]
+        except KeyError:
+            v = self.values[offset] = marshal.loads(self.map[offset:offset + size])
+            return v
+
+    def node(self, offset, memo):
+        """
+        :param memo: record offset -> node tuple made in this tree
+        :return: node tuple (category, data, children, debug_info) of the
+                 record at offset
+        """
+        raw = memo.get(offset)
+        if raw is None:
+            code, n, table_offset, data_offset, data_size, debug_offset, debug_size = \
+                RECORD.unpack_from(self.map, offset)
+            children = tuple(
+                self.node(CHILD.unpack_from(self.map, table_offset + i * CHILD.size)[0], memo)
+                for i in range(0, n))
+            raw = memo[offset] = (
+                CATEGORIES[code],
+                self.value(data_offset, data_size),
+                children,
+                self.value(debug_offset, debug_size))
+        return raw
+
+    def get_module(self, name):
+        """
+        :return: module object made from the entry of name, None if the
+                 bundle has no such module
+        """
+        entry = self.index.get(name)
+        if entry is None:
+            return None
+        m = types.ModuleType(name)
+        if entry[0] == KIND_BTREE:
+            m.info = entry[1]
+            m.root = self.node(entry[2], {})
+            m.expr_sources = entry[3]
+        else:
+            for k, v in zip(FSM_FIELDS, self.value(entry[1], entry[2])):
+                setattr(m, k, v)
+        return m
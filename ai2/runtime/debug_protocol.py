@@ -0,0 +1,159 @@
+# -*- encoding: utf-8 -*-
+"""
+binary protocol between DebugStub and debugger clients
+
+a frame is a header (body length, message type) followed by the body.
+control messages carry a marshal'd tuple, trace messages carry a batch of
+fixed size records of one agent. agents and trees are referred to by small
+numbers announced once per connection (MSG_AGENT, MSG_TREE), a node is
+(tree id, node index in the tree).
+"""
+import struct
+import marshal
+
+from ai2.runtime.nodes import Node
+
+VERSION = 1
+
+HEADER = struct.Struct("<IB")  # body length, message type
+TRACE_HEADER = struct.Struct("<HII")  # agent number, records lost, record count
+RECORD = struct.Struct("<HIBd")  # tree id, node index, state code, timestamp
+
+# client -> stub
+MSG_HELLO = 0  # (version,)
+MSG_LIST = 1  # ()
+MSG_SUBSCRIBE = 2  # (agent_id or None for all agents, on_off, TraceFilter spec or None)
+# stub -> client
+MSG_WELCOME = 16  # (version,)
+MSG_AGENTS = 17  # ([agent_id],)
+MSG_SUBSCRIBED = 18  # (agent_id, ok)
+MSG_AGENT = 19  # (agent number, agent_id)
+MSG_TREE = 20  # (tree id, tree name, [debug_info by node index])
+MSG_TRACE = 21  # TRACE_HEADER + records
+
+# state <-> code used in trace records
+STATES = (
+    Node.NEW, Node.ENTERING, Node.AWAKEN, Node.REVISITING,
+    Node.BLOCKING, Node.WAIT_CHILD, Node.LEAVING, Node.DEAD)
+STATE_CODES = dict((s, i) for i, s in enumerate(STATES))
+ALL_STATES = frozenset(STATES)
+
+
+def pack_message(msg_type, *args):
+    body = marshal.dumps(args)
+    return HEADER.pack(len(body), msg_type) + body
+
+
+def unpack_message(body):
+    """
+    :return: args tuple of a control message
+    :raise ValueError: if body is not a marshal'd tuple
+    """
+    args = marshal.loads(body)
+    if not isinstance(args, tuple):
+        raise ValueError("message body is not a tuple: %r" % (args,))
+    return args
+
+
+def pack_trace(agent_no, lost, count, records):
+    """
+    :param records: count RECORD packed back to back
+    """
+    body_len = TRACE_HEADER.size + len(records)
+    return HEADER.pack(body_len, MSG_TRACE) + \
+        TRACE_HEADER.pack(agent_no, lost, count) + records
+
+
+def unpack_trace(body):
+    """
+    :return: agent number, records lost, [(tree id, node index, state code, timestamp)]
+    """
+    agent_no, lost, count = TRACE_HEADER.unpack_from(body)
+    records = list(RECORD.iter_unpack(memoryview(body)[TRACE_HEADER.size:]))
+    assert len(records) == count
+    return agent_no, lost, records
+
+
+class FrameReader(object):
+    """
+    reassemble frames from a byte stream
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        :return: [(message type, body)] of the frames completed by data
+        """
+        buf = self.buffer
+        buf += data
+        frames = []
+        pos = 0
+        while len(buf) - pos >= HEADER.size:
+            body_len, msg_type = HEADER.unpack_from(buf, pos)
+            end = pos + HEADER.size + body_len
+            if end > len(buf):
+                break
+            frames.append((msg_type, bytes(buf[pos + HEADER.size:end])))
+            pos = end
+        del buf[:pos]
+        return frames
+
+
+class TraceFilter(object):
+    """
+    which transitions of a subscribed agent are recorded and shipped
+
+    a transition matches when every given field matches (fields left None
+    match anything): files and lines are checked against the node location
+    (source file, line), categories against the node type (e.g. NT_ACT) and
+    states against the state the node enters
+    """
+    FIELDS = ("files", "lines", "categories", "states")
+
+    def __init__(self, files=None, lines=None, categories=None, states=None):
+        self.files = None if files is None else frozenset(files)
+        self.lines = None if lines is None else frozenset(lines)
+        self.categories = None if categories is None else frozenset(categories)
+        self.states = ALL_STATES if states is None else frozenset(states)
+
+    @classmethod
+    def from_spec(cls, spec):
+        """
+        :raise ValueError: if spec is not what to_spec returns
+        """
+        if spec is None:
+            return None
+        if not isinstance(spec, dict):
+            raise ValueError("bad trace filter spec %r" % (spec,))
+        for k, v in spec.items():
+            if k not in cls.FIELDS or not isinstance(v, (list, tuple)):
+                raise ValueError("bad trace filter field %r: %r" % (k, v))
+        return cls(**spec)
+
+    def to_spec(self):
+        """
+        :return: marshal friendly form sent in MSG_SUBSCRIBE
+        """
+        spec = {}
+        for k in self.FIELDS:
+            v = getattr(self, k)
+            if v is not None and v is not ALL_STATES:
+                spec[k] = list(v)
+        return spec
+
+    def states_for(self, desc):
+        """
+        :return: states in which transitions of nodes of desc match
+        """
+        if self.categories is not None and desc.category not in self.categories:
+            return frozenset()
+        if self.files is not None or self.lines is not None:
+            location = desc.debug_info
+            if not isinstance(location, tuple) or len(location) != 2:
+                return frozenset()
+            if self.files is not None and location[0] not in self.files:
+                return frozenset()
+            if self.lines is not None and location[1] not in self.lines:
+                return frozenset()
+        return self.states
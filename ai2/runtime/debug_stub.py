@@ -1,6 +1,112 @@
 # -*- encoding: utf-8 -*-
+import time
+import socket
+import logging
+import selectors
 import threading
-from xmlrpc.server import SimpleXMLRPCServer
+
+import ai2.runtime.debug_protocol as protocol
+from ai2.runtime.debug_protocol import STATES, STATE_CODES
+
+logger = logging.getLogger(__name__)
+
+
+class TreeTable(object):
+    """
+    tree descriptors interned to the small ids used in trace records
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.trees = []  # tree id -> defs.TreeDesc
+
+    def intern(self, tree):
+        tid = self.ids.get(tree)
+        if tid is None:
+            with self.lock:
+                tid = self.ids.get(tree)
+                if tid is None:
+                    tid = len(self.trees)
+                    self.trees.append(tree)
+                    self.ids[tree] = tid
+        return tid
+
+    def get_location(self, tid, index):
+        return self.trees[tid].nodes[index].debug_info
+
+
+# shared by all trace buffers so that a client learns every tree only once
+trees = TreeTable()
+
+
+class TraceBuffer(object):
+    """
+    bounded ring buffer of fixed size binary records (protocol.RECORD) of
+    one agent
+
+    there is a single writer (the agent thread) which never locks: it
+    writes a record and then publishes it by bumping written. readers keep
+    their own cursor (a count of records) and detect records overwritten
+    while they were reading.
+    """
+    RECORD = protocol.RECORD
+    DEFAULT_CAPACITY = 4096
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, tree_table=None):
+        self.capacity = capacity
+        self.buffer = bytearray(self.RECORD.size * capacity)
+        self.written = 0  # total records ever written
+        self.trees = tree_table or trees
+        self.tree_ids = self.trees.ids
+
+    def append(self, desc, state):
+        tid = self.tree_ids.get(desc.tree)
+        if tid is None:
+            tid = self.trees.intern(desc.tree)
+        w = self.written
+        self.RECORD.pack_into(
+            self.buffer, (w % self.capacity) * self.RECORD.size,
+            tid, desc.index, STATE_CODES[state], time.time())
+        self.written = w + 1
+
+    def read_raw(self, cursor):
+        """
+        :param cursor: number of records consumed by the reader so far
+        :return: packed records, number of records, new cursor, number of
+                 records lost because they were overwritten before being read
+        """
+        end = self.written
+        # the slot of the next record may be being written already, so at
+        # most capacity - 1 records can be read back
+        begin = max(cursor, end + 1 - self.capacity)
+        if begin == end:
+            return b"", 0, end, begin - cursor
+        size = self.RECORD.size
+        start = (begin % self.capacity) * size
+        stop = (end % self.capacity) * size
+        if start < stop:
+            data = bytes(self.buffer[start:stop])
+        else:
+            data = bytes(self.buffer[start:]) + bytes(self.buffer[:stop])
+        # drop what the writer overwrote meanwhile, counting the slot it
+        # may be packing before bumping written
+        overwritten = self.written + 1 - self.capacity - begin
+        if overwritten > 0:
+            data = data[overwritten * size:]
+            begin += overwritten
+        return data, end - begin, end, begin - cursor
+
+    def read(self, cursor):
+        """
+        :return: [(debug_info, state, timestamp)], new cursor, number of
+                 records lost because they were overwritten before being read
+        """
+        data, _, end, lost = self.read_raw(cursor)
+        get_location = self.trees.get_location
+        ret = [(get_location(tid, index), STATES[sc], ts)
+               for tid, index, sc, ts in self.RECORD.iter_unpack(data)]
+        return ret, end, lost
+
 
 class AgentDebugInfo(object):
     STATE_RUNNING = "state_running"
@@ -11,115 +117,395 @@ class AgentDebugInfo(object):
         self.stub = stub
         self.breakpoints = set()
         self.tracked = False
-        self.history = []
+        self.local = False  # tracked through DebugStub.track_agent
+        self.filters = []  # TraceFilter (None for all) of each subscription
+        self.accepted = {}  # node desc -> states in which it is recorded
+        self.trace = TraceBuffer()
+        self.cursor = 0  # read position of get_agent_track
+        self.lost = 0  # records overwritten before being read
         self.stepping = False
         self.state = self.STATE_RUNNING
         self.condition = threading.Condition(stub.lock)
 
     def wait_for_continue(self):
-        self.state = self.STATE_BREAKPOINT
         self.condition.acquire()
+        self.state = self.STATE_BREAKPOINT
         self.condition.wait()
+        self.state = self.STATE_RUNNING
+        self.condition.release()
 
     def check_debug(self, node):
         if not self.tracked:
             return
-        self.stub.lock.acquire()
-        agent = node.agent
-        # collect running history info
-        state = node.get_location_info()
-        self.history.append(state)
-        should_wait = False
+        # collect running history info, no lock taken
+        desc = node.desc
+        states = self.accepted.get(desc)
+        if states is None:
+            states = self.accept(desc)
+        if node.state in states:
+            self.trace.append(desc, node.state)
         # check breakpoints
-        if state in self.breakpoints or self.stepping:
-            should_wait = True
-        if should_wait:
+        if self.stepping or (self.breakpoints and
+                             node.get_location_info() in self.breakpoints):
             self.wait_for_continue()
+
+    def accept(self, desc):
+        """
+        states recorded for desc: the union of what every subscription wants
+        """
+        filters = self.filters
+        if self.local or None in filters:
+            states = protocol.ALL_STATES
         else:
-            self.stub.lock.release()
+            states = frozenset()
+            for f in filters:
+                states = states | f.states_for(desc)
+        self.accepted[desc] = states
+        return states
+
+    def add_filter(self, trace_filter):
+        self.filters = self.filters + [trace_filter]
+        self.update_tracked()
+
+    def remove_filter(self, trace_filter):
+        filters = list(self.filters)
+        filters.remove(trace_filter)
+        self.filters = filters
+        self.update_tracked()
+
+    def update_tracked(self):
+        # the agent thread may be reading them, replace instead of mutating
+        self.accepted = {}
+        self.tracked = self.local or len(self.filters) > 0
+
+    def take_history(self):
+        records, self.cursor, lost = self.trace.read(self.cursor)
+        self.lost += lost
+        return records
 
 
 class DebugStub(object):
-    def __init__(self, port=8000):
+    """
+    makes agents observable by debugger clients connected to port, see
+    debug_protocol for the wire format. all networking is done by a single
+    background thread started by run, port 0 binds a free port (self.port).
+    only local clients can connect unless addr says otherwise
+    """
+    def __init__(self, port=8000, addr="127.0.0.1"):
         self.lock = threading.Lock()
         self.agents = {}
-        self.comm = DebugStubComm(self, port)
+        self.generation = 0  # bumped when agents are added
+        self.server = DebugServer(self, addr, port)
+        self.port = self.server.port
         self.worker_thread = threading.Thread(
             name="AIDebugNetWorkerThread",
-            target=self.comm.start_service)
+            target=self.server.serve)
+        self.worker_thread.daemon = True
 
     def run(self):
         self.worker_thread.start()
 
     def stop(self):
-        self.comm.server.shutdown()
+        self.server.running = False
+        if self.worker_thread.is_alive():
+            self.worker_thread.join()
+        self.server.close()
 
     def add_agent(self, agent):
         self.lock.acquire()
         self.agents[agent.debug_id] = o = AgentDebugInfo(agent, self)
-        agent.debugger = o
+        agent.attach_debugger(o)
+        self.generation += 1
         self.lock.release()
 
     def remove_agent(self, agent):
         self.lock.acquire()
-        agent.debugger = None
-        del self.agents[agent]
+        agent.detach_debugger()
+        del self.agents[agent.debug_id]
         self.lock.release()
 
-
-class DebugStubComm(object):
-
-    def __init__(self, stub, port):
-        self.stub = stub
-        addr = "0.0.0.0"
-        self.server = SimpleXMLRPCServer((addr, port))
-        self.server.register_function(self.handshake)
-        self.server.register_function(self.get_agent_list)
-        self.server.register_function(self.track_agent)
-        self.server.register_function(self.get_agent_track)
-
-
-    def start_service(self):
-        self.server.serve_forever()
+    def get_agent_info(self, agent_id):
+        self.lock.acquire()
+        info = self.agents.get(agent_id)
+        self.lock.release()
+        return info
 
     ###########################################################################
-    # client side api
+    # in process api
     ###########################################################################
     def get_agent_list(self):
-        self.stub.lock.acquire()
-        l = [i for i in self.stub.agents]
-        self.stub.lock.release()
+        self.lock.acquire()
+        l = [i for i in self.agents]
+        self.lock.release()
         return l
 
-    def handshake(self):
-        return True
-
     def track_agent(self, agent_id, on_off):
-        self.stub.lock.acquire()
-        if agent_id not in self.stub.agents:
-            self.stub.lock.release()
+        info = self.get_agent_info(agent_id)
+        if info is None:
             return False
-        agent = self.stub.agents[agent_id]
-        agent.tracked = on_off
-        self.stub.lock.release()
+        info.local = on_off
+        info.update_tracked()
         return True
 
     def get_agent_track(self, agent_id):
-        self.stub.lock.acquire()
-        if agent_id not in self.stub.agents:
-            self.stub.lock.release()
+        info = self.get_agent_info(agent_id)
+        if info is None:
             return False
-        agent = self.stub.agents[agent_id]
-        ret = agent.history
-        agent.history = []
-        self.stub.lock.release()
-        return ret
+        return [(location, state) for location, state, _ in info.take_history()]
+
+
+class DebugServer(object):
+    """
+    pushes the trace of subscribed agents to the connected clients, every
+    FLUSH_INTERVAL at most one trace frame per subscribed agent is sent
+    """
+    FLUSH_INTERVAL = 0.05
+    MAX_BACKLOG = 1 << 20  # stop reading traces for clients this far behind
+
+    def __init__(self, stub, addr, port):
+        self.stub = stub
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((addr, port))
+        self.sock.listen(8)
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        self.connections = []
+        self.running = False
+
+    def serve(self):
+        self.running = True
+        while self.running:
+            for key, events in self.selector.select(self.FLUSH_INTERVAL):
+                if key.fileobj is self.sock:
+                    self.accept()
+                    continue
+                conn = key.data
+                if events & selectors.EVENT_READ:
+                    conn.receive()
+                if events & selectors.EVENT_WRITE and not conn.closed:
+                    conn.flush()
+            for conn in self.connections:
+                conn.push_traces()
+                conn.flush()
+            self.connections = [i for i in self.connections if not i.closed]
+
+    def accept(self):
+        try:
+            sock, _ = self.sock.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = DebugConnection(self, sock)
+        self.selector.register(sock, selectors.EVENT_READ, conn)
+        self.connections.append(conn)
+
+    def close(self):
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+        self.selector.close()
+        self.sock.close()
+
+
+class DebugConnection(object):
+    """
+    server side state of a client: subscriptions, what it has been told
+    about and the bytes not sent yet
+    """
+    def __init__(self, server, sock):
+        self.server = server
+        self.stub = server.stub
+        self.sock = sock
+        self.reader = protocol.FrameReader()
+        self.out = bytearray()
+        self.writing = False
+        self.closed = False
+        self.subscriptions = {}  # agent id -> Subscription
+        self.wildcard = False  # subscribed to every agent, even future ones
+        self.wildcard_filter = None
+        self.agents_seen = -1  # stub.generation when agents were last matched
+        self.next_agent_no = 0
+        self.trees_sent = 0
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for agent_id in list(self.subscriptions):
+            self.unsubscribe(agent_id)
+        self.server.selector.unregister(self.sock)
+        self.sock.close()
+
+    def receive(self):
+        try:
+            data = self.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.close()
+            return
+        for msg_type, body in self.reader.feed(data):
+            try:
+                self.handle(msg_type, protocol.unpack_message(body))
+            except Exception:
+                # a broken client must not take the server down
+                logger.exception("bad debug message %s, closing connection",
+                                 msg_type)
+                self.close()
+                return
+
+    def handle(self, msg_type, args):
+        if msg_type == protocol.MSG_HELLO:
+            self.send(protocol.MSG_WELCOME, protocol.VERSION)
+        elif msg_type == protocol.MSG_LIST:
+            self.send(protocol.MSG_AGENTS, self.stub.get_agent_list())
+        elif msg_type == protocol.MSG_SUBSCRIBE:
+            if len(args) != 3:
+                raise ValueError("subscribe takes 3 arguments: %r" % (args,))
+            agent_id, on_off, spec = args
+            if not (agent_id is None or isinstance(agent_id, (str, int))) or \
+                    not isinstance(on_off, bool):
+                raise ValueError("bad subscribe arguments: %r" % (args,))
+            trace_filter = protocol.TraceFilter.from_spec(spec)
+            if agent_id is None:
+                ok = self.subscribe_all(on_off, trace_filter)
+            elif on_off:
+                ok = self.subscribe(agent_id, trace_filter)
+            else:
+                ok = self.unsubscribe(agent_id)
+            self.send(protocol.MSG_SUBSCRIBED, agent_id, ok)
+        else:
+            logger.warning("unknown debug message %s", msg_type)
+
+    def send(self, msg_type, *args):
+        self.out += protocol.pack_message(msg_type, *args)
+
+    def subscribe(self, agent_id, trace_filter, by_wildcard=False):
+        info = self.stub.get_agent_info(agent_id)
+        if info is None:
+            return False
+        sub = self.subscriptions.get(agent_id)
+        if sub is None:
+            sub = Subscription(self.next_agent_no, info.trace.written)
+            self.next_agent_no += 1
+            self.send(protocol.MSG_AGENT, sub.agent_no, agent_id)
+            self.subscriptions[agent_id] = sub
+        else:
+            info.remove_filter(sub.filter)
+        sub.filter = trace_filter
+        sub.by_wildcard = by_wildcard
+        sub.matches = {}
+        info.add_filter(trace_filter)
+        return True
+
+    def unsubscribe(self, agent_id):
+        sub = self.subscriptions.pop(agent_id, None)
+        if sub is None:
+            return False
+        info = self.stub.get_agent_info(agent_id)
+        if info is not None:
+            info.remove_filter(sub.filter)
+        return True
+
+    def subscribe_all(self, on_off, trace_filter):
+        self.wildcard = on_off
+        self.wildcard_filter = trace_filter
+        for agent_id, sub in list(self.subscriptions.items()):
+            if sub.by_wildcard:
+                self.unsubscribe(agent_id)
+        self.agents_seen = -1
+        return True
+
+    def match_agents(self):
+        # pick up the agents added since last time
+        generation = self.stub.generation
+        if generation == self.agents_seen:
+            return
+        self.agents_seen = generation
+        for agent_id in self.stub.get_agent_list():
+            if agent_id not in self.subscriptions:
+                self.subscribe(agent_id, self.wildcard_filter, True)
+
+    def push_traces(self):
+        if self.closed or len(self.out) > self.server.MAX_BACKLOG:
+            # records of a slow client are overwritten and reported as lost
+            return
+        if self.wildcard:
+            self.match_agents()
+        for agent_id, sub in list(self.subscriptions.items()):
+            info = self.stub.get_agent_info(agent_id)
+            if info is None:
+                del self.subscriptions[agent_id]  # agent removed
+                continue
+            data, count, sub.cursor, lost = info.trace.read_raw(sub.cursor)
+            if count == 0 and lost == 0:
+                continue
+            tree_table = info.trace.trees
+            if sub.filter is not None and (info.local or len(info.filters) > 1):
+                # the agent records what any subscription (and the local
+                # tracking, every state) wants
+                data, count = sub.select(data, tree_table)
+                if count == 0 and lost == 0:
+                    continue
+            while self.trees_sent < len(tree_table.trees):
+                tree = tree_table.trees[self.trees_sent]
+                self.send(protocol.MSG_TREE, self.trees_sent, tree.name,
+                          [i.debug_info for i in tree.nodes])
+                self.trees_sent += 1
+            self.out += protocol.pack_trace(sub.agent_no, lost, count, data)
+
+    def flush(self):
+        if self.closed:
+            return
+        if self.out:
+            try:
+                sent = self.sock.send(self.out)
+            except BlockingIOError:
+                sent = 0
+            except OSError:
+                self.close()
+                return
+            del self.out[:sent]
+        writing = len(self.out) > 0
+        if writing != self.writing:
+            self.writing = writing
+            events = selectors.EVENT_READ
+            if writing:
+                events |= selectors.EVENT_WRITE
+            self.server.selector.modify(self.sock, events, self)
 
-    def set_breakpoint(self, agent_id, location_info):
-        pass
 
-    def remove_breakpoint(self, agent_id, location_info):
-        pass
+class Subscription(object):
+    """
+    an agent a connection is subscribed to
+    """
+    def __init__(self, agent_no, cursor):
+        self.agent_no = agent_no
+        self.cursor = cursor
+        self.filter = None
+        self.by_wildcard = False
+        self.matches = {}  # (tree id, node index) -> state codes shipped
 
-    def continue_agent(self, agent_id):
-        pass
+    def select(self, data, tree_table):
+        """
+        :return: the packed records of data matching the filter, their count
+        """
+        record = protocol.RECORD
+        matches = self.matches
+        out = []
+        for i in range(0, len(data), record.size):
+            tid, index, sc, _ = record.unpack_from(data, i)
+            codes = matches.get((tid, index))
+            if codes is None:
+                desc = tree_table.trees[tid].nodes[index]
+                codes = matches[(tid, index)] = frozenset(
+                    STATE_CODES[st] for st in self.filter.states_for(desc))
+            if sc in codes:
+                out.append(data[i:i + record.size])
+        return b"".join(out), len(out)
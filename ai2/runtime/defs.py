@@ -14,6 +14,28 @@ PAR_PROP = "PAR_PROP"  # property parameter
 # types
 StateDesc = namedtuple("StateDesc", ("enter_actions", "leave_actions", "debug_info"))
 
+
+class FsmDesc(object):
+    """
+    a loaded state machine, transitions[state_index] maps an event name to
+    the index of the state to transfer to
+    """
+    __slots__ = (
+        "name", "info", "states", "initial_state_index",
+        "events", "graph", "transitions")
+
+    def __init__(self, name, info, states, initial_state_index, events, graph):
+        self.name = name
+        self.info = info
+        self.states = tuple(StateDesc(*i) for i in states)
+        self.initial_state_index = initial_state_index
+        self.events = events
+        self.graph = graph
+        transitions = tuple({} for _ in self.states)
+        for (state_index, event_index), dst in graph.items():
+            transitions[state_index][events[event_index]] = dst
+        self.transitions = transitions
+
 # btree def
 # enumerates
 NT_ROOT = "NT_ROOT"
@@ -35,4 +57,46 @@ NT_COND = "NT_COND"
 NT_WAIT = "NT_WAIT"
 
 # types
-NodeDesc = namedtuple("NodeDesc", ("category", "data", "children", "debug_info"))
+class NodeDesc(object):
+    """
+    read only node descriptor, compiled once per loaded tree by loader from
+    the exported (category, data, children, debug_info) tuple
+    """
+    __slots__ = (
+        "category", "data", "children", "debug_info",
+        "node_class",  # runtime class resolved from category
+        "index",  # position in TreeDesc.nodes
+        "enter_action", "leave_action",  # (method_name, args) for NT_ACT
+        "jit",  # agent -> bool, set on the root of a compiled subtree
+        "expr",  # expr.Expression for NT_COMP/NT_COND
+        "alias",  # sampling.AliasTable for NT_PSEL
+        "tree",  # TreeDesc the node belongs to
+    )
+
+    def __init__(self, category, data, children, debug_info, **extra):
+        setter = object.__setattr__
+        setter(self, "category", category)
+        setter(self, "data", data)
+        setter(self, "children", children)
+        setter(self, "debug_info", debug_info)
+        for k in self.__slots__[4:]:
+            setter(self, k, extra.pop(k, None))
+        assert not extra, extra
+
+    def __setattr__(self, key, value):
+        raise AttributeError("node descriptor is read only")
+
+    def __repr__(self):
+        return "NodeDesc(%s, %r)" % (self.category, self.debug_info)
+
+
+class TreeDesc(object):
+    """
+    a loaded behavior tree: the compiled root and all its nodes
+    """
+    __slots__ = ("name", "root", "nodes")
+
+    def __init__(self, name, root, nodes):
+        self.name = name
+        self.root = root
+        self.nodes = nodes
@@ -0,0 +1,100 @@
+# -*- encoding: utf-8 -*-
+"""
+action dispatch tables linked once per (agent class, tree)
+
+linking a tree resolves the enter/leave action of every NT_ACT node to
+the function of the agent class and specializes its argument fetchers
+(see expr), an action the class does not implement is reported then as
+LinkError instead of at its first call. tables are shared by every agent
+of a class. agents whose agent_action is overridden (or wrapped by a
+profiler/recorder), or which set one of the actions of a tree on the
+instance, go through agent_action instead, see Agent.relink.
+"""
+import ai2.runtime.defs as defs
+import ai2.runtime.expr as expr
+
+# agent class -> {TreeDesc: table}, a table is [(enter call, leave call)
+# or None] by node index, a call is call(agent, node) or None for no action
+_class_links = {}
+# TreeDesc -> frozenset of the action names of its NT_ACT nodes
+_tree_actions = {}
+
+
+class LinkError(AttributeError):
+    pass
+
+
+def class_links(clz):
+    links = _class_links.get(clz)
+    if links is None:
+        links = _class_links[clz] = {}
+    return links
+
+
+def link_tree(clz, tree):
+    """
+    :return: dispatch table of tree for agent class clz
+    :raise LinkError: if clz misses actions of tree
+    """
+    links = class_links(clz)
+    table = links.get(tree)
+    if table is not None:
+        return table
+    table = [None] * len(tree.nodes)
+    missing = []
+    for desc in tree.nodes:
+        if desc.category != defs.NT_ACT:
+            continue
+        calls = []
+        for name, args in (desc.enter_action, desc.leave_action):
+            if name == "":
+                calls.append(None)
+            elif not callable(getattr(clz, name, None)):
+                missing.append("%s at %r" % (name, desc.debug_info))
+                calls.append(None)
+            else:
+                calls.append(make_call(getattr(clz, name), args))
+        table[desc.index] = tuple(calls)
+    if missing:
+        raise LinkError("%s misses actions of %s: %s" % (
+            clz.__name__, tree.name, ", ".join(missing)))
+    links[tree] = table
+    return table
+
+
+def action_names(tree):
+    names = _tree_actions.get(tree)
+    if names is None:
+        names = set()
+        for desc in tree.nodes:
+            if desc.category == defs.NT_ACT:
+                names.add(desc.enter_action[0])
+                names.add(desc.leave_action[0])
+        names.discard("")
+        names = _tree_actions[tree] = frozenset(names)
+    return names
+
+
+def make_call(f, args):
+    """
+    :param f: action function of the agent class, f(agent, node, *args)
+    :param args: exported argument list [(type, name), ...]
+    :return: call(agent, node)
+    """
+    fetchers = tuple(
+        (expr._fetchers[a[0]], expr._resolve(a[0], a[1])) for a in args)
+    if not fetchers:
+        return f
+    if len(fetchers) == 1:
+        (fetch, key), = fetchers
+        if fetch is expr._fetch_const:
+            def call(agent, node):
+                return f(agent, node, key)
+        else:
+            def call(agent, node):
+                return f(agent, node, fetch(agent, key))
+        return call
+
+    def call(agent, node):
+        return f(agent, node, *[fetch(agent, key) for fetch, key in fetchers])
+    return call
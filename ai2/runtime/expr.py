@@ -0,0 +1,241 @@
+# -*- encoding: utf-8 -*-
+"""
+Condition/Compute expressions bound to their parameters
+
+exported trees hold the code objects of their expressions. when the
+source of a code object is known (see register_sources) the expression is
+compiled again as a function taking its inputs as positional arguments
+and returning its outputs, otherwise it is run with exec in a fresh
+locals dict
+"""
+import ast
+import inspect
+import builtins
+
+import ai2.runtime.defs as defs
+import ai2.runtime.blackboard as blackboard
+
+
+_MISSING = blackboard.MISSING
+INDENT = "    "
+
+
+def _fetch_const(agent, value):
+    return value
+
+
+def _fetch_bb(agent, slot):
+    # Blackboard.get_slot inlined
+    try:
+        v = agent.blackboard.values[slot]
+    except IndexError:
+        v = _MISSING
+    if v is _MISSING:
+        _missing(slot)
+    return v
+
+
+def _missing(slot):
+    raise KeyError(blackboard.key_of(slot))
+
+
+def _store_bb(agent, slot, value):
+    agent.blackboard.set_slot(slot, value)
+
+
+def _fetch_prop(agent, name):
+    return agent.get_property(name)
+
+
+_fetchers = {
+    defs.PAR_CONST: _fetch_const,
+    defs.PAR_BB: _fetch_bb,
+    defs.PAR_PROP: _fetch_prop,
+}
+
+_storers = {
+    defs.PAR_BB: _store_bb,
+    defs.PAR_PROP: setattr,
+}
+
+# code object -> globals dict used to run it
+_globals = {}
+# (code, inputs, outputs) -> Expression
+_bindings = {}
+# code object -> (source, mode) it was compiled from
+_sources = {}
+
+
+def _get_globals(code):
+    g = _globals.get(code)
+    if g is None:
+        # providing __builtins__ up front stops eval/exec from inserting it
+        g = _globals[code] = {"__builtins__": builtins}
+    return g
+
+
+class Expression(object):
+    """
+    the code object of a Condition/Compute node bound to its parameters:
+    every parameter gets a fetcher (or storer) specialized for its type.
+    an expression is shared by every agent and tree binding it.
+
+    run(agent) fetches the inputs, runs the code, stores the outputs and
+    returns the value of an eval expression (see Agent.compute/condition)
+    """
+    __slots__ = ("code", "globals", "inputs", "outputs", "func", "run")
+
+    def __init__(self, code, inputs, outputs):
+        self.code = code
+        self.globals = _get_globals(code)
+        # (expr_name, fetch(agent, key), key)
+        self.inputs = tuple(
+            (expr_name, _fetchers[tp], _resolve(tp, var_name))
+            for tp, var_name, expr_name in inputs)
+        # (expr_name, store(agent, key, value), key)
+        self.outputs = tuple(
+            (expr_name, _storers[tp], _resolve(tp, var_name))
+            for tp, var_name, expr_name in outputs)
+        # the code as a function of the inputs, None if its source is unknown
+        self.func = _make_function(self)
+        if self.func is None:
+            self.run = self._exec
+        else:
+            self.run = _make_runner(self)
+
+    def _exec(self, agent):
+        # a fresh dict per call: locals must not leak between agents, and a
+        # watcher triggered by an output may run the same expression again
+        local = {}
+        for name, fetch, key in self.inputs:
+            local[name] = fetch(agent, key)
+        # eval runs exec mode code as well, returning None
+        ret = eval(self.code, self.globals, local)
+        for name, store, key in self.outputs:
+            store(agent, key, local[name])
+        return ret
+
+
+def _make_function(e):
+    known = _sources.get(e.code)
+    if known is None:
+        return None
+    source, mode = known
+    params = [name for name, _, _ in e.inputs]
+    if len(set(params)) != len(params):
+        return None
+    body = ast.parse(source, e.code.co_filename, mode).body
+    if mode == "eval":
+        body = [ast.Return(body)]
+    else:
+        outputs = [ast.Name(name, ast.Load()) for name, _, _ in e.outputs]
+        if not outputs:
+            ret = ast.Constant(None)
+        elif len(outputs) == 1:
+            ret = outputs[0]
+        else:
+            ret = ast.Tuple(outputs, ast.Load())
+        body = body + [ast.Return(ret)]
+    module = ast.parse("def _expr(%s): pass" % ", ".join(params))
+    module.body[0].body = body
+    ast.fix_missing_locations(module)
+    namespace = {"__builtins__": builtins}
+    exec(compile(module, e.code.co_filename, "exec"), namespace)
+    return namespace["_expr"]
+
+
+def _make_runner(e):
+    """
+    generate run(agent) calling e.func with the fetched inputs as positional
+    arguments and storing what it returns
+    """
+    namespace = {"func": e.func, "MISSING": _MISSING, "missing": _missing}
+    lines = ["def run(agent):"]
+    args = []
+    for i, (_, fetch, key) in enumerate(e.inputs):
+        namespace["k%d" % i] = key
+        if fetch is _fetch_const:
+            args.append("k%d" % i)
+        elif fetch is _fetch_bb:
+            # _fetch_bb inlined
+            lines += [
+                INDENT + "try:",
+                INDENT * 2 + "a%d = agent.blackboard.values[k%d]" % (i, i),
+                INDENT + "except IndexError:",
+                INDENT * 2 + "a%d = MISSING" % i,
+                INDENT + "if a%d is MISSING:" % i,
+                INDENT * 2 + "missing(k%d)" % i]
+            args.append("a%d" % i)
+        else:
+            namespace["f%d" % i] = fetch
+            args.append("f%d(agent, k%d)" % (i, i))
+    call = "func(%s)" % ", ".join(args)
+    if not e.outputs:
+        lines.append(INDENT + "return " + call)
+    else:
+        lines.append(INDENT + "r = " + call)
+        for i, (_, store, key) in enumerate(e.outputs):
+            namespace["s%d" % i] = store
+            namespace["o%d" % i] = key
+            value = "r" if len(e.outputs) == 1 else "r[%d]" % i
+            lines.append(INDENT + "s%d(agent, o%d, %s)" % (i, i, value))
+    exec(compile("\n".join(lines) + "\n", "<expr>", "exec"), namespace)
+    return namespace["run"]
+
+
+def register_sources(sources):
+    """
+    remember what code objects were compiled from, so that expressions
+    bound from now on run as functions
+    :param sources: [(source, filename, mode)]
+    """
+    for source, filename, mode in sources:
+        try:
+            code = compile(source, filename, mode)
+        except SyntaxError:
+            continue
+        _sources.setdefault(code, (source, mode))
+
+
+def module_sources(module):
+    """
+    :return: [(source, filename, mode)] of the compile(source, filename,
+             mode) calls with literal arguments in the source of module
+             (an exported tree), empty if its source is not available
+    """
+    sources = getattr(module, "expr_sources", None)  # kept by bundles
+    if sources is not None:
+        return sources
+    try:
+        text = inspect.getsource(module)
+    except (OSError, TypeError):
+        return []
+    sources = []
+    for node in ast.walk(ast.parse(text)):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+                and node.func.id == "compile" and len(node.args) == 3 \
+                and not node.keywords \
+                and all(isinstance(i, ast.Constant) and isinstance(i.value, str)
+                        for i in node.args):
+            sources.append(tuple(i.value for i in node.args))
+    return sources
+
+
+def _resolve(tp, var_name):
+    if tp == defs.PAR_BB:
+        return blackboard.slot_of(var_name)
+    return var_name
+
+
+def bind(code, inputs, outputs=()):
+    """
+    get the (shared) Expression of a code object and its exported
+    parameter lists [(type, var_name, expr_name), ...]
+    """
+    inputs = tuple(tuple(i) for i in inputs)
+    outputs = tuple(tuple(i) for i in outputs)
+    key = code, inputs, outputs
+    e = _bindings.get(key)
+    if e is None:
+        e = _bindings[key] = Expression(code, inputs, outputs)
+    return e
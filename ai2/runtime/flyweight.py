@@ -0,0 +1,454 @@
+# -*- encoding: utf-8 -*-
+"""
+flyweight tree instances
+
+    agent.flyweight = True  # before the agent pushes a tree
+
+a tree pushed by such an agent runs as one Instance node instead of a
+graph of Node objects. the shape of the tree is laid out once (Layout)
+and shared by every instance, an instance keeps a state code per position
+(states) and a scalar register per position (regs: cur_cidx of
+sequences/selects, the step of if/until, the child picked by
+probabilities), plus the shuffled orders of running random sequences.
+
+composite nodes and NT_COMP/NT_COND (and jit compiled subtrees) run
+inside the instance. NT_ACT and NT_WAIT nodes are pushed as real nodes
+while they run, user actions get a Node and Node.finish works as usual,
+NT_CALL pushes the called tree as another instance. a position made
+ready puts the instance on agent.ready_queue once and a visit of the
+instance steps the first ready position, so positions and pushed nodes
+are stepped in the order the nodes of a node graph would be visited.
+pushed nodes interrupted before they are entered are dropped without
+running their leave action. trees of agents with a debugger or a
+profiler attached are not flyweight (see NODE_HOOKS), so these still see
+every node.
+"""
+import sys
+import array
+
+import ai2.runtime.defs as defs
+import ai2.runtime.nodes as nodes
+import ai2.runtime.loader as loader
+
+# state codes
+IDLE = 0  # not running or result taken by the parent
+READY = 1  # to be entered
+AWAKEN = 2  # a child finished
+WAITING = 3  # waiting for children or for the pushed node
+TRUE = 4  # finished, result not taken yet
+FALSE = 5
+
+# pushed as real nodes while running, NT_CALL pushes the called tree
+PUSHED = (defs.NT_ACT, defs.NT_WAIT, defs.NT_CALL)
+# node mixins reporting every node, agents using them push node graphs
+NODE_HOOKS = (nodes.DebugHooks, nodes.ProfileHooks)
+
+
+class Layout(object):
+    """
+    positions of a tree(defs.TreeDesc) in pre-order, a node descriptor used
+    at two places of the tree (a reused exported tuple) takes two positions
+    """
+    __slots__ = ("tree", "descs", "parents", "children", "enters", "revisits")
+
+    def __init__(self, tree):
+        self.tree = tree
+        descs, parents, children = [], [], []
+
+        def add(desc, parent):
+            p = len(descs)
+            descs.append(desc)
+            parents.append(parent)
+            children.append(())
+            if desc.jit is None and desc.category not in PUSHED:
+                children[p] = tuple(add(c, p) for c in desc.children)
+            return p
+        add(tree.root, -1)
+        self.descs = tuple(descs)
+        self.parents = array.array("i", parents)
+        self.children = tuple(children)
+        enters, revisits = [], []
+        for desc in descs:
+            if desc.jit is not None:
+                calls = _enter_jit, None
+            else:
+                calls = _calls[desc.category]
+            enters.append(calls[0])
+            revisits.append(calls[1])
+        self.enters = tuple(enters)
+        self.revisits = tuple(revisits)
+
+    def __len__(self):
+        return len(self.descs)
+
+
+# defs.TreeDesc -> Layout
+_layouts = {}
+
+
+def get_layout(tree):
+    layout = _layouts.get(tree)
+    if layout is None:
+        layout = _layouts[tree] = Layout(tree)
+    return layout
+
+
+class Instance(nodes.Node):
+    """
+    a running tree, index is the position of the NT_CALL node in the
+    calling instance for called trees
+    """
+    __slots__ = ("layout", "states", "regs", "orders", "queue")
+    multiple_children = True
+
+    def __init__(self, parent, index, node_desc, agent):
+        layout = get_layout(node_desc.tree)
+        assert layout.descs[0] is node_desc
+        n = len(layout)
+        if getattr(self, "layout", None) is layout:
+            # reused by the node pool
+            self.states[:] = bytes(n)
+        else:
+            self.layout = layout
+            self.states = bytearray(n)
+            self.regs = array.array("H", bytes(2 * n))
+        self.orders = None  # position -> child indexes left, of random sequences
+        self.queue = None  # positions to step, one agent.ready_queue entry each
+        super(Instance, self).__init__(parent, index, node_desc, agent)
+        if parent is None:
+            agent.btree = self
+
+    def footprint(self):
+        """
+        :return: bytes held by the instance between visits, pushed nodes aside
+        """
+        size = sys.getsizeof(self) + sys.getsizeof(self.states) + \
+            sys.getsizeof(self.regs) + sys.getsizeof(self.children)
+        if self.orders:
+            size += sys.getsizeof(self.orders)
+            size += sum(sys.getsizeof(i) for i in self.orders.values())
+        if self.queue:
+            size += sys.getsizeof(self.queue)
+        return size
+
+    def enter(self):
+        super(Instance, self).enter()
+        self.agent.link_tree(self.desc.tree)
+        self.state = self.AWAKEN
+        _enter_root(self, 0)
+        self._settle()
+
+    def revisit(self):
+        super(Instance, self).revisit()
+        # AWAKEN, not REVISITING: pushed nodes may finish while we step
+        self.state = self.AWAKEN
+        children = self.children
+        if children:
+            finished = [k for k, v in children.items() if v is not None]
+            for k in finished:
+                self._collect(k, children.pop(k))
+        queue = self.queue
+        if queue:
+            p = queue.pop(0)
+            s = self.states[p]
+            if s == READY:
+                self.layout.enters[p](self, p)
+            elif s == AWAKEN:
+                self.layout.revisits[p](self, p)
+            # else stale, like the entry of a node visited or interrupted already
+        self._settle()
+
+    def _collect(self, k, retval):
+        """
+        take the result of pushed node k, its agent.ready_queue entry was
+        added by k.backtrace
+        """
+        self.agent.node_pool.release(k)
+        p = k.index
+        if self.layout.descs[p].category == defs.NT_CALL:
+            # revisited like a Call node
+            self.states[p] = AWAKEN
+            self.regs[p] = retval
+            self._queue(p)
+        else:
+            self.done(p, retval, False)
+
+    def _settle(self):
+        states = self.states
+        s = states[0]
+        if s == TRUE or s == FALSE:
+            # a called tree returned
+            states[0] = IDLE
+            self.queue = None
+            self._quick_finish(s == TRUE)
+        elif self.queue:
+            pass  # stays AWAKEN, stepped again by its next entry
+        elif any(v is not None for v in self.children.values()):
+            # finished while we stepped
+            self.agent.ready_queue.append(self)
+        else:
+            self.queue = None
+            self.wait_for_child()
+
+    def _queue(self, p):
+        if self.queue is None:
+            self.queue = []
+        self.queue.append(p)
+
+    def start(self, p):
+        """
+        make child position p ready, called by its parent
+        """
+        states = self.states
+        layout = self.layout
+        states[layout.parents[p]] = WAITING
+        desc = layout.descs[p]
+        category = desc.category
+        if category == defs.NT_ACT or category == defs.NT_WAIT:
+            # pushed right away, as push_child does
+            states[p] = WAITING
+            self.agent.push_node(self, p, desc)
+            return
+        states[p] = READY
+        self._queue(p)
+        self.agent.ready_queue.append(self)
+        if category == defs.NT_RSEQ and desc.jit is None:
+            # shuffled when pushed, as RandomSequence does
+            order = list(range(0, len(desc.children)))
+            self.agent.rng.shuffle(order)
+            if self.orders is None:
+                self.orders = {}
+            self.orders[p] = order
+
+    def done(self, p, retval, enqueue=True):
+        """
+        :param enqueue: whether to add the agent.ready_queue entry of the
+                        parent, as backtrace does
+        """
+        assert retval is True or retval is False, retval
+        states = self.states
+        states[p] = TRUE if retval else FALSE
+        q = self.layout.parents[p]
+        if q < 0:
+            return
+        if states[q] == WAITING:
+            states[q] = AWAKEN
+        # added even if the parent is AWAKEN already, as backtrace does
+        self._queue(q)
+        if enqueue:
+            self.agent.ready_queue.append(self)
+
+    def take(self, p):
+        """
+        :return: result of finished child position p
+        """
+        s = self.states[p]
+        assert s == TRUE or s == FALSE, s
+        self.states[p] = IDLE
+        return s == TRUE
+
+    def stop(self, p):
+        """
+        interrupt the subtree at position p
+        """
+        states = self.states
+        s = states[p]
+        states[p] = IDLE
+        if s == IDLE or s == TRUE or s == FALSE:
+            return
+        if self.layout.descs[p].category in PUSHED:
+            children = self.children
+            for k in children:
+                if k.index == p:
+                    break
+            else:
+                return  # NT_CALL not stepped yet
+            del children[k]
+            if k.state == k.NEW:
+                # never entered, nothing to leave
+                self.agent.fronts.discard(k)
+                k.state = k.DEAD
+            elif k.state != k.DEAD:
+                k.interrupt()
+            self.agent.node_pool.release(k)
+            return
+        for c in self.layout.children[p]:
+            self.stop(c)
+        if self.orders:
+            self.orders.pop(p, None)
+
+
+def _enter_root(t, p):
+    t.start(t.layout.children[p][0])
+
+
+def _revisit_root(t, p):
+    c = t.layout.children[p][0]
+    retval = t.take(c)
+    if t.parent is None:
+        # real root never ends
+        t.start(c)
+    else:
+        t.done(p, retval)
+
+
+def _enter_call(t, p):
+    t.states[p] = WAITING
+    t.agent.push_node(t, p, loader.get_root_desc(t.layout.descs[p].data))
+
+
+def _revisit_call(t, p):
+    t.done(p, bool(t.regs[p]))
+
+
+def _enter_compute(t, p):
+    t.agent.compute(t.layout.descs[p].expr)
+    t.done(p, True)
+
+
+def _enter_condition(t, p):
+    r = t.agent.condition(t.layout.descs[p].expr)
+    assert r is True or r is False, r
+    t.done(p, r)
+
+
+def _enter_jit(t, p):
+    t.done(p, t.layout.descs[p].jit(t.agent))
+
+
+def _enter_first(t, p):
+    # sequence, select, until, not, always
+    t.regs[p] = 0
+    t.start(t.layout.children[p][0])
+
+
+def _revisit_sequence(t, p):
+    children = t.layout.children[p]
+    if not t.take(children[t.regs[p]]):
+        t.done(p, False)
+        return
+    i = t.regs[p] = t.regs[p] + 1
+    if i == len(children):
+        t.done(p, True)
+    else:
+        t.start(children[i])
+
+
+def _revisit_select(t, p):
+    children = t.layout.children[p]
+    if t.take(children[t.regs[p]]):
+        t.done(p, True)
+        return
+    i = t.regs[p] = t.regs[p] + 1
+    if i == len(children):
+        t.done(p, False)
+    else:
+        t.start(children[i])
+
+
+def _enter_random_sequence(t, p):
+    i = t.regs[p] = t.orders[p].pop(-1)
+    t.start(t.layout.children[p][i])
+
+
+def _revisit_random_sequence(t, p):
+    children = t.layout.children[p]
+    order = t.orders[p]
+    if not t.take(children[t.regs[p]]):
+        del t.orders[p]
+        t.done(p, False)
+        return
+    if len(order) == 0:
+        del t.orders[p]
+        t.done(p, True)
+        return
+    i = t.regs[p] = order.pop(-1)
+    t.start(children[i])
+
+
+def _enter_probability(t, p):
+    i = t.regs[p] = t.layout.descs[p].alias.pick(t.agent.rng.random())
+    t.start(t.layout.children[p][i])
+
+
+def _revisit_probability(t, p):
+    t.done(p, t.take(t.layout.children[p][t.regs[p]]))
+
+
+def _revisit_if_else(t, p):
+    children = t.layout.children[p]
+    i = t.regs[p]
+    if i == 0:
+        # condition returned
+        i = t.regs[p] = 1 if t.take(children[0]) else 2
+        t.start(children[i])
+    else:
+        t.done(p, t.take(children[i]))
+
+
+def _enter_parallel(t, p):
+    for c in t.layout.children[p]:
+        t.start(c)
+
+
+def _revisit_parallel(t, p):
+    states = t.states
+    retval = None
+    for c in t.layout.children[p]:
+        s = states[c]
+        if retval is None and (s == TRUE or s == FALSE):
+            retval = t.take(c)
+        else:
+            t.stop(c)
+    assert retval is not None
+    t.done(p, retval)
+
+
+def _revisit_until(t, p):
+    children = t.layout.children[p]
+    if t.regs[p] == 0:
+        # predicate returned
+        if t.take(children[0]):
+            t.done(p, True)
+        else:
+            t.regs[p] = 1
+            t.start(children[1])
+    else:
+        # the result of the child does not matter
+        t.take(children[1])
+        t.regs[p] = 0
+        t.start(children[0])
+
+
+def _revisit_not(t, p):
+    t.done(p, not t.take(t.layout.children[p][0]))
+
+
+def _revisit_always(t, p):
+    t.take(t.layout.children[p][0])
+    t.done(p, t.layout.descs[p].data)
+
+
+def _pushed(t, p):
+    # NT_ACT/NT_WAIT are pushed by start, their results are collected
+    assert False, t.layout.descs[p]
+
+
+# category -> (enter, revisit), each called with (instance, position)
+_calls = {
+    defs.NT_ROOT: (_enter_root, _revisit_root),
+    defs.NT_SEQ: (_enter_first, _revisit_sequence),
+    defs.NT_RSEQ: (_enter_random_sequence, _revisit_random_sequence),
+    defs.NT_SEL: (_enter_first, _revisit_select),
+    defs.NT_PSEL: (_enter_probability, _revisit_probability),
+    defs.NT_IF: (_enter_first, _revisit_if_else),
+    defs.NT_PARL: (_enter_parallel, _revisit_parallel),
+    defs.NT_UNTIL: (_enter_first, _revisit_until),
+    defs.NT_NOT: (_enter_first, _revisit_not),
+    defs.NT_ALWAYS: (_enter_first, _revisit_always),
+    defs.NT_CALL: (_enter_call, _revisit_call),
+    defs.NT_ACT: (_pushed, _pushed),
+    defs.NT_COMP: (_enter_compute, None),
+    defs.NT_COND: (_enter_condition, None),
+    defs.NT_WAIT: (_pushed, _pushed),
+}
@@ -28,15 +28,10 @@ class Fsm(object):
         :param event: event identifier
         :return: bool, int -> receivable, new state index
         """
-        try:
-            event_index = self.desc.events.index(event)
-            key = (self.current_state_index, event_index)
-            if key in self.desc.graph:
-                return True, self.desc.graph[key]
-            else:
-                return False, None
-        except ValueError:
+        dst = self.desc.transitions[self.current_state_index].get(event)
+        if dst is None:
             return False, None
+        return True, dst
 
     def pop_self(self):
         self._leave_state()
@@ -46,7 +41,7 @@ class Fsm(object):
 
     def _enter_state(self, state_index):
         self.current_state_index = state_index
-        nstate = defs.StateDesc(*self.desc.states[self.current_state_index])
+        nstate = self.desc.states[self.current_state_index]
         enter_actions = nstate.enter_actions  # enter state actions
         for a in enter_actions:
             self.agent.agent_action(self, a[0], a[1:])
@@ -64,12 +59,10 @@ class Fsm(object):
             """
 
     def _leave_state(self, state_index=None):
-        if self.agent.btree is not None:
-            self.agent.btree.interrupt()
-            self.agent.btree = None
+        self.agent.stop_btree()
         if state_index is None:
             state_index = self.current_state_index
-        cstate = defs.StateDesc(*self.desc.states[state_index])
+        cstate = self.desc.states[state_index]
         leave_actions = cstate.leave_actions
         for a in leave_actions:
             """
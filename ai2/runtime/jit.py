@@ -0,0 +1,104 @@
+# -*- encoding: utf-8 -*-
+import ai2.runtime.defs as defs
+
+# categories that can be compiled as long as all their children can
+SYNC_CATEGORIES = {
+    defs.NT_SEQ, defs.NT_SEL, defs.NT_NOT, defs.NT_ALWAYS,
+    defs.NT_IF, defs.NT_UNTIL, defs.NT_COMP, defs.NT_COND,
+}
+
+INDENT = "    "
+
+
+def is_sync(raw, memo):
+    """
+    whether an exported node always finishes during its own enter, i.e.
+    neither it nor its subtree can block
+    """
+    key = id(raw)
+    if key in memo:
+        return memo[key]
+    category, _, children, _ = raw
+    ret = category in SYNC_CATEGORIES
+    for c in children:
+        # evaluate all children so that the memo covers the whole subtree
+        ret = is_sync(c, memo) and ret
+    memo[key] = ret
+    return ret
+
+
+def compile_subtree(category, data, children):
+    """
+    generate a function agent -> bool running a synchronous subtree with the
+    same semantics as the interpreter (but without any Node object)
+    """
+    consts = {}
+    lines = ["def _jit(agent):"]
+    _emit(category, data, children, lines, 1, consts)
+    lines.append(INDENT + "return r")
+    src = "\n".join(lines) + "\n"
+    namespace = dict(consts)
+    exec(compile(src, "<jit>", "exec"), namespace)
+    func = namespace["_jit"]
+    func.jit_source = src
+    return func
+
+
+def _const(consts, value):
+    name = "k%d" % len(consts)
+    consts[name] = value
+    return name
+
+
+def _emit_desc(desc, lines, depth, consts):
+    if desc.expr is not None:
+        _emit_expr(desc.category, desc.expr, lines, depth, consts)
+        return
+    _emit(desc.category, desc.data, desc.children, lines, depth, consts)
+
+
+def _emit_expr(category, e, lines, depth, consts):
+    ind = INDENT * depth
+    if category == defs.NT_COMP:
+        lines.append(ind + "agent.compute(%s)" % _const(consts, e))
+        lines.append(ind + "r = True")
+    else:
+        lines.append(ind + "r = agent.condition(%s)" % _const(consts, e))
+        lines.append(ind + "assert(r is True or r is False)")
+
+
+def _emit(category, data, children, lines, depth, consts):
+    """
+    emit statements of a composite node leaving its result in local variable r
+    """
+    ind = INDENT * depth
+    if category == defs.NT_SEQ or category == defs.NT_SEL:
+        # a single pass loop so that a child result can break out early
+        stop = "if not r:" if category == defs.NT_SEQ else "if r:"
+        lines.append(ind + "while True:")
+        for c in children:
+            _emit_desc(c, lines, depth + 1, consts)
+            lines.append(ind + INDENT + stop)
+            lines.append(ind + INDENT * 2 + "break")
+        lines.append(ind + INDENT + "break")
+    elif category == defs.NT_NOT:
+        _emit_desc(children[0], lines, depth, consts)
+        lines.append(ind + "r = not r")
+    elif category == defs.NT_ALWAYS:
+        _emit_desc(children[0], lines, depth, consts)
+        lines.append(ind + "r = %s" % _const(consts, data))
+    elif category == defs.NT_IF:
+        _emit_desc(children[0], lines, depth, consts)
+        lines.append(ind + "if r:")
+        _emit_desc(children[1], lines, depth + 1, consts)
+        lines.append(ind + "else:")
+        _emit_desc(children[2], lines, depth + 1, consts)
+    elif category == defs.NT_UNTIL:
+        lines.append(ind + "while True:")
+        _emit_desc(children[0], lines, depth + 1, consts)
+        lines.append(ind + INDENT + "if r:")
+        lines.append(ind + INDENT * 2 + "break")
+        _emit_desc(children[1], lines, depth + 1, consts)
+        lines.append(ind + "r = True")
+    else:
+        assert False, category
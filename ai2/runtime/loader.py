@@ -2,9 +2,16 @@
 import importlib
 
 import ai2.runtime.defs as defs
+import ai2.runtime.nodes as nodes
+import ai2.runtime.jit as jit
+import ai2.runtime.expr as expr
+import ai2.runtime.sampling as sampling
+import ai2.runtime.bundle as bundle
 
 _loaded = {}
 prefix = ""
+use_jit = False  # compile synchronous subtrees of trees loaded from now on
+_bundles = []  # bundle.Bundle searched in order before importing modules
 
 def load_fsm(name, force=False):
     return _load_module(name, force, process_loaded_fsm)
@@ -14,20 +21,104 @@ def load_btree(name, force=False):
 
 def get_root_desc(name):
     tree = load_btree(name)
-    return defs.NodeDesc(*tree.root)
+    return tree.root
+
+def open_bundle(path):
+    """
+    load trees and fsms from the bundle at path (see ai2.runtime.bundle)
+    from now on, modules it does not have are still imported
+    """
+    for b in _bundles:
+        if b.path == path:
+            return b
+    b = bundle.Bundle(path)
+    _bundles.append(b)
+    return b
+
+def close_bundles():
+    for b in _bundles:
+        b.close()
+    del _bundles[:]
 
 def _load_module(name, force, post_action):
     is_new = True
     full_name = prefix + name
     if full_name in _loaded and not force:
         return _loaded[full_name]
-    m = importlib.import_module(full_name)
+    m = None
+    for b in _bundles:
+        m = b.get_module(full_name)
+        if m is not None:
+            break
+    else:
+        m = importlib.import_module(full_name)
     processed = post_action(m)
     _loaded[full_name] = processed
-    return m
+    return processed
 
 def process_loaded_fsm(fsm_module):
-    return fsm_module
+    return defs.FsmDesc(
+        fsm_module.__name__,
+        fsm_module.info,
+        fsm_module.states,
+        fsm_module.initial_state_index,
+        fsm_module.events,
+        fsm_module.graph)
 
 def process_loaded_btree(tree_module):
-    return tree_module
\ No newline at end of file
+    # expressions of the tree then run as functions, see expr
+    expr.register_sources(expr.module_sources(tree_module))
+    node_list = []
+    sync_memo = {} if use_jit else None
+    tree = defs.TreeDesc(tree_module.__name__, None, ())
+    tree.root = compile_node_desc(tree_module.root, node_list, {}, sync_memo, tree=tree)
+    tree.nodes = tuple(node_list)
+    return tree
+
+
+def compile_node_desc(raw, node_list, memo, sync_memo=None, in_sync=False, tree=None):
+    """
+    convert an exported node tuple and its subtree into defs.NodeDesc,
+    the result is shared by every node instance created from it
+    :param sync_memo: memo of jit.is_sync, None to disable jit
+    :param in_sync: whether the parent is compiled by jit already
+    :param tree: defs.TreeDesc the nodes belong to
+    """
+    key = id(raw)
+    if key in memo:
+        return memo[key]
+    category, data, children, debug_info = raw
+    sync = False
+    if sync_memo is not None:
+        sync = jit.is_sync(raw, sync_memo)
+    children = tuple(
+        compile_node_desc(c, node_list, memo, sync_memo, sync, tree)
+        for c in children)
+    node_class = nodes.get_node_class(category)
+    extra = {}
+    if category == defs.NT_ACT:
+        extra["enter_action"] = _split_action(data[0])
+        extra["leave_action"] = _split_action(data[1])
+    elif category == defs.NT_COMP:
+        extra["expr"] = expr.bind(data[0], data[1], data[2])
+    elif category == defs.NT_COND:
+        extra["expr"] = expr.bind(data[0], data[1])
+    elif category == defs.NT_PSEL:
+        extra["alias"] = sampling.AliasTable.from_cumulative(data)
+    if sync and not in_sync and len(children) > 0:
+        # root of a synchronous subtree, run it as a single node
+        node_class = nodes.Compiled
+        extra["jit"] = jit.compile_subtree(category, data, children)
+    desc = defs.NodeDesc(
+        category, data, children, debug_info,
+        node_class=node_class,
+        index=len(node_list),
+        tree=tree,
+        **extra)
+    node_list.append(desc)
+    memo[key] = desc
+    return desc
+
+
+def _split_action(action):
+    return action[0], tuple(action[1:])
\ No newline at end of file
@@ -0,0 +1,163 @@
+# -*- encoding: utf-8 -*-
+"""
+counters and histograms updated by the runtime
+
+    registry = Registry()
+    agent.attach_metrics(registry)  # agents may share a registry
+    world.attach_metrics(registry)
+    ...
+    registry.snapshot()
+    registry.dump(open("metrics.json", "w"))
+"""
+import json
+import time
+import bisect
+
+# default histogram bounds
+TIME_BOUNDS = tuple(1e-6 * 2 ** i for i in range(0, 24))  # 1us .. ~8s
+COUNT_BOUNDS = tuple(2 ** i for i in range(0, 17))  # 1 .. 65536
+
+
+class Counter(object):
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def snapshot(self):
+        return self.value
+
+    def reset(self):
+        self.value = 0
+
+
+class Histogram(object):
+    """
+    distribution of observed values over fixed buckets, counts[i] is the
+    number of values <= bounds[i] (and > bounds[i - 1]), the last count is
+    for values above all bounds
+    """
+    __slots__ = ("bounds", "counts", "count", "total", "min", "max")
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """
+        :return: upper bound of the bucket holding quantile q, max for the
+                 last bucket, None if nothing was observed
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "bounds": list(self.bounds),
+            "counts": list(self.counts),
+        }
+
+
+class Registry(object):
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.counters = {}
+        self.histograms = {}
+
+    def counter(self, name):
+        c = self.counters.get(name)
+        if c is None:
+            c = self.counters[name] = Counter()
+        return c
+
+    def histogram(self, name, bounds=TIME_BOUNDS):
+        h = self.histograms.get(name)
+        if h is None:
+            h = self.histograms[name] = Histogram(bounds)
+        return h
+
+    def reset(self):
+        for i in self.counters.values():
+            i.reset()
+        for i in self.histograms.values():
+            i.reset()
+
+    def snapshot(self):
+        """
+        :return: plain dict of the current values
+        """
+        return {
+            "counters": dict((k, v.snapshot()) for k, v in self.counters.items()),
+            "histograms": dict((k, v.snapshot()) for k, v in self.histograms.items()),
+        }
+
+    def to_json(self, indent=None):
+        return json.dumps(self.snapshot(), indent=indent, sort_keys=True)
+
+    def dump(self, f, indent=4):
+        f.write(self.to_json(indent))
+
+
+class AgentMetrics(object):
+    """
+    metrics updated by agents, held by Agent.metrics
+    """
+    def __init__(self, registry):
+        self.registry = registry
+        self.clock = registry.clock
+        self.events_fired = registry.counter("agent.events_fired")
+        self.events_swallowed = registry.counter("agent.events_swallowed")
+        self.events_unreceived = registry.counter("agent.events_unreceived")
+        self.fsm_transitions = registry.counter("agent.fsm_transitions")
+        self.prop_hits = registry.counter("agent.prop_hits")  # props.tick_cached
+        self.prop_misses = registry.counter("agent.prop_misses")
+        self.poll_visits = registry.histogram("agent.poll_visits", COUNT_BOUNDS)
+        self.poll_time = registry.histogram("agent.poll_time")
+        self.fronts = registry.histogram("agent.fronts", COUNT_BOUNDS)
+        self.action_latency = registry.histogram("agent.action_latency")
+
+
+class WorldMetrics(object):
+    """
+    metrics updated by worlds, held by World.metrics
+    """
+    def __init__(self, registry):
+        self.registry = registry
+        self.clock = registry.clock
+        self.ticks = registry.counter("world.ticks")
+        self.tick_time = registry.histogram("world.tick_time")
+        self.agents_settled = registry.histogram("world.agents_settled", COUNT_BOUNDS)
+        self.tick_visits = registry.histogram("world.tick_visits", COUNT_BOUNDS)
@@ -15,3 +15,12 @@ def set_export():
 
 def is_complete():
     return mode == COMPLETE
+
+
+# whether agents with a debugger attached use node classes with debug hooks,
+# turn it off to make sure nothing pays for debugging
+debug_hooks = True
+
+def set_debug_hooks(on_off):
+    global debug_hooks
+    debug_hooks = on_off
@@ -1,9 +1,9 @@
 # -*- encoding: utf-8 -*-
-import random
 import logging
 
 import ai2.runtime.defs as defs
 import ai2.runtime.loader as loader
+import ai2.runtime.dispatch as dispatch
 
 logger = logging.getLogger(__name__)
 
@@ -24,15 +24,18 @@ class Node(object):
         ENTERING, AWAKEN, REVISITING, BLOCKING,
         WAIT_CHILD, LEAVING, DEAD}
 
-    __slots__ = ("desc", "_state", "agent", "parent", "children", "children_states", "index")
+    # state is a plain attribute, transitions are only reported to a
+    # debugger by the class variants made with DebugHooks (see get_variant)
+    __slots__ = ("desc", "state", "agent", "parent", "children", "children_states", "index")
     multiple_children = False
+    recyclable = True  # whether agent.node_pool may reuse a DEAD instance
 
     def __repr__(self):
         return repr(self.desc.debug_info)
 
     def __init__(self, parent, index, node_desc, agent):
-        self.desc = defs.NodeDesc(*node_desc)
-        self._state = self.NEW
+        self.desc = node_desc
+        self.state = self.NEW
         self.agent = agent
         self.parent = parent
         self.index = index  # index in parent's children list
@@ -41,17 +44,6 @@ class Node(object):
             parent.children[self] = None
         agent.fronts.add(self)
 
-    @property
-    def state(self):
-        return self._state
-
-    @state.setter
-    def state(self, value):
-        if value in self.DEBUG_STATES:
-            self._state = value
-            if self.agent.debugger:
-                self.agent.debugger.check_debug(self)
-
     def _quick_finish(self, retval):
         """
         this is only to be used by internal nodes other than user action nodes,
@@ -75,9 +67,14 @@ class Node(object):
         if self.state == self.DEAD:
             # this saves a lot of trouble but somehow hide errors
             return
+        agent = self.agent
+        if agent.world is not None and not agent.processing:
+            # called from outside, handled on the next world tick
+            agent.world.post_finish(self, retval)
+            return
         self._quick_finish(retval)
-        if not self.agent.processing:
-            self.agent.poll()
+        if not agent.processing:
+            agent.poll()
 
     def block(self):
         # this is only for action node, not for composition nodes
@@ -112,6 +109,7 @@ class Node(object):
         self.state = self.DEAD
         self.agent.fronts.add(self.parent)
         self.parent.state = self.AWAKEN
+        self.agent.ready_queue.append(self.parent)
         """
         we can not delete children from parent's children because parent may
         need to collect children returned value
@@ -120,7 +118,7 @@ class Node(object):
 
     def push_child(self, n):
         assert self in self.agent.fronts, self.state
-        c = defs.NodeDesc(*self.desc.children[n])
+        c = self.desc.children[n]
         if not self.multiple_children:
             self.wait_for_child()
         self.agent.push_node(self, n, c)
@@ -144,6 +142,9 @@ class Node(object):
         self.state = self.REVISITING
 
     def clear_children(self):
+        release = self.agent.node_pool.release
+        for k in self.children:
+            release(k)
         self.children.clear()
 
     def get_single_result(self):
@@ -179,6 +180,7 @@ class Root(Node):
 
     def enter(self):
         super(Root, self).enter()
+        self.agent.link_tree(self.desc.tree)
         self.push_child(0)
 
     def revisit(self):
@@ -222,9 +224,9 @@ class RandomSequence(Node):
     __slots__ = ("order",)
 
     def __init__(self, parent, index, node_desc, agent):
-        n = len(defs.NodeDesc(*node_desc).children)
+        n = len(node_desc.children)
         self.order = [i for i in range(0, n)]
-        random.shuffle(self.order)
+        agent.rng.shuffle(self.order)
         super(RandomSequence, self).__init__(parent, index, node_desc, agent)
 
     def enter(self):
@@ -288,10 +290,20 @@ class Probability(Node):
 
     def enter(self):
         super(Probability, self).enter()
-        high = self.desc.data[-1]
-        rv = random.uniform(0, high)
-        idx = bsearch(self.desc.data, 0, len(self.desc.data), rv)
-        self.push_child(idx)
+        agent = self.agent
+        u = agent.rng.random()
+        batch = agent.pick_batch
+        if batch is None:
+            self.push_child(self.desc.alias.pick(u))
+        else:
+            # picked together with the other agents of the tick
+            self.wait_for_child()
+            batch.defer(self, u)
+
+    def picked(self, idx):
+        if self.state != self.WAIT_CHILD:
+            return  # interrupted while waiting for the pick
+        self.agent.push_node(self, idx, self.desc.children[idx])
 
     def revisit(self):
         super(Probability, self).revisit()
@@ -436,21 +448,51 @@ class Call(Node):
 
 
 class Action(Node):
-    __slots__ = ("node_state",)
+    __slots__ = ("node_state", "entered_at")
+    # user actions keep references to the node (e.g. timer callbacks calling
+    # finish later), so an action node must never be reused
+    recyclable = False
 
     def enter(self):
         super(Action, self).enter()
-        action_name = self.desc.data[0][0]
-        action_args = self.desc.data[0][1:]
-        self.agent.agent_action(self, action_name, action_args)
+        agent = self.agent
+        m = agent.metrics
+        self.entered_at = None if m is None else m.clock()
+        links = agent.action_links
+        if links is None:
+            action_name, action_args = self.desc.enter_action
+            agent.agent_action(self, action_name, action_args)
+        else:
+            call = self._linked(agent, links)[0]
+            if call is not None:
+                call(agent, self)
         if self.state == self.ENTERING:
             self.block()  # this is the default action
 
     def leave(self):
         super(Action, self).leave()
-        action_name = self.desc.data[1][0]
-        action_args = self.desc.data[1][1:]
-        self.agent.agent_action(self, action_name, action_args)
+        agent = self.agent
+        links = agent.action_links
+        if links is None:
+            action_name, action_args = self.desc.leave_action
+            agent.agent_action(self, action_name, action_args)
+        else:
+            call = self._linked(agent, links)[1]
+            if call is not None:
+                call(agent, self)
+
+    def _linked(self, agent, links):
+        desc = self.desc
+        table = links.get(desc.tree)
+        if table is None:
+            table = dispatch.link_tree(type(agent), desc.tree)
+        return table[desc.index]
+
+    def _quick_finish(self, retval):
+        m = self.agent.metrics
+        if m is not None and self.entered_at is not None:
+            m.action_latency.observe(m.clock() - self.entered_at)
+        super(Action, self)._quick_finish(retval)
 
 
 class Compute(Node):
@@ -458,10 +500,7 @@ class Compute(Node):
 
     def enter(self):
         super(Compute, self).enter()
-        oargs = self.desc.data[2]
-        func = self.desc.data[0]
-        iargs = self.desc.data[1]
-        self.agent.execute(oargs, func, iargs)
+        self.agent.compute(self.desc.expr)
         self._quick_finish(True)
 
 
@@ -470,9 +509,7 @@ class Condition(Node):
 
     def enter(self):
         super(Condition, self).enter()
-        func = self.desc.data[0]
-        iargs = self.desc.data[1]
-        r = self.agent.evaluate(func, iargs)
+        r = self.agent.condition(self.desc.expr)
         assert(r is True or r is False)
         self._quick_finish(bool(r))
 
@@ -483,12 +520,30 @@ class WaitFor(Node):
     def enter(self):
         super(WaitFor, self).enter()
         self.block()
+        self.agent.add_event_waiter(self.desc.data, self)
+
+    def leave(self):
+        super(WaitFor, self).leave()
+        # covers finishing as well as interrupting
+        self.agent.remove_event_waiter(self.desc.data, self)
 
     def is_waiting_for(self, event):
         desired_event = self.desc.data
         return event == desired_event
 
 
+class Compiled(Node):
+    """
+    root of a synchronous subtree compiled by ai2.runtime.jit, the subtree
+    runs inside enter without creating its nodes
+    """
+    __slots__ = ()
+
+    def enter(self):
+        super(Compiled, self).enter()
+        self._quick_finish(self.desc.jit(self.agent))
+
+
 _type_to_class = {
     defs.NT_ROOT: Root,
     defs.NT_SEQ: Sequence,
@@ -513,6 +568,91 @@ def get_node_class(node_type):
     return _type_to_class[node_type]
 
 
+class DebugHooks(object):
+    """
+    node class mixin reporting state transitions to agent.debugger
+    """
+    __slots__ = ()
+    variant_slots = ("_state",)
+
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        self._state = value
+        if value in self.DEBUG_STATES:
+            debugger = self.agent.debugger
+            if debugger:
+                debugger.check_debug(self)
+
+
+class ProfileHooks(object):
+    """
+    node class mixin timing visits with agent.profiler (see ai2.runtime.profiler)
+    """
+    __slots__ = ()
+    variant_slots = ()
+
+    def visit(self):
+        profiler = self.agent.profiler
+        if profiler is None:
+            # profiler detached while the node lives
+            return super(ProfileHooks, self).visit()
+        profiler.begin_node(self)
+        try:
+            return super(ProfileHooks, self).visit()
+        finally:
+            profiler.end()
+
+    def _quick_finish(self, retval):
+        # reached from outside of visit by events and finished actions
+        profiler = self.agent.profiler
+        if profiler is None:
+            super(ProfileHooks, self)._quick_finish(retval)
+            return
+        profiler.begin_node(self)
+        try:
+            super(ProfileHooks, self)._quick_finish(retval)
+        finally:
+            profiler.end()
+
+
+class RecordHooks(object):
+    """
+    node class mixin logging finishes with agent.recorder (see ai2.runtime.replay)
+    """
+    __slots__ = ()
+    variant_slots = ()
+
+    def finish(self, retval):
+        recorder = self.agent.recorder
+        if recorder is None or self.state == self.DEAD:
+            super(RecordHooks, self).finish(retval)
+        else:
+            recorder.record_finish(self, retval, super(RecordHooks, self).finish)
+
+
+_variants = {}
+
+
+def get_variant(clz, mixins):
+    """
+    get node class clz extended with mixins (e.g. DebugHooks), so that
+    the plain node classes do not pay for hooks that are not in use
+    """
+    key = clz, mixins
+    variant = _variants.get(key)
+    if variant is None:
+        slots = []
+        for m in mixins:
+            slots += m.variant_slots
+        variant = _variants[key] = type(
+            clz.__name__, mixins + (clz,), {"__slots__": tuple(slots)})
+    return variant
+
+
 if __name__ == "__main__":
     a = (1, 2, 3, 4)
     ii = bsearch(a, 0, len(a), 0)
@@ -0,0 +1,84 @@
+# -*- encoding: utf-8 -*-
+
+
+class NodePool(object):
+    """
+    per agent free lists of DEAD nodes, keyed by node class
+
+    nodes are handed back by their parent when it clears its children (and
+    recursively with the whole tree when a btree is stopped), and reset by
+    running __init__ again when reused
+
+    a released node may still have stale entries in the ready queue of its
+    agent (e.g. a NEW sibling interrupted when a parallel returns), a node
+    handed out again would pass their checks. released nodes are therefore
+    held back until flush, which the agent calls once its queue is empty
+    """
+    DEFAULT_CAPACITY = 64
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity  # max free nodes kept per class
+        self.free = {}
+        self.held = []  # released nodes waiting for flush
+        # statistics
+        self.hits = 0  # acquired from a free list
+        self.misses = 0  # newly allocated
+        self.recycled = 0  # put back on a free list
+        self.dropped = 0  # released while the free list was full
+
+    def acquire(self, clz, parent, index, node_desc, agent):
+        free = self.free.get(clz)
+        if free:
+            self.hits += 1
+            n = free.pop()
+            n.__init__(parent, index, node_desc, agent)
+            return n
+        self.misses += 1
+        return clz(parent, index, node_desc, agent)
+
+    def release(self, node):
+        """
+        release a dead node together with its (dead) subtree
+        """
+        assert node.state == node.DEAD, node.state
+        for c in node.children:
+            self.release(c)
+        node.children.clear()
+        node.parent = None
+        if node.recyclable:
+            self.held.append(node)
+
+    def flush(self):
+        """
+        make the nodes released so far reusable, no ready queue entry may
+        refer to them any more
+        """
+        held = self.held
+        if not held:
+            return
+        self.held = []
+        capacity = self.capacity
+        for node in held:
+            clz = type(node)
+            free = self.free.get(clz)
+            if free is None:
+                self.free[clz] = free = []
+            if len(free) < capacity:
+                free.append(node)
+                self.recycled += 1
+            else:
+                self.dropped += 1
+
+    def clear(self):
+        self.free.clear()
+        self.held = []
+
+    def get_stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "recycled": self.recycled,
+            "dropped": self.dropped,
+            "free": sum(len(i) for i in self.free.values()),
+            "held": len(self.held),
+        }
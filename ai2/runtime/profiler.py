@@ -0,0 +1,204 @@
+# -*- encoding: utf-8 -*-
+"""
+opt-in per node profiler
+
+    p = Profiler()
+    agent.attach_profiler(p)
+    ...
+    p.get_node_stats()
+    p.write_collapsed(open("ai.folded", "w"))  # input of flamegraph.pl
+
+wall time is attributed to the node being visited (interpreter overhead)
+and to the agent_action/evaluate/execute calls it makes. calls of a node
+count its visits and the finishes (events, actions) it gets outside of
+a visit. stacks are rooted at the fsm state stack. only nodes pushed
+after attach_profiler are profiled. a profiler may be shared by agents
+processed in the same thread, it is not thread safe.
+"""
+import time
+
+import ai2.runtime.defs as defs
+import ai2.runtime.nodes as nodes
+
+# columns of node stats
+CALLS = 0
+INTERPRETER = 1
+AGENT_ACTION = 2
+EVALUATE = 3
+EXECUTE = 4
+
+KIND_NAMES = ("calls", "interpreter", "agent_action", "evaluate", "execute")
+
+# frame fields
+F_STACK = 0
+F_DESC = 1
+F_NODE = 2
+F_AGENT = 3
+F_KIND = 4
+F_START = 5
+F_CHILDREN = 6  # time spent in nested frames
+
+
+class Profiler(object):
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.node_stats = {}  # node desc -> [calls, interpreter, agent_action, evaluate, execute]
+        self.stack_times = {}  # stack of frame labels -> self time
+        self.frames = []
+        self.labels = {}  # node desc -> frame label
+
+    def reset(self):
+        self.node_stats.clear()
+        self.stack_times.clear()
+
+    ###########################################################################
+    # instrumentation
+    ###########################################################################
+    def instrument(self, agent):
+        """
+        wrap the agent methods whose time is accounted apart from the nodes
+        """
+        agent.agent_action = self._wrap_action(agent, agent.agent_action)
+        agent.compute = self._wrap_expr(agent, agent.compute, "execute", EXECUTE)
+        agent.condition = self._wrap_expr(agent, agent.condition, "evaluate", EVALUATE)
+
+    def uninstrument(self, agent):
+        del agent.agent_action
+        del agent.compute
+        del agent.condition
+
+    def _wrap_action(self, agent, f):
+        def agent_action(node, method_name, arg_list):
+            if method_name == "":
+                return f(node, method_name, arg_list)
+            if isinstance(node, nodes.Node):
+                desc = node.desc
+            else:
+                desc = None  # fsm state action
+            self.begin(agent, node, desc, "action:" + method_name, AGENT_ACTION)
+            try:
+                return f(node, method_name, arg_list)
+            finally:
+                self.end()
+        return agent_action
+
+    def _wrap_expr(self, agent, f, label, kind):
+        def run(e):
+            frames = self.frames
+            if frames and frames[-1][F_AGENT] is agent:
+                top = frames[-1]
+                self.begin(agent, top[F_NODE], top[F_DESC], label, kind)
+            else:
+                self.begin(agent, None, None, label, kind)
+            try:
+                return f(e)
+            finally:
+                self.end()
+        return run
+
+    ###########################################################################
+    # frames
+    ###########################################################################
+    def begin_node(self, node):
+        agent = node.agent
+        stack = self._fsm_labels(agent)
+        path = []
+        n = node
+        while n is not None:
+            path.append(self._label(n.desc))
+            n = n.parent
+        path.reverse()
+        stack += tuple(path)
+        self._push(stack, node.desc, node, agent, INTERPRETER)
+
+    def begin(self, agent, node, desc, label, kind):
+        frames = self.frames
+        if frames and frames[-1][F_AGENT] is agent:
+            stack = frames[-1][F_STACK] + (label,)
+        else:
+            stack = self._fsm_labels(agent) + (label,)
+        self._push(stack, desc, node, agent, kind)
+
+    def _push(self, stack, desc, node, agent, kind):
+        self.frames.append([stack, desc, node, agent, kind, self.clock(), 0.0])
+
+    def end(self):
+        frames = self.frames
+        frame = frames.pop()
+        elapsed = self.clock() - frame[F_START]
+        own = elapsed - frame[F_CHILDREN]
+        if frames:
+            frames[-1][F_CHILDREN] += elapsed
+        stack = frame[F_STACK]
+        self.stack_times[stack] = self.stack_times.get(stack, 0.0) + own
+        desc = frame[F_DESC]
+        if desc is None:
+            return
+        stats = self.node_stats.get(desc)
+        if stats is None:
+            stats = self.node_stats[desc] = [0, 0.0, 0.0, 0.0, 0.0]
+        kind = frame[F_KIND]
+        stats[kind] += own
+        if kind == INTERPRETER:
+            # a node finishing inside its own visit is the same call
+            node = frame[F_NODE]
+            for i in frames:
+                if i[F_NODE] is node and i[F_KIND] == INTERPRETER:
+                    break
+            else:
+                stats[CALLS] += 1
+
+    def _fsm_labels(self, agent):
+        labels = []
+        for f in agent.fsm_stack:
+            name = f.desc.name.rsplit(".", 1)[-1]
+            if f.current_state_index is None:
+                labels.append(name)
+            else:
+                state = f.desc.states[f.current_state_index]
+                labels.append("%s:%s" % (name, state.debug_info))
+        return tuple(labels)
+
+    def _label(self, desc):
+        label = self.labels.get(desc)
+        if label is None:
+            label = desc.category
+            location = desc.debug_info
+            if isinstance(location, tuple) and len(location) == 2:
+                label = "%s:%s %s" % (location[0], location[1], label)
+            if desc.category == defs.NT_ACT and desc.enter_action[0]:
+                label += " " + desc.enter_action[0]
+            self.labels[desc] = label
+        return label
+
+    ###########################################################################
+    # reports
+    ###########################################################################
+    def get_node_stats(self):
+        """
+        :return: [(debug_info, category, calls, interpreter, agent_action,
+                   evaluate, execute, total time)] most expensive first
+        """
+        rows = []
+        for desc, s in self.node_stats.items():
+            rows.append((desc.debug_info, desc.category) + tuple(s) + (sum(s[1:]),))
+        rows.sort(key=lambda i: i[-1], reverse=True)
+        return rows
+
+    def get_collapsed(self, unit=1e-6):
+        """
+        :return: collapsed stack lines ("frame;frame;frame count") with
+                 time counted in units
+        """
+        lines = []
+        for stack, t in self.stack_times.items():
+            count = int(round(t / unit))
+            if count > 0:
+                lines.append("%s %d" % (";".join(i.replace(";", ":") for i in stack), count))
+        lines.sort()
+        return lines
+
+    def write_collapsed(self, f, unit=1e-6):
+        for line in self.get_collapsed(unit):
+            f.write(line)
+            f.write("\n")
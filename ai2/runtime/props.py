@@ -0,0 +1,117 @@
+# -*- encoding: utf-8 -*-
+"""
+agent properties computed at most once per tick
+
+    class Tank(ActionAgent):
+        position = tracked("position")
+
+        @tick_cached(depends=("position",))
+        def danger_rate(self):
+            return len(self.arena.get_bullets_in_range(self.position))
+
+a tick_cached property (read by PAR_PROP parameters or by anyone else)
+is computed on the first read of a tick and served from the agent cache
+until the tick advances: World.tick for agents in a world, every poll
+for the others. it is computed again after a dependency changes, that is
+after a tracked attribute is set to a different value or after
+agent.invalidate(name). hits and misses are counted per property (see
+stats) and in agent.metrics when attached.
+"""
+
+
+class tick_cached(object):
+    def __init__(self, fget=None, depends=()):
+        self.fget = fget
+        self.name = None if fget is None else fget.__name__
+        self.depends = tuple(depends)
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, fget):
+        # used as @tick_cached(depends=...)
+        assert self.fget is None
+        self.fget = fget
+        self.name = fget.__name__
+        return self
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, agent, owner):
+        if agent is None:
+            return self
+        stamp = agent.tick_stamp()
+        entry = agent.prop_cache.get(self.name)
+        m = agent.metrics
+        if entry is not None and entry[0] == stamp:
+            self.hits += 1
+            if m is not None:
+                m.prop_hits.inc()
+            return entry[1]
+        self.misses += 1
+        if m is not None:
+            m.prop_misses.inc()
+        v = self.fget(agent)
+        agent.prop_cache[self.name] = (stamp, v)
+        return v
+
+    def __set__(self, agent, value):
+        raise AttributeError("tick cached property %s is read only" % self.name)
+
+
+class tracked(object):
+    """
+    agent attribute invalidating the tick_cached properties depending on it
+    when it is set to a different value
+    """
+    def __init__(self, name):
+        self.name = name
+        self.key = "_tracked_" + name
+
+    def __set_name__(self, owner, name):
+        assert name == self.name, (name, self.name)
+
+    def __get__(self, agent, owner):
+        if agent is None:
+            return self
+        try:
+            return agent.__dict__[self.key]
+        except KeyError:
+            raise AttributeError(self.name)
+
+    def __set__(self, agent, value):
+        d = agent.__dict__
+        old = d.get(self.key, _UNSET)
+        d[self.key] = value
+        if old is not value and old != value:
+            agent.invalidate(self.name)
+
+
+_UNSET = object()
+# (agent class, dependency name) -> names of the tick_cached depending on it
+_dependents = {}
+
+
+def dependents(clz, name):
+    key = clz, name
+    names = _dependents.get(key)
+    if names is None:
+        names = []
+        for k in dir(clz):
+            v = getattr(clz, k, None)
+            if isinstance(v, tick_cached) and (k == name or name in v.depends):
+                names.append(k)
+        names = _dependents[key] = tuple(names)
+    return names
+
+
+def stats(clz):
+    """
+    :return: {property name: (hits, misses)} of the tick_cached of clz
+    """
+    ret = {}
+    for k in dir(clz):
+        v = getattr(clz, k, None)
+        if isinstance(v, tick_cached):
+            ret[k] = v.hits, v.misses
+    return ret
@@ -0,0 +1,84 @@
+# -*- encoding: utf-8 -*-
+"""
+seeded random sources of agents
+
+every agent owns an AgentRandom (Agent.rng). an agent created without an
+id is seeded from its creation number, agents with a stable id should
+call Agent.seed_rng(agent_id) so their runs do not depend on creation
+order (e.g. sharded or parallel execution).
+
+stochastic nodes draw through random() only, so values pre-drawn in bulk
+(predraw) are exactly the values that would have been drawn one by one.
+"""
+import zlib
+import random
+import itertools
+import collections
+
+base_seed = 0  # mixed into every seed, change it before creating agents
+_created = itertools.count()
+_random = random.Random.random
+
+
+def stable_hash(agent_id):
+    # hash() of str is salted per process, crc32 is not
+    return zlib.crc32(repr(agent_id).encode("utf-8"))
+
+
+def seed_for(agent_id, base=None):
+    return stable_hash(agent_id) ^ (base_seed if base is None else base)
+
+
+def next_seed():
+    """
+    :return: seed of the next agent created without an id
+    """
+    return seed_for(("agent", next(_created)))
+
+
+class AgentRandom(random.Random):
+    """
+    random.Random with a buffer of pre-drawn random() values
+    """
+    def seed(self, a=None, version=2):
+        super(AgentRandom, self).seed(a, version)
+        self.drawn = collections.deque()
+
+    def getstate(self):
+        return super(AgentRandom, self).getstate(), tuple(self.drawn)
+
+    def setstate(self, state):
+        super(AgentRandom, self).setstate(state[0])
+        self.drawn = collections.deque(state[1])
+
+    def random(self):
+        drawn = self.drawn
+        if drawn:
+            return drawn.popleft()
+        return _random(self)
+
+    def predraw(self, n):
+        """
+        make sure the next n values of random() are drawn
+        """
+        k = n - len(self.drawn)
+        if k > 0:
+            self.drawn.extend([_random(self) for _ in range(0, k)])
+
+    def shuffle(self, x):
+        # Random.shuffle draws with getrandbits, which is not buffered
+        random = self.random
+        for i in range(len(x) - 1, 0, -1):
+            j = int(random() * (i + 1))
+            x[i], x[j] = x[j], x[i]
+
+
+def predraw(agents, n):
+    """
+    pre-draw n random() values for each of agents at once, e.g. before a
+    batched world tick
+    """
+    for a in agents:
+        rng = a.rng
+        if isinstance(rng, AgentRandom):
+            rng.predraw(n)
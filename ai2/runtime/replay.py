@@ -0,0 +1,389 @@
+# -*- encoding: utf-8 -*-
+"""
+record the inputs of an agent and replay them headless
+
+    recorder = Recorder()
+    agent.attach_recorder(recorder)  # before enable
+    ...
+    recorder.save("tank1.ai2log")
+
+    python run.py ai2.runtime.replay tank1.ai2log
+
+the log holds what comes from outside of the trees: events fired, actions
+finished, blackboard writes from outside and world settles (with their
+time), the seed of agent.rng and the agent properties(PAR_PROP) read by
+the trees. actions the
+replaying agent class does not implement (game actions) are stubbed: their
+effects on the agent (finishing a node, firing an event, writing the
+blackboard) are recorded and applied again in place of the call.
+everything else is executed again, so a replay visits the same nodes in
+the same order as the recorded run. an agent recorded in a World is
+replayed in a World of its own, it should not change worlds meanwhile.
+
+recorded values other than plain builtins (None, bool, numbers, strings)
+are pickled when they are recorded (see Pickled), so the objects a game
+keeps in blackboards can be recorded. logs are pickles, only replay logs
+you trust.
+"""
+import sys
+import time
+import zlib
+import pickle
+import random
+import collections
+
+import ai2.runtime.nodes as nodes
+import ai2.runtime.rand as rand
+import ai2.runtime.world as world
+import ai2.runtime.loader as loader
+import ai2.runtime.blackboard as blackboard
+from ai2.runtime.action_agent import ActionAgent
+
+LOG_VERSION = 2
+
+# kinds of inputs (kind, time, ...) and action effects (kind, ...)
+R_EVENT = 0  # event
+R_FINISH = 1  # call number of the enter action of the node, retval
+R_BB_SET = 2  # key, value
+R_BB_DEL = 3  # key
+R_ENABLE = 4  # on_off, fsm name (inputs only)
+R_SETTLE = 5  # max visits (inputs only)
+
+
+# types of the values logged as they are
+PLAIN_TYPES = frozenset((type(None), bool, int, float, complex, str, bytes))
+
+
+class Pickled(object):
+    """
+    a recorded value pickled when it was recorded: later changes to the
+    object do not leak into the log, and a value that can not be pickled
+    fails right away with the name it was recorded under
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def load(self):
+        return pickle.loads(self.data)
+
+
+def snapshot(name, value):
+    """
+    :return: value as it is logged
+    :raise ValueError: if value can not be pickled
+    """
+    if type(value) in PLAIN_TYPES:
+        return value
+    try:
+        return Pickled(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception as e:
+        raise ValueError("can not record %s: %r (%s)" % (name, value, e))
+
+
+def restore(value):
+    if type(value) is Pickled:
+        return value.load()
+    return value
+
+
+class RecordingBlackboard(blackboard.Blackboard):
+    __slots__ = ("recorder",)
+
+    def set_slot(self, slot, value):
+        self.recorder.record_write(
+            (R_BB_SET, blackboard.key_of(slot), value),
+            super(RecordingBlackboard, self).set_slot, slot, value)
+
+    def del_slot(self, slot):
+        self.recorder.record_write(
+            (R_BB_DEL, blackboard.key_of(slot)),
+            super(RecordingBlackboard, self).del_slot, slot)
+
+
+class Recorder(object):
+    """
+    records the inputs of one agent, see Agent.attach_recorder
+    :param replay_class: agent class the log is meant for, actions it does
+                         not implement are stubbed
+    """
+    def __init__(self, seed=None, replay_class=None, clock=time.perf_counter):
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.replay_class = replay_class or ReplayAgent
+        self.clock = clock
+        self.agent = None
+        self.header = None
+        self.t0 = None
+        self.inputs = []
+        self.actions = {}  # call number -> effects of a stubbed action
+        self.props = {}  # property name -> values read
+        self.calls = 0
+        self.node_calls = {}  # action node -> call number of its enter action
+        self.effects = None  # effects of the stubbed action running
+        self.depth = 0  # > 0 while running what a replay does again
+
+    ###########################################################################
+    # instrumentation
+    ###########################################################################
+    def instrument(self, agent):
+        self.agent = agent
+        self.t0 = self.clock()
+        agent.rng = rand.AgentRandom(self.seed)
+        self.header = {
+            "seed": self.seed,
+            "prefix": loader.prefix,
+            "blackboard": dict(
+                (k, snapshot("blackboard value %r" % (k,), v))
+                for k, v in agent.blackboard.items()),
+            "world": agent.world is not None,
+        }
+        bb = RecordingBlackboard()
+        bb.values = agent.blackboard.values
+        bb.watchers = agent.blackboard.watchers
+        bb.recorder = self
+        agent.blackboard = bb
+        agent.enable = self._wrap_enable(agent.enable)
+        agent.fire_event = self._wrap_fire_event(agent.fire_event)
+        agent.agent_action = self._wrap_action(agent.agent_action)
+        agent.get_property = self._wrap_get_property(agent.get_property)
+
+    def uninstrument(self, agent):
+        for name in ("enable", "fire_event", "agent_action", "get_property"):
+            delattr(agent, name)
+        bb = blackboard.Blackboard()
+        bb.values = agent.blackboard.values
+        bb.watchers = agent.blackboard.watchers
+        agent.blackboard = bb
+        self.agent = None
+
+    def _is_input(self):
+        return self.depth == 0 and not self.agent.processing
+
+    def _again(self, f, *args):
+        """
+        run f whose consequences a replay reproduces by itself
+        """
+        outer = self.effects
+        self.effects = None
+        self.depth += 1
+        try:
+            return f(*args)
+        finally:
+            self.depth -= 1
+            self.effects = outer
+
+    def _input(self, record, f, *args):
+        self.inputs.append((record[0], self.clock() - self.t0) + record[1:])
+        return self._again(f, *args)
+
+    def _wrap_enable(self, f):
+        def enable(on_off):
+            if self._is_input():
+                return self._input((R_ENABLE, on_off, self.agent.fsm_name), f, on_off)
+            return f(on_off)
+        return enable
+
+    def _wrap_fire_event(self, f):
+        def fire_event(event):
+            if self.effects is not None:
+                self.effects.append((R_EVENT, event))
+                return self._again(f, event)
+            if self._is_input():
+                return self._input((R_EVENT, event), f, event)
+            return f(event)
+        return fire_event
+
+    def _wrap_action(self, f):
+        def agent_action(node, method_name, arg_list):
+            is_node = isinstance(node, nodes.Node)
+            if method_name == "":
+                if is_node and node.state == node.LEAVING:
+                    self.node_calls.pop(node, None)
+                return f(node, method_name, arg_list)
+            no = self.calls
+            self.calls += 1
+            if is_node and node.state == node.ENTERING:
+                self.node_calls[node] = no
+            outer = self.effects
+            if hasattr(self.replay_class, method_name):
+                self.effects = None
+            else:
+                self.effects = self.actions[no] = []
+            self.depth += 1
+            try:
+                return f(node, method_name, arg_list)
+            finally:
+                self.depth -= 1
+                if self.effects is not None and not self.effects:
+                    del self.actions[no]
+                self.effects = outer
+                if is_node and node.state == node.LEAVING:
+                    self.node_calls.pop(node, None)
+        return agent_action
+
+    def _wrap_get_property(self, f):
+        def get_property(name):
+            value = f(name)
+            if self.effects is None:
+                values = self.props.get(name)
+                if values is None:
+                    values = self.props[name] = []
+                values.append(snapshot("property %r" % (name,), value))
+            return value
+        return get_property
+
+    def record_finish(self, node, retval, f):
+        if self.effects is not None:
+            self.effects.append((R_FINISH, self.node_calls[node], retval))
+            return self._again(f, retval)
+        if self._is_input():
+            return self._input((R_FINISH, self.node_calls[node], retval), f, retval)
+        return f(retval)
+
+    def record_write(self, record, f, *args):
+        if self.effects is not None:
+            self.effects.append(self._snapshot_write(record))
+            return self._again(f, *args)
+        if self._is_input():
+            return self._input(self._snapshot_write(record), f, *args)
+        return f(*args)
+
+    def _snapshot_write(self, record):
+        if record[0] != R_BB_SET:
+            return record
+        return R_BB_SET, record[1], snapshot(
+            "blackboard value %r" % (record[1],), record[2])
+
+    def record_settle(self, f, agent, max_visits):
+        return self._input((R_SETTLE, max_visits), f, agent, max_visits)
+
+    ###########################################################################
+    # log
+    ###########################################################################
+    def get_log(self):
+        return LOG_VERSION, self.header, self.inputs, self.actions, self.props
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(dump_log(self.get_log()))
+
+
+def dump_log(log):
+    return zlib.compress(pickle.dumps(log, pickle.HIGHEST_PROTOCOL))
+
+
+def load_log(data):
+    return pickle.loads(zlib.decompress(data))
+
+
+def read_log(path):
+    with open(path, "rb") as f:
+        return load_log(f.read())
+
+
+class ReplayAgent(ActionAgent):
+    """
+    headless agent running a log of Recorder, see replay_all
+    """
+    def __init__(self, log):
+        super(ReplayAgent, self).__init__()
+        version, header, inputs, actions, props = log
+        assert version == LOG_VERSION, version
+        self.replay_inputs = inputs
+        self.replay_actions = actions
+        self.replay_props = dict((k, collections.deque(v)) for k, v in props.items())
+        self.replay_position = 0
+        self.replay_calls = 0
+        self.call_nodes = {}  # call number of enter action -> node
+        self.node_calls = {}
+        self.rng = rand.AgentRandom(header["seed"])
+        self.blackboard.update(dict(
+            (k, restore(v)) for k, v in header["blackboard"].items()))
+        if header["world"]:
+            world.World().add_agent(self)
+
+    def agent_action(self, node, method_name, arg_list):
+        is_node = isinstance(node, nodes.Node)
+        if method_name == "":
+            if is_node and node.state == node.LEAVING:
+                self._forget(node)
+            return
+        no = self.replay_calls
+        self.replay_calls += 1
+        if is_node and node.state == node.ENTERING:
+            self.call_nodes[no] = node
+            self.node_calls[node] = no
+        if hasattr(type(self), method_name):
+            ret = super(ReplayAgent, self).agent_action(node, method_name, arg_list)
+        else:
+            ret = None
+            for effect in self.replay_actions.get(no, ()):
+                self.apply(effect[0], effect[1:])
+        if is_node and node.state == node.LEAVING:
+            self._forget(node)
+        return ret
+
+    def _forget(self, node):
+        no = self.node_calls.pop(node, None)
+        if no is not None:
+            del self.call_nodes[no]
+
+    def get_property(self, name):
+        values = self.replay_props.get(name)
+        assert values, "replay diverged: no recorded read of %s left" % name
+        return restore(values.popleft())
+
+    def apply(self, kind, args):
+        if kind == R_EVENT:
+            self.fire_event(args[0])
+        elif kind == R_FINISH:
+            node = self.call_nodes.get(args[0])
+            assert node is not None, "replay diverged: no node of call %s" % args[0]
+            node.finish(args[1])
+        elif kind == R_BB_SET:
+            self.blackboard[args[0]] = restore(args[1])
+        elif kind == R_BB_DEL:
+            del self.blackboard[args[0]]
+        elif kind == R_ENABLE:
+            self.set_fsm(args[1])
+            self.enable(args[0])
+        elif kind == R_SETTLE:
+            self.world.settle(self, args[0])
+        else:
+            assert False, kind
+
+    def replay_step(self):
+        """
+        apply the next input
+        :return: False if the log is exhausted
+        """
+        if self.replay_position >= len(self.replay_inputs):
+            return False
+        record = self.replay_inputs[self.replay_position]
+        self.replay_position += 1
+        self.apply(record[0], record[2:])
+        return True
+
+    def replay_all(self):
+        """
+        apply all inputs left as fast as possible
+        :return: number of inputs applied
+        """
+        n = 0
+        while self.replay_step():
+            n += 1
+        return n
+
+
+def run():
+    """
+    python run.py ai2.runtime.replay log_path
+    """
+    log = read_log(sys.argv[2])
+    loader.prefix = log[1]["prefix"]
+    agent = ReplayAgent(log)
+    t0 = time.perf_counter()
+    n = agent.replay_all()
+    t = time.perf_counter() - t0
+    print("replayed %d inputs, %d action calls in %.3fs" % (n, agent.replay_calls, t))
@@ -0,0 +1,130 @@
+# -*- encoding: utf-8 -*-
+"""
+weighted choice in O(1) with alias tables (Vose's method)
+
+a table is built once per NT_PSEL node at load time (NodeDesc.alias) from
+the cumulative weights the exporter writes, picking a child takes one
+uniform number in [0, 1). pick_many picks for many agents at once and is
+vectorized with NumPy when it is installed, a world ticked with
+batch_picks collects the Probability nodes its agents enter in a
+PickBatch to pick them that way.
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class AliasTable(object):
+    __slots__ = ("n", "prob", "alias", "_arrays")
+
+    def __init__(self, weights):
+        n = len(weights)
+        assert n > 0
+        self.n = n
+        self._arrays = None
+        total = float(sum(weights))
+        if total <= 0:
+            # nothing to weigh, always pick the first child as the binary
+            # search over cumulative weights did
+            self.prob = (0.0,) * (n + 1)
+            self.alias = (0,) * (n + 1)
+            return
+        scaled = [w * n / total for w in weights]
+        prob = [1.0] * n
+        alias = list(range(0, n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large[-1]
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            if scaled[l] < 1.0:
+                small.append(large.pop())
+        # what is left is 1.0 up to rounding errors
+        # u * n may round up to n, pick what the top of the last bucket picks
+        prob.append(0.0)
+        alias.append(n - 1 if prob[n - 1] >= 1.0 else alias[n - 1])
+        self.prob = tuple(prob)
+        self.alias = tuple(alias)
+
+    @classmethod
+    def from_cumulative(cls, cumulative):
+        weights = []
+        last = 0.0
+        for c in cumulative:
+            weights.append(c - last)
+            last = c
+        return cls(weights)
+
+    def pick(self, u):
+        """
+        :param u: uniform number in [0, 1)
+        :return: index of the chosen weight
+        """
+        x = u * self.n
+        i = int(x)
+        if x - i < self.prob[i]:
+            return i
+        return self.alias[i]
+
+    def pick_many(self, us):
+        """
+        :param us: sequence (or numpy array) of uniform numbers in [0, 1)
+        :return: list (numpy array if numpy is installed) of indices,
+                 the same pick(u) would return for every u
+        """
+        if numpy is None:
+            pick = self.pick
+            return [pick(u) for u in us]
+        if self._arrays is None:
+            self._arrays = numpy.array(self.prob), numpy.array(self.alias)
+        prob, alias = self._arrays
+        x = numpy.asarray(us, dtype=float) * self.n
+        i = x.astype(numpy.intp)
+        return numpy.where(x - i < prob[i], i, alias[i])
+
+
+class PickBatch(object):
+    """
+    Probability nodes waiting for their child to be picked, the picks of a
+    table are made with one pick_many call
+
+    an agent stops polling (agent.suspended) when it defers a pick, so what
+    it does after the pick is the same as if it had been picked at once
+    """
+    def __init__(self):
+        self.pending = {}  # AliasTable -> ([node], [uniform number])
+
+    def defer(self, node, u):
+        table = node.desc.alias
+        entry = self.pending.get(table)
+        if entry is None:
+            entry = self.pending[table] = ([], [])
+        entry[0].append(node)
+        entry[1].append(u)
+        node.agent.suspended = True
+
+    def pick(self):
+        """
+        pick the children of every deferred node and resume their agents
+        """
+        pending, self.pending = self.pending, {}
+        for table, (nodes, us) in pending.items():
+            for node, i in zip(nodes, table.pick_many(us)):
+                node.agent.suspended = False
+                node.picked(int(i))
+
+    def pick_now(self, agent):
+        """
+        pick the deferred node of agent alone, e.g. when it leaves its world
+        """
+        for table, (nodes, us) in self.pending.items():
+            for k, node in enumerate(nodes):
+                if node.agent is agent:
+                    del nodes[k]
+                    node.agent.suspended = False
+                    node.picked(table.pick(us.pop(k)))
+                    return
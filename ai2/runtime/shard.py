@@ -0,0 +1,222 @@
+# -*- encoding: utf-8 -*-
+import logging
+import multiprocessing
+import queue
+from collections import namedtuple
+
+import ai2.runtime.nodes as nodes
+import ai2.runtime.world as world
+import ai2.runtime.loader as loader
+from ai2.runtime.action_agent import ActionAgent
+from ai2.runtime.rand import stable_hash
+
+logger = logging.getLogger(__name__)
+
+# an action an agent called on the host side, token identifies the calling
+# node and is what finish() expects
+RemoteCall = namedtuple("RemoteCall", ("agent_id", "token", "method_name", "args"))
+
+CMD_ADD = 0
+CMD_REMOVE = 1
+CMD_EVENT = 2
+CMD_FINISH = 3
+CMD_TICK = 4
+CMD_STOP = 5
+
+
+class RemoteActionAgent(ActionAgent):
+    """
+    an agent running in a worker process, actions it does not implement
+    itself are streamed back to the host as RemoteCall
+    """
+    def __init__(self, agent_id):
+        super(RemoteActionAgent, self).__init__()
+        self.agent_id = agent_id
+        self.remote_calls = []  # taken by the worker after each tick
+        self.token_to_node = {}
+        self.node_to_token = {}
+        self.next_token = 0
+
+    def agent_action(self, node, method_name, arg_list):
+        if method_name == "" or hasattr(self, method_name):
+            ret = super(RemoteActionAgent, self).agent_action(node, method_name, arg_list)
+        else:
+            args = tuple([self.get_value(i) for i in arg_list])
+            token = self._get_token(node)
+            self.remote_calls.append(
+                RemoteCall(self.agent_id, token, method_name, args))
+            ret = None
+        if isinstance(node, nodes.Node) and node.state == node.LEAVING:
+            token = self.node_to_token.pop(node, None)
+            if token is not None:
+                del self.token_to_node[token]
+        return ret
+
+    def _get_token(self, node):
+        if not isinstance(node, nodes.Node):
+            return None  # fsm actions can not be finished
+        token = self.node_to_token.get(node)
+        if token is None:
+            token = self.next_token
+            self.next_token += 1
+            self.node_to_token[node] = token
+            self.token_to_node[token] = node
+        return token
+
+    def finish_remote(self, token, retval):
+        node = self.token_to_node.get(token)
+        if node is None:
+            return  # node already left
+        node.finish(retval)
+
+
+def _worker_main(prefix, bundles, preload, agent_factory, base_seed, inbox, outbox):
+    loader.prefix = prefix
+    for path in bundles:
+        # the mapping is shared with every process opening the bundle
+        loader.open_bundle(path)
+    for name in preload:
+        loader.load_btree(name)
+    w = world.World()
+    agents = {}
+    while True:
+        batch = inbox.get()
+        for cmd in batch:
+            op = cmd[0]
+            if op == CMD_EVENT:
+                agents[cmd[1]].fire_event(cmd[2])
+            elif op == CMD_FINISH:
+                agents[cmd[1]].finish_remote(cmd[2], cmd[3])
+            elif op == CMD_TICK:
+                w.tick()
+                calls = []
+                for a in agents.values():
+                    if a.remote_calls:
+                        calls += a.remote_calls
+                        a.remote_calls = []
+                outbox.put(calls)
+            elif op == CMD_ADD:
+                _, agent_id, fsm_name, blackboard = cmd
+                a = agent_factory(agent_id)
+                a.seed_rng(agent_id, base_seed)
+                a.blackboard.update(blackboard)
+                a.set_fsm(fsm_name)
+                w.add_agent(a)
+                a.enable(True)
+                agents[agent_id] = a
+            elif op == CMD_REMOVE:
+                a = agents.pop(cmd[1])
+                a.enable(False)
+                w.remove_agent(a)
+            elif op == CMD_STOP:
+                return
+            else:
+                assert False, op
+
+
+class ShardedWorld(object):
+    """
+    host side of running agents sharded over worker processes
+
+    every worker ticks a World of its agents, commands (events, action
+    completions) are sent to workers in one batch per tick and the actions
+    agents called come back as RemoteCall in one batch per tick. an agent
+    always lives on the worker chosen by its id, its commands are applied in
+    order and its random source is seeded from its id, so a run does not
+    depend on the number of workers.
+
+    workers open the bundles the host has open (see loader.open_bundle)
+    when they start.
+
+    agent_factory(agent_id) is called in the worker processes and should
+    return a RemoteActionAgent, it has to be picklable (a module level
+    function) where processes are spawned instead of forked
+    """
+    # seconds between checks that a worker is still alive while waiting for
+    # the result of its tick
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, agent_factory, n_workers=None, preload=(), seed=0):
+        if n_workers is None:
+            n_workers = multiprocessing.cpu_count()
+        self.agent_factory = agent_factory
+        self.n_workers = n_workers
+        self.preload = tuple(preload)
+        self.seed = seed
+        self.workers = []
+        self.inboxes = []
+        self.outboxes = []
+        self.pending = [[] for _ in range(0, n_workers)]  # commands of this tick
+        self.agent_shard = {}
+
+    def start(self):
+        assert len(self.workers) == 0
+        bundles = tuple(b.path for b in loader._bundles)
+        for i in range(0, self.n_workers):
+            inbox = multiprocessing.Queue()
+            outbox = multiprocessing.Queue()
+            p = multiprocessing.Process(
+                name="AIShardWorker%d" % i,
+                target=_worker_main,
+                args=(loader.prefix, bundles, self.preload, self.agent_factory,
+                      self.seed, inbox, outbox))
+            p.daemon = True
+            p.start()
+            self.workers.append(p)
+            self.inboxes.append(inbox)
+            self.outboxes.append(outbox)
+
+    def stop(self):
+        for i, inbox in enumerate(self.inboxes):
+            inbox.put(self.pending[i] + [(CMD_STOP,)])
+            self.pending[i] = []
+        for p in self.workers:
+            p.join()
+        self.workers = []
+        self.inboxes = []
+        self.outboxes = []
+
+    def shard_of(self, agent_id):
+        return stable_hash(agent_id) % self.n_workers
+
+    def add_agent(self, agent_id, fsm_name, blackboard=None):
+        assert agent_id not in self.agent_shard, agent_id
+        shard = self.agent_shard[agent_id] = self.shard_of(agent_id)
+        self.pending[shard].append(
+            (CMD_ADD, agent_id, fsm_name, dict(blackboard or {})))
+
+    def remove_agent(self, agent_id):
+        shard = self.agent_shard.pop(agent_id)
+        self.pending[shard].append((CMD_REMOVE, agent_id))
+
+    def fire_event(self, agent_id, event):
+        self.pending[self.agent_shard[agent_id]].append(
+            (CMD_EVENT, agent_id, event))
+
+    def finish(self, agent_id, token, retval):
+        self.pending[self.agent_shard[agent_id]].append(
+            (CMD_FINISH, agent_id, token, retval))
+
+    def tick(self):
+        """
+        send the commands collected since last tick and tick all workers
+        :return: list of RemoteCall made during the tick, grouped by worker
+        :raise RuntimeError: if a worker died
+        """
+        for i, inbox in enumerate(self.inboxes):
+            inbox.put(self.pending[i] + [(CMD_TICK,)])
+            self.pending[i] = []
+        calls = []
+        for i, outbox in enumerate(self.outboxes):
+            calls += self._get_result(i, outbox)
+        return calls
+
+    def _get_result(self, i, outbox):
+        p = self.workers[i]
+        while True:
+            try:
+                return outbox.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                if not p.is_alive():
+                    raise RuntimeError("shard worker %d died (exit code %s)" % (
+                        i, p.exitcode))
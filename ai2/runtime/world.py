@@ -0,0 +1,160 @@
+# -*- encoding: utf-8 -*-
+import logging
+import collections
+
+import ai2.runtime.rand as rand
+import ai2.runtime.metrics as metrics
+import ai2.runtime.sampling as sampling
+
+logger = logging.getLogger(__name__)
+
+
+class World(object):
+    """
+    ticks many agents in one batched pass
+
+    agents added to a world no longer poll themselves: events fired and
+    actions finished from outside are put into per agent inboxes, and every
+    agent with pending work is settled once per tick
+    """
+    def __init__(self, max_visits=None, predraw=0, batch_picks=False):
+        self.max_visits = max_visits  # node visit budget per agent per tick
+        # random values drawn in bulk for every agent settled by a tick
+        self.predraw = predraw
+        # pick the children of the Probability nodes agents enter during a
+        # tick in bulk, see sampling.PickBatch
+        self.pick_batch = sampling.PickBatch() if batch_picks else None
+        self.agents = {}  # agent -> inbox, insertion ordered
+        self.dirty = {}  # agents to be settled on next tick, used as ordered set
+        self.tick_count = 0
+        # statistics of the last tick
+        self.last_settled = 0
+        self.last_visits = 0
+        self.metrics = None  # metrics.WorldMetrics
+
+    def attach_metrics(self, registry):
+        self.metrics = metrics.WorldMetrics(registry)
+
+    def add_agent(self, agent):
+        assert agent.world is None, agent.world
+        agent.world = self
+        agent.prop_cache.clear()  # stamps were poll counts
+        self.agents[agent] = collections.deque()
+        if agent.has_pending():
+            self.mark_dirty(agent)
+
+    def remove_agent(self, agent):
+        assert agent.world is self
+        # apply whatever is still in the inbox so the agent is left consistent
+        if agent.suspended:
+            self.pick_batch.pick_now(agent)
+            self._resume(agent, None)
+        else:
+            self.settle(agent, None)
+        agent.world = None
+        agent.prop_cache.clear()
+        del self.agents[agent]
+        self.dirty.pop(agent, None)
+
+    def mark_dirty(self, agent):
+        self.dirty[agent] = None
+
+    def post_event(self, agent, event):
+        self.agents[agent].append((None, event))
+        self.dirty[agent] = None
+
+    def post_finish(self, node, retval):
+        agent = node.agent
+        self.agents[agent].append((node, retval))
+        self.dirty[agent] = None
+
+    def tick(self):
+        """
+        settle every dirty agent once
+        :return: number of agents settled
+        """
+        self.tick_count += 1
+        m = self.metrics
+        if m is not None:
+            t0 = m.clock()
+        dirty, self.dirty = self.dirty, {}
+        if self.predraw:
+            rand.predraw(dirty, self.predraw)
+        visits = 0
+        batch = self.pick_batch
+        spent = {}  # suspended agent -> visits so far
+        for agent in dirty:
+            if agent.world is not self:
+                continue
+            if batch is None or agent.recorder is not None:
+                visits += self.settle(agent, self.max_visits)
+                continue
+            n = self._batched(self._settle, agent, self.max_visits)
+            visits += n
+            if agent.suspended:
+                spent[agent] = n
+        while spent:
+            batch.pick()
+            suspended, spent = spent, {}
+            for agent, n in suspended.items():
+                if agent.world is not self:
+                    continue  # removed, its pick was made then
+                budget = None if self.max_visits is None else self.max_visits - n
+                k = self._batched(self._resume, agent, budget)
+                visits += k
+                if agent.suspended:
+                    spent[agent] = n + k
+        self.last_settled = len(dirty)
+        self.last_visits = visits
+        if m is not None:
+            m.ticks.inc()
+            m.tick_time.observe(m.clock() - t0)
+            m.agents_settled.observe(len(dirty))
+            m.tick_visits.observe(visits)
+        return len(dirty)
+
+    def settle(self, agent, max_visits):
+        """
+        feed the inbox of an agent to it in order and poll, agent is kept
+        dirty if it runs out of budget
+        :return: number of visited nodes
+        """
+        if agent.recorder is not None:
+            return agent.recorder.record_settle(self._settle, agent, max_visits)
+        return self._settle(agent, max_visits)
+
+    def _batched(self, f, agent, max_visits):
+        agent.pick_batch = self.pick_batch
+        visits = f(agent, max_visits)
+        agent.pick_batch = None
+        return visits
+
+    def _resume(self, agent, max_visits):
+        # go on from the Probability node the agent stopped at, as poll
+        # would have if the pick had been made at once
+        visits = agent.poll_fronts(max_visits)
+        if agent.suspended:
+            return visits
+        if max_visits is not None:
+            max_visits -= visits
+        return visits + self._settle(agent, max_visits)
+
+    def _settle(self, agent, max_visits):
+        inbox = self.agents[agent]
+        visits = agent.poll(max_visits)
+        while len(inbox) and not agent.suspended and \
+                (max_visits is None or visits < max_visits):
+            node, v = inbox.popleft()
+            if node is None:
+                agent.event_queue.append(v)
+            elif node.state != node.DEAD:
+                node._quick_finish(v)
+            if max_visits is None:
+                visits += agent.poll()
+            else:
+                visits += agent.poll(max_visits - visits)
+        if agent.suspended:
+            return visits  # settled on once the pick is made, see tick
+        if len(inbox) or agent.has_pending():
+            self.dirty[agent] = None
+        return visits
@@ -0,0 +1,87 @@
+# -*- encoding: utf-8 -*-
+"""
+python run.py ai2.test.bench_debug_hooks
+"""
+import time
+
+import ai2.runtime.nodes as nodes
+import ai2.runtime.loader as loader
+from ai2.runtime.action_agent import ActionAgent
+
+TREE = "sequence_test.sequence_test0_btree"
+TRANSITIONS = 1000000
+ROUNDS = 10000
+REPEAT = 3
+
+
+class PropertyNode(nodes.Node):
+    """
+    state setter as it was before debug hooks were split into DebugHooks
+    """
+    __slots__ = ("_state",)
+
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        if value in self.DEBUG_STATES:
+            self._state = value
+            if value in self.READY_STATES:
+                self.agent.ready_queue.append(self)
+            if self.agent.debugger:
+                self.agent.debugger.check_debug(self)
+
+
+class NullDebugger(object):
+    def check_debug(self, node):
+        pass
+
+
+def bench_transitions(clz, agent):
+    node = clz(None, 0, None, agent)
+    states = (node.ENTERING, node.BLOCKING, node.LEAVING, node.DEAD)
+    best = None
+    for _ in range(0, REPEAT):
+        t0 = time.perf_counter()
+        for _ in range(0, TRANSITIONS // len(states)):
+            for s in states:
+                node.state = s
+        t = time.perf_counter() - t0
+        if best is None or t < best:
+            best = t
+    return best / TRANSITIONS * 1e9
+
+
+def bench_tree(debugger):
+    best = None
+    for _ in range(0, REPEAT):
+        ta = ActionAgent()
+        if debugger:
+            ta.attach_debugger(debugger)
+        ta.set_fsm("common.simple_fsm")
+        ta.blackboard["test_tree"] = TREE
+        ta.enable(True)
+        t0 = time.perf_counter()
+        for _ in range(0, ROUNDS):
+            ta.fire_event("goon")
+        t = time.perf_counter() - t0
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def run():
+    loader.prefix = "ai2.test."
+    agent = ActionAgent()
+    print("per state transition:")
+    print("  plain node        %.1fns" % bench_transitions(nodes.Node, agent))
+    print("  old property      %.1fns" % bench_transitions(PropertyNode, agent))
+    agent.attach_debugger(NullDebugger())
+    variant = nodes.get_variant(nodes.Node, agent.node_mixins)
+    print("  debug hooks       %.1fns" % bench_transitions(variant, agent))
+    print("  old property+dbg  %.1fns" % bench_transitions(PropertyNode, agent))
+    print("%d rounds of %s:" % (ROUNDS, TREE))
+    print("  no debugger       %.3fs" % bench_tree(None))
+    print("  null debugger     %.3fs" % bench_tree(NullDebugger()))
@@ -0,0 +1,50 @@
+# -*- encoding: utf-8 -*-
+"""
+python run.py ai2.test.bench_jit
+"""
+import time
+
+import ai2.runtime.loader as loader
+from ai2.runtime.action_agent import ActionAgent
+
+TREES = (
+    "sequence_test.sequence_test0_btree",
+    "select_test.select_test0_btree",
+    "until_test.until_test_btree",
+)
+ROUNDS = 10000
+REPEAT = 3
+
+
+def bench_tree(tree_name, use_jit):
+    loader.use_jit = use_jit
+    tree = loader.load_btree(tree_name, force=True)
+    compiled = len([i for i in tree.nodes if i.jit is not None])
+    best = None
+    for _ in range(0, REPEAT):
+        ta = ActionAgent()
+        ta.set_fsm("common.simple_fsm")
+        ta.blackboard["test_tree"] = tree_name
+        ta.enable(True)
+        # every goon restarts the tree from the real root
+        t0 = time.perf_counter()
+        for _ in range(0, ROUNDS):
+            ta.fire_event("goon")
+        t = time.perf_counter() - t0
+        if best is None or t < best:
+            best = t
+    return best, compiled
+
+
+def run():
+    loader.prefix = "ai2.test."
+    try:
+        for tree_name in TREES:
+            t_interp, _ = bench_tree(tree_name, False)
+            t_jit, compiled = bench_tree(tree_name, True)
+            print("%-40s compiled subtrees %d  interpreted %.3fs  jit %.3fs  speedup x%.2f" % (
+                tree_name, compiled, t_interp, t_jit, t_interp / t_jit))
+    finally:
+        loader.use_jit = False
+        for tree_name in TREES:
+            loader.load_btree(tree_name, force=True)
@@ -0,0 +1,32 @@
+info = __file__
+
+
+NT_ACT2 = ('NT_ACT',
+ (['wait_blackboard_enter',
+   ('PAR_CONST', 'flag')],
+  ['wait_blackboard_leave']),
+ (),
+ '')
+
+
+NT_COMP3 = ('NT_COMP',
+ (compile('ret = flag', "<string>", "exec"),
+  [['PAR_BB', 'flag', 'flag']],
+  [['PAR_BB', 'ret', 'ret']]),
+ (),
+ '')
+
+
+NT_WAIT4 = ('NT_WAIT', 'goon', (), '')
+
+
+NT_SEQ1 = ('NT_SEQ',
+ (),
+ (NT_ACT2, NT_COMP3, NT_WAIT4),
+ '')
+
+
+NT_ROOT0 = ('NT_ROOT', (), (NT_SEQ1,), '')
+
+
+root = NT_ROOT0
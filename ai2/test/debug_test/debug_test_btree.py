@@ -0,0 +1,28 @@
+# -*- encoding: utf-8 -*-
+__src_file__ = 'debug_test.btree'
+
+NT_ACT2 = ('NT_ACT',
+ (['nop_enter'], ['']),
+ (),
+ (__src_file__, 2))
+
+
+NT_ACT3 = ('NT_ACT',
+ (['nop_enter'], ['']),
+ (),
+ (__src_file__, 3))
+
+
+NT_WAIT4 = ('NT_WAIT', 'goon', (), (__src_file__, 4))
+
+
+NT_SEQ1 = ('NT_SEQ',
+ (),
+ (NT_ACT2, NT_ACT3, NT_WAIT4),
+ (__src_file__, 1))
+
+
+NT_ROOT0 = ('NT_ROOT', (), (NT_SEQ1,), (__src_file__, 0))
+
+
+root = NT_ROOT0
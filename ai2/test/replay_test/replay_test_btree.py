@@ -0,0 +1,64 @@
+info = __file__
+
+
+NT_ACT2 = ('NT_ACT',
+ (['aim_enter',
+   ('PAR_PROP', 'power')],
+  ['aim_leave']),
+ (),
+ '')
+
+
+NT_COND4 = ('NT_COND',
+ (compile('danger > 1', "<string>", "eval"),
+  [['PAR_PROP', 'danger', 'danger']]),
+ (),
+ '')
+
+
+NT_ALWAYS3 = ('NT_ALWAYS', True, (NT_COND4,), '')
+
+
+NT_COMP6 = ('NT_COMP',
+ (compile('total = total + 1', "<string>", "exec"),
+  [['PAR_BB', 'total', 'total']],
+  [['PAR_BB', 'total', 'total']]),
+ (),
+ '')
+
+
+NT_COMP7 = ('NT_COMP',
+ (compile('total = total + 10', "<string>", "exec"),
+  [['PAR_BB', 'total', 'total']],
+  [['PAR_BB', 'total', 'total']]),
+ (),
+ '')
+
+
+NT_COMP8 = ('NT_COMP',
+ (compile('total = total + 100', "<string>", "exec"),
+  [['PAR_BB', 'total', 'total']],
+  [['PAR_BB', 'total', 'total']]),
+ (),
+ '')
+
+
+NT_PSEL5 = ('NT_PSEL',
+ (1.0, 2.0, 3.0),
+ (NT_COMP6, NT_COMP7, NT_COMP8),
+ '')
+
+
+NT_WAIT9 = ('NT_WAIT', 'goon', (), '')
+
+
+NT_SEQ1 = ('NT_SEQ',
+ (),
+ (NT_ACT2, NT_ALWAYS3, NT_PSEL5, NT_WAIT9),
+ '')
+
+
+NT_ROOT0 = ('NT_ROOT', (), (NT_SEQ1,), '')
+
+
+root = NT_ROOT0
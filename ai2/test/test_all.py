@@ -1,8 +1,35 @@
+import os
 import sys
+import json
+import socket
+import tempfile
+import importlib
+import time
 import logging
 
 import ai2.runtime.loader as loader
-import ai2.runtime.agent as agent
+import ai2.runtime.defs as defs
+import ai2.runtime.action_agent as action_agent
+import ai2.runtime.nodes as nodes
+import ai2.runtime.world as world
+import ai2.runtime.shard as shard
+import ai2.runtime.expr as expr
+import ai2.runtime.blackboard as blackboard
+import ai2.runtime.debug_stub as debug_stub
+import ai2.runtime.mode as mode
+import ai2.runtime.debug_protocol as debug_protocol
+import ai2.runtime.profiler as profiler
+import ai2.runtime.metrics as metrics
+import ai2.runtime.replay as replay
+import ai2.runtime.rand as rand
+import ai2.runtime.sampling as sampling
+import ai2.runtime.dispatch as dispatch
+import ai2.runtime.props as props
+import ai2.runtime.flyweight as flyweight
+import ai2.tools.console_debugger.debugger as debugger
+import ai2.tools.bundle_exporter.exporter as bundle_exporter
+import ai2.bench.generator as bench_generator
+import ai2.bench.suite as bench_suite
 
 logger = logging.getLogger("ai")
 
@@ -12,7 +39,7 @@ def state_machine0():
     this test 1 level state and fire_event triggered state transition
     """
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.set_fsm("state_machine_test.two_states_fsm")
     ta.enable(True)
     assert(ta.blackboard["current_state"]) == "start"
@@ -32,7 +59,7 @@ def state_machine1():
     this test multi level states and state transition
     """
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.set_fsm("state_machine_test.lv0_fsm")
     ta.enable(True)
     assert(ta.blackboard["state"]) == "s00"
@@ -46,9 +73,22 @@ def state_machine1():
     assert(ta.blackboard["state"]) == "s02"
 
 
+def state_machine2():
+    logger.debug(">>>>")
+    desc = loader.load_fsm("state_machine_test.lv0_fsm")
+    assert(desc.transitions == ({"e1": 1}, {"e2": 2, "e3": 2}, {}))
+    ta = action_agent.ActionAgent()
+    ta.set_fsm("state_machine_test.lv0_fsm")
+    ta.enable(True)
+    f = ta.fsm_stack[0]
+    assert(f.try_receive_event("e1") == (True, 1))
+    assert(f.try_receive_event("e2") == (False, None))
+    assert(f.try_receive_event("unknown") == (False, None))
+
+
 def sequence0():
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.blackboard["test_tree"] = "sequence_test.sequence_test0_btree"
     ta.set_fsm("common.simple_fsm")
     ta.enable(True)
@@ -58,7 +98,7 @@ def sequence0():
 
 def sequence1():
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.blackboard["test_tree"] = "sequence_test.sequence_test1_btree"
     ta.set_fsm("common.simple_fsm")
     ta.enable(True)
@@ -68,20 +108,22 @@ def sequence1():
 
 def random_sequence0():
     logger.debug(">>>>")
-    results = set()
-    for i in range(0, 100):
-        ta = agent.ActionAgent()
+    def play(seed):
+        ta = action_agent.ActionAgent()
+        ta.seed_rng(seed)
         ta.set_fsm("common.simple_fsm")
         ta.blackboard["test_tree"] = "random_sequence_test.random_sequence_test_btree"
         ta.enable(True)
-        results.add(ta.blackboard["ret"])
-    logger.debug("WARNING: this is not a strict test and you have to be very unlucky not to pass it")
-    assert(len(results) == 6)
+        return ta.blackboard["ret"]
+    results = [play(i) for i in range(0, 100)]
+    assert(len(set(results)) == 6)
+    # the order only depends on the seed
+    assert(results == [play(i) for i in range(0, 100)])
 
 
 def select0():
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.set_fsm("common.simple_fsm")
     ta.blackboard["test_tree"] = "select_test.select_test0_btree"
     ta.enable(True)
@@ -91,7 +133,7 @@ def select0():
 
 def select1():
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.set_fsm("common.simple_fsm")
     ta.blackboard["test_tree"] = "select_test.select_test1_btree"
     ta.enable(True)
@@ -100,21 +142,143 @@ def select1():
 
 def probability0():
     logger.debug(">>>>")
-    results = {0:0, 1:0, 2:0}
-    for i in range(0, 100):
-        ta = agent.ActionAgent()
-        ta.set_fsm("common.simple_fsm")
-        ta.blackboard["test_tree"] = "probability_test.probability_test_btree"
-        ta.enable(True)
-        k = ta.blackboard["ret"]
-        results[k] += 1
-    logger.debug("WARNING: this is not a strict test and you have to be very unlucky not to pass it")
+    def play(seed):
+        results = {0:0, 1:0, 2:0}
+        for i in range(0, 100):
+            ta = action_agent.ActionAgent()
+            ta.seed_rng(i, seed)
+            ta.set_fsm("common.simple_fsm")
+            ta.blackboard["test_tree"] = "probability_test.probability_test_btree"
+            ta.enable(True)
+            k = ta.blackboard["ret"]
+            results[k] += 1
+        return results
+    results = play(0)
     assert(results[0] < results[1])
     assert(results[1] < results[2])
+    assert(results == play(0))
+
+def rand0():
+    logger.debug(">>>>")
+    r0 = rand.AgentRandom(5)
+    r1 = rand.AgentRandom(5)
+    r1.predraw(10)
+    state = r1.getstate()
+    l0, l1 = list(range(0, 20)), list(range(0, 20))
+    r0.shuffle(l0)
+    r1.shuffle(l1)
+    assert(l0 == l1 and l0 != list(range(0, 20)))
+    assert([r0.random() for _ in range(0, 5)] == [r1.random() for _ in range(0, 5)])
+    r1.setstate(state)
+    r1.shuffle(l1)
+    r0.setstate(state)
+    r0.shuffle(l0)
+    assert(l0 == l1)
+    a0, a1, a2 = action_agent.ActionAgent(), action_agent.ActionAgent(), action_agent.ActionAgent()
+    a0.seed_rng("tank1")
+    a1.seed_rng("tank1")
+    a2.seed_rng("tank2")
+    assert(a0.rng.random() == a1.rng.random() != a2.rng.random())
+    assert(action_agent.ActionAgent().rng.random() != action_agent.ActionAgent().rng.random())
+
+    # pre-drawing in bulk does not change what the agents do
+    def play(predraw):
+        w = world.World(predraw=predraw)
+        agents = []
+        for i in range(0, 10):
+            ta = action_agent.ActionAgent()
+            ta.seed_rng(i)
+            ta.set_fsm("common.simple_fsm")
+            ta.blackboard["test_tree"] = "probability_test.probability_test_btree"
+            w.add_agent(ta)
+            ta.enable(True)
+            agents.append(ta)
+        rets = []
+        for _ in range(0, 10):
+            for ta in agents:
+                ta.fire_event("goon")
+            w.tick()
+            rets.append([ta.blackboard["ret"] for ta in agents])
+        return rets
+    assert(play(0) == play(3))
+
+def sampling0():
+    logger.debug(">>>>")
+    weights = (1.0, 3.0, 6.0, 0.0, 2.0)
+    table = sampling.AliasTable(weights)
+    n = 1200
+    us = [(i + 0.5) / n for i in range(0, n)]
+    picks = table.pick_many(us)
+    assert([int(i) for i in picks] == [table.pick(u) for u in us])
+    for i, w in enumerate(weights):
+        count = len([j for j in picks if j == i])
+        assert(abs(count - n * w / sum(weights)) <= len(weights))
+    assert(table.pick(1.0 - 2 ** -53) == table.pick(0.999999))
+    cumulative = sampling.AliasTable.from_cumulative((1.0, 4.0, 10.0))
+    assert(cumulative.prob == sampling.AliasTable((1.0, 3.0, 6.0)).prob)
+    # zero weights keep picking the first child
+    zero = sampling.AliasTable.from_cumulative((0.0, 0.0, 0.0))
+    assert(set(zero.pick(u) for u in us + [1.0 - 2 ** -53]) == set([0]))
+    tree = loader.load_btree("probability_test.probability_test_btree")
+    psel = [i for i in tree.nodes if i.category == defs.NT_PSEL][0]
+    assert(psel.alias.n == 3)
+
+def batch_picks0():
+    logger.debug(">>>>")
+    # picks made in bulk do not change what the agents do, in which order
+    class ActionLog(bench_suite.BenchAgent):
+        def __init__(self):
+            super(ActionLog, self).__init__()
+            self.log = []
+
+        def bench_sync(self, node):
+            self.log.append(("enter", node.desc.debug_info))
+            node.finish(True)
+
+        def bench_async(self, node):
+            self.log.append(("enter", node.desc.debug_info))
+            super(ActionLog, self).bench_async(node)
+
+        def bench_async_leave(self, node):
+            self.log.append(("leave", node.desc.debug_info))
+
+    def actions(fsm_name, seed, batch_picks):
+        w = world.World(batch_picks=batch_picks)
+        agents = []
+        for i in range(0, 10):
+            a = ActionLog()
+            a.flyweight = False  # flyweights pick inline
+            a.seed_rng(i, seed)
+            a.blackboard["x"] = (i % 10) / 10.0
+            a.set_fsm(fsm_name)
+            a.enable(True)
+            w.add_agent(a)
+            agents.append(a)
+        bench_suite.drive(w, agents, 10, seed)
+        # leaving the world picks what is left
+        w.remove_agent(agents[0])
+        return [a.log for a in agents]
+
+    calls = []
+    pick_many = sampling.AliasTable.pick_many
+    def counting_pick_many(table, us):
+        calls.append(len(us))
+        return pick_many(table, us)
+    old_prefix, loader.prefix = loader.prefix, ""
+    sampling.AliasTable.pick_many = counting_pick_many
+    try:
+        for name, depth, fanout, mix in bench_suite.SCENARIOS[1:]:
+            for seed in range(0, 3):
+                fsm_name, _ = bench_suite.prepare("picks_" + name, depth, fanout, mix, seed)
+                assert(actions(fsm_name, seed, True) == actions(fsm_name, seed, False))
+    finally:
+        sampling.AliasTable.pick_many = pick_many
+        loader.prefix = old_prefix
+    assert(calls and max(calls) > 1)
 
 def ifelse0():
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.set_fsm("common.simple_fsm")
     ta.blackboard["test_tree"] = "if_else_test.if_else_test0_btree"
     ta.enable(True)
@@ -122,7 +286,7 @@ def ifelse0():
 
 def ifelse1():
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.set_fsm("common.simple_fsm")
     ta.blackboard["test_tree"] = "if_else_test.if_else_test1_btree"
     ta.enable(True)
@@ -130,7 +294,7 @@ def ifelse1():
 
 def ifelse2():
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.set_fsm("common.simple_fsm")
     ta.blackboard["test_tree"] = "if_else_test.if_else_test2_btree"
     ta.blackboard["tv"] = 2
@@ -142,7 +306,7 @@ def ifelse2():
 
 def parallel0():
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.set_fsm("common.simple_fsm")
     ta.blackboard["test_tree"] = "parallel_test.parallel_test0_btree"
     ta.enable(True)
@@ -157,7 +321,7 @@ def parallel0():
 
 def parallel1():
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.set_fsm("common.simple_fsm")
     ta.blackboard["test_tree"] = "parallel_test.parallel_test1_btree"
     ta.enable(True)
@@ -173,7 +337,7 @@ def parallel1():
 
 def parallel2():
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.set_fsm("common.simple_fsm")
     ta.blackboard["test_tree"] = "parallel_test.parallel_test2_btree"
     ta.enable(True)
@@ -187,9 +351,184 @@ def parallel2():
     assert(ta.blackboard[33] is False)
     ta.fire_event("timeout")
 
+def event_index0():
+    logger.debug(">>>>")
+    ta = action_agent.ActionAgent()
+    ta.set_fsm("common.simple_fsm")
+    ta.blackboard["test_tree"] = "parallel_test.parallel_test0_btree"
+    ta.enable(True)
+    assert(list(ta.event_waiters.keys()) == ["timeout"])
+
+    ta.fire_event("goon")  # nobody is waiting for it yet
+    assert(list(ta.event_waiters.keys()) == ["timeout"])
+    ta.fire_event("timeout")
+    assert(list(ta.event_waiters.keys()) == ["goon"])
+    ta.enable(False)
+    assert(len(ta.event_waiters) == 0)
+
+def ready_queue0():
+    logger.debug(">>>>")
+    ta = action_agent.ActionAgent()
+    ta.set_fsm("common.simple_fsm")
+    ta.blackboard["test_tree"] = "parallel_test.parallel_test1_btree"
+    ta.enable(True)
+    # settled: everything left on the fronts is blocking
+    assert(len(ta.ready_queue) == 0)
+    assert(ta.is_ready() == False)
+
+    ta.blackboard[22][0](False)
+    assert(len(ta.ready_queue) == 0)
+    assert(ta.is_ready() == False)
+
+def descriptor0():
+    logger.debug(">>>>")
+    tree = loader.load_btree("sequence_test.sequence_test0_btree")
+    root = loader.get_root_desc("sequence_test.sequence_test0_btree")
+    assert(root is tree.root)
+    assert(tree.nodes[-1] is root)
+    seq = root.children[0]
+    assert(seq.node_class is nodes.Sequence)
+    act = seq.children[0].children[0]
+    assert(act.enter_action == ("nop_enter", ()))
+    assert(act.leave_action == ("", ()))
+    try:
+        root.data = None
+        assert False
+    except AttributeError:
+        pass
+
+    ta = action_agent.ActionAgent()
+    ta.blackboard["test_tree"] = "sequence_test.sequence_test0_btree"
+    ta.set_fsm("common.simple_fsm")
+    ta.enable(True)
+    assert(ta.btree.desc is root)
+
+def pool0():
+    logger.debug(">>>>")
+    ta = action_agent.ActionAgent()
+    ta.blackboard["test_tree"] = "sequence_test.sequence_test0_btree"
+    ta.set_fsm("common.simple_fsm")
+    ta.enable(True)
+    # the real root restarts its child each time the tree finishes
+    for i in range(0, 4):
+        if i == 1:
+            misses = ta.node_pool.misses
+        ta.blackboard["count0"] = 0
+        ta.fire_event("goon")
+        assert(ta.blackboard["count0"] == 13)
+    stats = ta.node_pool.get_stats()
+    assert(stats["hits"] > 0)
+    # only action nodes are allocated once the pool is warm
+    assert(stats["misses"] - misses == 3 * 2)
+    ta.enable(False)
+    assert(ta.node_pool.get_stats()["free"] > 0)
+
+    # a released node is held back while a stale queue entry may refer to it
+    ta.node_pool.flush()
+    root = loader.get_root_desc("sequence_test.sequence_test0_btree")
+    n = ta.node_pool.acquire(nodes.Root, None, 0, root, ta)
+    ta.ready_queue.append(n)
+    n.state = n.DEAD
+    ta.fronts.discard(n)
+    ta.node_pool.release(n)
+    assert(ta.node_pool.get_stats()["held"] == 1)
+    other = ta.node_pool.acquire(nodes.Root, None, 0, root, ta)
+    assert(other is not n)
+    other.state = other.DEAD
+    ta.fronts.discard(other)
+    assert(ta.poll_fronts() == 0)
+    assert(ta.node_pool.acquire(nodes.Root, None, 0, root, ta) is n)
+
+def world0():
+    logger.debug(">>>>")
+    w = world.World()
+    agents = []
+    for i in range(0, 3):
+        ta = action_agent.ActionAgent()
+        ta.set_fsm("common.simple_fsm")
+        ta.blackboard["test_tree"] = "parallel_test.parallel_test1_btree"
+        w.add_agent(ta)
+        ta.enable(True)
+        agents.append(ta)
+    # nothing happens until the world ticks
+    assert(22 not in agents[0].blackboard)
+    assert(w.tick() == 3)
+    for ta in agents:
+        assert(ta.blackboard[22][1] == True)
+        assert(ta.is_ready() == False)
+
+    # finishing from outside is deferred as well
+    agents[1].blackboard[22][0](False)
+    assert(agents[1].blackboard[22] is not False)
+    assert(w.tick() == 1)
+    assert(agents[1].blackboard[22] is False)
+    assert(agents[1].blackboard[33] is False)
+    assert(agents[0].blackboard[22][1] == True)
+    assert(w.tick() == 0)
+
+def world1():
+    logger.debug(">>>>")
+    w = world.World(max_visits=2)
+    ta = action_agent.ActionAgent()
+    ta.set_fsm("common.simple_fsm")
+    ta.blackboard["test_tree"] = "sequence_test.sequence_test0_btree"
+    w.add_agent(ta)
+    ta.enable(True)
+    ticks = 0
+    while w.tick():
+        assert(w.last_visits <= 2)
+        ticks += 1
+    assert(ticks > 1)
+    assert(ta.blackboard["count0"] == 13)
+    assert(ta.blackboard["count1"] == 14)
+
+def shard0():
+    logger.debug(">>>>")
+
+    def run_sharded(n_workers):
+        sw = shard.ShardedWorld(shard.RemoteActionAgent, n_workers, seed=7)
+        sw.start()
+        ids = ["tank%d" % i for i in range(0, 8)]
+        for i in ids:
+            sw.add_agent(i, "common.simple_fsm", {"test_tree": "shard_test.shard_test_btree"})
+        reports = dict((i, []) for i in ids)
+        for _ in range(0, 5):
+            for c in sw.tick():
+                if c.method_name == "report":
+                    reports[c.agent_id].append(c.args[0])
+                    sw.finish(c.agent_id, c.token, True)
+            calls = sw.tick()
+            assert(len(calls) == len(ids))
+            assert(all(c.method_name == "report_stop" for c in calls))
+            for i in ids:
+                sw.fire_event(i, "goon")
+        sw.stop()
+        return reports
+
+    r0 = run_sharded(1)
+    r1 = run_sharded(3)
+    assert(r0 == r1)
+    for v in r0.values():
+        assert(len(v) == 5)
+    assert(len(set(tuple(v) for v in r0.values())) > 1)
+
+    # a dead worker is reported instead of blocking the host forever
+    sw = shard.ShardedWorld(shard.RemoteActionAgent, 2)
+    sw.POLL_INTERVAL = 0.05
+    sw.start()
+    sw.tick()
+    sw.workers[1].terminate()
+    sw.workers[1].join()
+    try:
+        sw.tick()
+        assert(False)
+    except RuntimeError as e:
+        assert("worker 1 " in str(e))
+    sw.stop()
+
 def until0():
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.set_fsm("common.simple_fsm")
     ta.blackboard["test_tree"] = "until_test.until_test_btree"
     ta.enable(True)
@@ -197,7 +536,7 @@ def until0():
 
 def not0():
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.set_fsm("common.simple_fsm")
     ta.blackboard["test_tree"] = "not_test.not_test_btree"
     ta.enable(True)
@@ -205,7 +544,7 @@ def not0():
 
 def always0():
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.set_fsm("common.simple_fsm")
     ta.blackboard["test_tree"] = "always_test.always_test0_btree"
     ta.enable(True)
@@ -213,7 +552,7 @@ def always0():
 
 def always1():
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.set_fsm("common.simple_fsm")
     ta.blackboard["test_tree"] = "always_test.always_test1_btree"
     ta.enable(True)
@@ -221,7 +560,7 @@ def always1():
 
 def call0():
     logger.debug(">>>>")
-    ta = agent.ActionAgent()
+    ta = action_agent.ActionAgent()
     ta.set_fsm("common.simple_fsm")
     ta.blackboard["test_tree"] = "call_test.call_test0_btree"
     ta.enable(True)
@@ -229,12 +568,813 @@ def call0():
     assert(ta.blackboard["cnt1"] == 4)
 
 
+def expression0():
+    logger.debug(">>>>")
+    sources = (
+        ("a + b > c", "eval"),
+        ("y = a * b", "exec"),
+        ("if a > 0:\n    t = a\ny = t", "exec"),
+        ("y = a\nz = a", "exec"))
+
+    def check(functions):
+        code = compile("a + b > c", "<string>", "eval")
+        src = [["PAR_BB", "x", "a"], ["PAR_CONST", 2, "b"], ["PAR_PROP", "limit", "c"]]
+        e = expr.bind(code, src)
+        assert((e.func is not None) == functions)
+        assert(e is expr.bind(code, [tuple(i) for i in src]))
+
+        class PropAgent(action_agent.ActionAgent):
+            limit = 3
+        ta = PropAgent()
+        ta.blackboard["x"] = 2
+        assert(ta.condition(e) is True)
+        assert(ta.evaluate(code, src) is True)
+        ta.blackboard["x"] = 1
+        assert(ta.condition(e) is False)
+
+        code = compile("y = a * b", "<string>", "exec")
+        e = expr.bind(code, src[:2], [["PAR_BB", "y", "y"], ["PAR_PROP", "limit", "y"]])
+        ta.compute(e)
+        assert(ta.blackboard["y"] == 2)
+        assert(ta.limit == 2)
+
+        # locals are not shared by the agents running an expression
+        code = compile("if a > 0:\n    t = a\ny = t", "<string>", "exec")
+        e = expr.bind(code, [["PAR_BB", "x", "a"]], [["PAR_BB", "y", "y"]])
+        ta.compute(e)
+        assert(ta.blackboard["y"] == 1)
+        tb = PropAgent()
+        tb.blackboard["x"] = 0
+        try:
+            tb.compute(e)
+            assert(False)
+        except NameError:
+            pass
+        # nor by re-entrant runs, started here by a watcher of an output
+        code = compile("y = a\nz = a", "<string>", "exec")
+        e = expr.bind(code, [["PAR_BB", "x", "a"]], [["PAR_BB", "y", "y"], ["PAR_BB", "z", "z"]])
+        tb.blackboard["x"] = 5
+        ta.blackboard.watch("y", lambda value: tb.compute(e))
+        ta.blackboard["x"] = 3
+        ta.compute(e)
+        assert(ta.blackboard["z"] == 3 and tb.blackboard["z"] == 5)
+
+    # without their source expressions are run by exec
+    check(False)
+    # with it as functions of their inputs
+    expr._bindings.clear()
+    expr.register_sources([(i, "<string>", mode) for i, mode in sources])
+    check(True)
+    tree = loader.load_btree("if_else_test.if_else_test2_btree")
+    assert(all(i.expr.func is not None for i in tree.nodes if i.expr is not None))
+
+def blackboard0():
+    logger.debug(">>>>")
+    bb = blackboard.Blackboard({"a": 1})
+    assert(bb["a"] == 1)
+    assert(bb.get_slot(blackboard.slot_of("a")) == 1)
+    assert("b" not in bb)
+    try:
+        bb["b"]
+        assert False
+    except KeyError:
+        pass
+    changes = []
+    handle = bb.watch("a", changes.append)
+    bb["a"] = 1
+    bb["a"] = 2
+    bb.unwatch(handle)
+    bb["a"] = 3
+    assert(changes == [2])
+    assert(sorted(bb.items()) == [("a", 3)])
+
+    ta = action_agent.ActionAgent()
+    ta.set_fsm("common.simple_fsm")
+    ta.blackboard["test_tree"] = "blackboard_test.blackboard_test_btree"
+    ta.enable(True)
+    assert("ret" not in ta.blackboard)
+    assert(ta.blackboard.is_watched("flag"))
+    ta.blackboard["flag"] = 7
+    assert(ta.blackboard["ret"] == 7)
+    assert(not ta.blackboard.is_watched("flag"))
+
+def trace0():
+    logger.debug(">>>>")
+    stub = debug_stub.DebugStub(0)
+    try:
+        ta = action_agent.ActionAgent()
+        ta.debug_id = "trace0"
+        stub.add_agent(ta)
+        info = ta.debugger
+        info.trace = debug_stub.TraceBuffer(8)
+        assert(stub.track_agent("trace0", True))
+        ta.set_fsm("common.simple_fsm")
+        ta.blackboard["test_tree"] = "sequence_test.sequence_test0_btree"
+        ta.enable(True)
+        written = info.trace.written
+        assert(written > 8)
+        track = stub.get_agent_track("trace0")
+        # the slot of the next record is never read back
+        assert(len(track) == 7)
+        assert(info.lost == written - 7)
+        assert(track[-1][1] == nodes.Node.BLOCKING)
+        assert(stub.get_agent_track("trace0") == [])
+        ta.fire_event("goon")
+        assert(len(stub.get_agent_track("trace0")) == 7)
+    finally:
+        stub.stop()
+
+def debug_server0():
+    logger.debug(">>>>")
+    stub = debug_stub.DebugStub(0, "127.0.0.1")
+    stub.run()
+    client = debugger.DebugClient("127.0.0.1", stub.port)
+    try:
+        ta = action_agent.ActionAgent()
+        ta.debug_id = "server0"
+        stub.add_agent(ta)
+        assert(client.connect() == (True, debug_protocol.VERSION))
+        assert(client.get_agent_list() == ["server0"])
+        client.set_agent_id("nobody")
+        assert(client.track_agent(True) is False)
+        client.set_agent_id("server0")
+        assert(client.track_agent(True) is True)
+        assert(ta.debugger.tracked)
+        ta.set_fsm("common.simple_fsm")
+        ta.blackboard["test_tree"] = "sequence_test.sequence_test0_btree"
+        ta.enable(True)
+        expected = ta.debugger.trace.written
+        data = []
+        while len(data) < expected:
+            assert(client.get_agent_track(5.0))
+            data += client.take_data()
+        assert(len(data) == expected and client.lost == 0)
+        assert(data[-1] == ("server0", "", nodes.Node.BLOCKING))
+        assert(client.track_agent(False) is True)
+        assert(not ta.debugger.tracked)
+    finally:
+        client.finish()
+        stub.stop()
+
+def debug_server1():
+    logger.debug(">>>>")
+    # malformed frames close the connection that sent them only
+    stub = debug_stub.DebugStub(0)
+    stub.run()
+    client = debugger.DebugClient("127.0.0.1", stub.port)
+    try:
+        ta = action_agent.ActionAgent()
+        ta.debug_id = "server1"
+        stub.add_agent(ta)
+        P = debug_protocol
+        for frame in (
+                P.pack_message(P.MSG_SUBSCRIBE, "a"),
+                P.pack_message(P.MSG_SUBSCRIBE, "server1", True, {"evil": [1]}),
+                P.pack_message(P.MSG_SUBSCRIBE, "server1", True, {"lines": 3}),
+                P.pack_message(P.MSG_SUBSCRIBE, ["server1"], True, None),
+                P.HEADER.pack(3, P.MSG_LIST) + b"\xff\xff\xff",
+                P.HEADER.pack(2, P.MSG_LIST) + b"i\x01",
+                P.HEADER.pack(5, P.MSG_HELLO) + b"i\x05\x00\x00\x00"):
+            bad = socket.create_connection(("127.0.0.1", stub.port))
+            try:
+                bad.settimeout(5.0)
+                bad.sendall(frame)
+                assert(bad.recv(65536) == b"")
+            finally:
+                bad.close()
+        assert(stub.worker_thread.is_alive())
+        assert(client.connect() == (True, P.VERSION))
+        assert(client.get_agent_list() == ["server1"])
+        client.set_agent_id("server1")
+        assert(client.track_agent(True) is True)
+        assert(ta.debugger.filters == [None])
+    finally:
+        client.finish()
+        stub.stop()
+
+def debug_hooks0():
+    logger.debug(">>>>")
+
+    class Recorder(object):
+        def __init__(self):
+            self.states = []
+
+        def check_debug(self, node):
+            self.states.append(node.state)
+
+    ta = action_agent.ActionAgent()
+    ta.set_fsm("common.simple_fsm")
+    ta.blackboard["test_tree"] = "sequence_test.sequence_test0_btree"
+    ta.enable(True)
+    assert(all(type(n) in nodes._type_to_class.values() for n in ta.fronts))
+    r = Recorder()
+    ta.attach_debugger(r)
+    ta.fire_event("goon")
+    assert(nodes.Node.BLOCKING in r.states)
+    assert(all(isinstance(n, nodes.DebugHooks) for n in ta.fronts))
+    ta.detach_debugger()
+    del r.states[:]
+    ta.fire_event("goon")
+    assert(r.states == [])
+    mode.set_debug_hooks(False)
+    try:
+        ta.attach_debugger(r)
+        assert(ta.node_mixins == ())
+    finally:
+        ta.detach_debugger()
+        mode.set_debug_hooks(True)
+
+def debug_filter0():
+    logger.debug(">>>>")
+    stub = debug_stub.DebugStub(0, "127.0.0.1")
+    stub.run()
+    client0 = debugger.DebugClient("127.0.0.1", stub.port)
+    client1 = debugger.DebugClient("127.0.0.1", stub.port)
+    try:
+        assert(client0.connect()[0] and client1.connect()[0])
+        entering = debug_protocol.TraceFilter(
+            files=["debug_test.btree"], lines=[3], states=[nodes.Node.ENTERING])
+        assert(client0.track_agents(None, True, entering) == [True])
+        agents = []
+        for i, tree in enumerate((
+                "debug_test.debug_test_btree",
+                "debug_test.debug_test_btree",
+                "sequence_test.sequence_test0_btree",
+                "debug_test.debug_test_btree")):
+            ta = action_agent.ActionAgent()
+            ta.debug_id = "filter%d" % i
+            ta.set_fsm("common.simple_fsm")
+            ta.blackboard["test_tree"] = tree
+            stub.add_agent(ta)
+            agents.append(ta)
+        # the subscription covers agents added after it
+        deadline = time.time() + 5.0
+        while not all(i.debugger.tracked for i in agents):
+            assert(time.time() < deadline)
+            time.sleep(0.01)
+        assert(client1.track_agents(["filter0"], True) == [True])
+        # tracked in process as well, every state is recorded
+        assert(stub.track_agent("filter3", True))
+        for ta in agents:
+            ta.enable(True)
+        # only what some subscription wants is recorded
+        assert(agents[1].debugger.trace.written == 1)
+        assert(agents[2].debugger.trace.written == 0)
+        full = agents[0].debugger.trace.written
+        assert(full > 1 and agents[3].debugger.trace.written == full)
+        data0 = []
+        data1 = []
+        while len(data0) < 3 or len(data1) < full:
+            assert(client0.get_agent_track(5.0) and client1.get_agent_track(5.0))
+            data0 += client0.take_data()
+            data1 += client1.take_data()
+        location = ("debug_test.btree", 3)
+        assert(sorted(data0) == [
+            ("filter0", location, nodes.Node.ENTERING),
+            ("filter1", location, nodes.Node.ENTERING),
+            ("filter3", location, nodes.Node.ENTERING)])
+        assert(len(data1) == full)
+        assert(("filter0", ("debug_test.btree", 4), nodes.Node.BLOCKING) in data1)
+    finally:
+        client0.finish()
+        client1.finish()
+        stub.stop()
+
+def profiler0():
+    logger.debug(">>>>")
+    p = profiler.Profiler()
+    agents = []
+    for tree in ("debug_test.debug_test_btree", "sequence_test.sequence_test0_btree"):
+        for _ in range(0, 2):
+            ta = action_agent.ActionAgent()
+            ta.attach_profiler(p)
+            ta.set_fsm("common.simple_fsm")
+            ta.blackboard["test_tree"] = tree
+            ta.enable(True)
+            ta.fire_event("goon")
+            agents.append(ta)
+    rows = dict(((r[0], r[1]), r) for r in p.get_node_stats())
+    # aggregated over agents, visited once per run of the tree
+    act = rows[(("debug_test.btree", 2), defs.NT_ACT)]
+    assert(act[2 + profiler.CALLS] == 4)
+    assert(act[2 + profiler.AGENT_ACTION] > 0)
+    collapsed = p.get_collapsed(1e-9)
+    prefix = "simple_fsm:default;NT_ROOT;NT_SEQ;NT_COMP;execute "
+    assert(any(i.startswith(prefix) for i in collapsed))
+    prefix = "simple_fsm:default;debug_test.btree:0 NT_ROOT;debug_test.btree:1 NT_SEQ;" \
+        "debug_test.btree:2 NT_ACT nop_enter;action:nop_enter "
+    assert(any(i.startswith(prefix) for i in collapsed))
+    assert(all(i.startswith("simple_fsm") for i in collapsed))
+    for ta in agents:
+        ta.detach_profiler()
+        ta.fire_event("goon")
+    assert(act[2 + profiler.CALLS] == 4)
+
+def metrics0():
+    logger.debug(">>>>")
+    registry = metrics.Registry()
+    w = world.World()
+    w.attach_metrics(registry)
+    for i in range(0, 2):
+        ta = action_agent.ActionAgent()
+        ta.attach_metrics(registry)
+        ta.set_fsm("common.simple_fsm")
+        ta.blackboard["test_tree"] = "sequence_test.sequence_test0_btree"
+        w.add_agent(ta)
+        ta.enable(True)
+        ta.fire_event("goon")
+        ta.fire_event("nobody")
+    w.tick()
+    ta = action_agent.ActionAgent()
+    ta.attach_metrics(registry)
+    ta.set_fsm("state_machine_test.two_states_fsm")
+    ta.enable(True)
+    ta.fire_event("e")
+    ta.fire_event("s")
+    snap = registry.snapshot()
+    counters = snap["counters"]
+    assert(counters["agent.events_fired"] == 6)
+    assert(counters["agent.events_swallowed"] == 2)
+    assert(counters["agent.events_unreceived"] == 2)
+    assert(counters["agent.fsm_transitions"] == 2)
+    assert(counters["world.ticks"] == 1)
+    histograms = snap["histograms"]
+    assert(histograms["world.agents_settled"]["max"] == 2)
+    assert(histograms["agent.action_latency"]["count"] > 0)
+    assert(histograms["agent.poll_visits"]["count"] > 0)
+    h = histograms["agent.fronts"]
+    assert(sum(h["counts"]) == h["count"])
+    assert(json.loads(registry.to_json()) == snap)
+    registry.reset()
+    assert(registry.snapshot()["counters"]["agent.events_fired"] == 0)
+
+class ReplayGameAgent(action_agent.ActionAgent):
+    """
+    an agent with game actions the replay does not have
+    """
+    def __init__(self):
+        super(ReplayGameAgent, self).__init__()
+        self.danger = 0
+        self.power = 0
+        self.aiming = None
+
+    def aim_enter(self, node, power):
+        self.aiming = node
+        self.blackboard["power"] = power
+        if power % 3 == 0:
+            node.finish(True)
+
+    def aim_leave(self, node):
+        self.fire_event("aimed")
+
+
+class StateCollector(object):
+    def __init__(self):
+        self.states = []
+
+    def check_debug(self, node):
+        self.states.append((node.desc.index, node.state))
+
+
+class ReplayPosition(object):
+    """
+    a game object kept in a blackboard
+    """
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __eq__(self, other):
+        return (self.x, self.y) == (other.x, other.y)
+
+
+def record_replay(use_world):
+    ga = ReplayGameAgent()
+    ga.blackboard["home"] = ReplayPosition(1, 2)
+    w = world.World() if use_world else None
+    if w:
+        w.add_agent(ga)
+    recorder = replay.Recorder(seed=7)
+    ga.attach_recorder(recorder)
+    collector = StateCollector()
+    ga.attach_debugger(collector)
+    ga.set_fsm("common.simple_fsm")
+    ga.blackboard["test_tree"] = "replay_test.replay_test_btree"
+    ga.blackboard["total"] = 0
+    ga.enable(True)
+    for i in range(0, 30):
+        ga.danger = i % 3
+        ga.power = i
+        if ga.aiming is not None and ga.aiming.state != nodes.Node.DEAD:
+            ga.aiming.finish(i % 2 == 0)
+        ga.fire_event("goon")
+        ga.blackboard["outside"] = i
+        target = ga.blackboard["target"] = ReplayPosition(i, -i)
+        target.x = None  # recorded as it was written
+        if w:
+            w.tick()
+    # values which can not be recorded fail when written, with their key
+    try:
+        ga.blackboard["callback"] = lambda: None
+        assert(False)
+    except ValueError as e:
+        assert("'callback'" in str(e))
+    log = recorder.get_log()
+    assert(log[3] and "danger" in log[4] and "power" not in log[4])
+    fd, path = tempfile.mkstemp(".ai2log")
+    os.close(fd)
+    try:
+        recorder.save(path)
+        ra = replay.ReplayAgent(replay.read_log(path))
+    finally:
+        os.remove(path)
+    assert(ra.blackboard["home"] == ReplayPosition(1, 2))
+    replayed = StateCollector()
+    ra.attach_debugger(replayed)
+    assert(ra.replay_all() == len(log[2]))
+    assert(replayed.states == collector.states)
+    for k in ("total", "power", "outside"):
+        assert(ra.blackboard[k] == ga.blackboard[k])
+    assert(ra.blackboard["target"] == ReplayPosition(29, -29))
+    return ga.blackboard["total"]
+
+def replay0():
+    logger.debug(">>>>")
+    total = record_replay(False)
+    # the choices of NT_PSEL depend on the recorded seed only
+    assert(total != 0 and total == record_replay(False))
+    record_replay(True)
+
+def dispatch0():
+    logger.debug(">>>>")
+    # actions are resolved when the tree is pushed, not when they are called
+    ta = action_agent.ActionAgent()
+    ta.set_fsm("common.simple_fsm")
+    ta.blackboard["test_tree"] = "replay_test.replay_test_btree"
+    try:
+        ta.enable(True)
+        assert(False)
+    except dispatch.LinkError as e:
+        assert("aim_enter" in str(e) and "aim_leave" in str(e))
+
+    ga0, ga1 = ReplayGameAgent(), ReplayGameAgent()
+    assert(ga0.action_links is ga1.action_links is not action_agent.ActionAgent().action_links)
+    tree = loader.load_btree("replay_test.replay_test_btree")
+    for ga in (ga0, ga1):
+        ga.set_fsm("common.simple_fsm")
+        ga.blackboard["test_tree"] = "replay_test.replay_test_btree"
+        ga.blackboard["total"] = 0
+        ga.power = 3
+        ga.enable(True)
+    table = ga0.action_links[tree]
+    act = [i for i in tree.nodes if i.category == defs.NT_ACT][0]
+    assert(table[act.index][0] is not None and table[act.index][1] is not None)
+    # PAR_PROP argument fetched for the linked call
+    assert(ga0.blackboard["power"] == 3 and ga0.blackboard["total"] > 0)
+
+    # overridden agent_action still sees every action
+    class CountingAgent(ReplayGameAgent):
+        def __init__(self):
+            super(CountingAgent, self).__init__()
+            self.calls = []
+        def agent_action(self, node, method_name, arg_list):
+            self.calls.append(method_name)
+            return super(CountingAgent, self).agent_action(node, method_name, arg_list)
+    ca = CountingAgent()
+    assert(ca.action_links is None)
+    ca.set_fsm("common.simple_fsm")
+    ca.blackboard["test_tree"] = "replay_test.replay_test_btree"
+    ca.blackboard["total"] = 0
+    ca.enable(True)
+    assert("aim_enter" in ca.calls)
+
+    # actions set on the instance are not bypassed by the class tables
+    ia = ReplayGameAgent()
+    powers = []
+    ia.aim_enter = lambda node, power: powers.append(power)
+    ia.set_fsm("common.simple_fsm")
+    ia.blackboard["test_tree"] = "replay_test.replay_test_btree"
+    ia.blackboard["total"] = 0
+    ia.power = 3
+    ia.enable(True)
+    assert(ia.action_links is None)
+    assert(powers == [3] and "power" not in ia.blackboard)
+    ra = ReplayGameAgent()
+    ra.set_fsm("common.simple_fsm")
+    ra.aim_leave = lambda node: None
+    ra.relink()
+    assert(ra.action_links is None)
+
+class PropAgent(action_agent.ActionAgent):
+    position = props.tracked("position")
+
+    def __init__(self):
+        super(PropAgent, self).__init__()
+        self.position = 1
+        self.computed = 0
+
+    @props.tick_cached(depends=("position",))
+    def danger(self):
+        self.computed += 1
+        return self.position * 2
+
+    @props.tick_cached(depends=("danger",))
+    def threat(self):
+        return self.danger + 1
+
+def props0():
+    logger.debug(">>>>")
+    pa = PropAgent()
+    registry = metrics.Registry()
+    pa.attach_metrics(registry)
+    hits0, misses0 = props.stats(PropAgent)["danger"]
+    assert(pa.get_property("danger") == 2 and pa.danger == 2 and pa.computed == 1)
+    assert(pa.threat == 3 and pa.computed == 1)
+    # a new tick
+    pa.poll()
+    assert(pa.danger == 2 and pa.computed == 2)
+    # setting a dependency to the same value keeps the cache
+    pa.position = 1
+    assert(pa.danger == 2 and pa.computed == 2)
+    pa.position = 5
+    assert(pa.threat == 11 and pa.computed == 3)
+    pa.invalidate("danger")
+    assert(pa.threat == 11 and pa.computed == 4)
+    try:
+        pa.danger = 0
+        assert(False)
+    except AttributeError:
+        pass
+    hits, misses = props.stats(PropAgent)["danger"]
+    assert(misses - misses0 == 4 and hits - hits0 == 3)
+    counters = registry.snapshot()["counters"]
+    assert(counters["agent.prop_misses"] == 7 and counters["agent.prop_hits"] == 3)
+    # in a world the cache lasts a world tick
+    w = world.World()
+    w.add_agent(pa)
+    pa.danger
+    pa.poll()
+    pa.danger
+    assert(pa.computed == 5)
+    w.tick()
+    pa.danger
+    assert(pa.computed == 6)
+
+def tank_danger0():
+    logger.debug(">>>>")
+    # the demo imports PyQt5 and its game only in complete mode
+    mode.set_export()
+    try:
+        tank_agent = importlib.import_module("demo.tank2d.tank_agent")
+    finally:
+        mode.set_complete()
+
+    class Point(object):
+        def __init__(self, x, y):
+            self._x, self._y = x, y
+
+        def x(self):
+            return self._x
+
+        def y(self):
+            return self._y
+
+        def __sub__(self, other):
+            return Point(self._x - other._x, self._y - other._y)
+
+        def __mul__(self, k):
+            return Point(self._x * k, self._y * k)
+
+    class Game(object):
+        UNIT = 1.0
+
+    class Bullet(object):
+        def __init__(self, x):
+            self.position = Point(x, 0.0)
+            self.rotation = 3.141592653589793  # heading to the tank
+
+    class Arena(object):
+        def __init__(self):
+            self.bullets = [Bullet(2.0)]
+            self.queries = 0
+
+        def get_bullets_in_range(self, position, radius):
+            self.queries += 1
+            return self.bullets
+
+    class Tank(object):
+        def __init__(self):
+            self.arena = Arena()
+            self.position = Point(0.0, 0.0)
+
+    tank_agent.game = Game
+    try:
+        tank = Tank()
+        ta = tank_agent.TankAgent(tank)
+        w = world.World()
+        w.add_agent(ta)
+        assert(abs(ta.danger_rate - 2.5) < 1e-9)
+        assert(ta.get_property("danger_rate") == ta.danger_rate)
+        assert(tank.arena.queries == 1)
+        # the bullet moves, the cached value lasts until invalidated
+        tank.arena.bullets[0].position = Point(4.0, 0.0)
+        assert(abs(ta.danger_rate - 2.5) < 1e-9)
+        ta.invalidate("danger_rate")
+        assert(abs(ta.danger_rate - 1.25) < 1e-9 and tank.arena.queries == 2)
+        # or until the next world tick
+        tank.arena.bullets = []
+        w.tick()
+        assert(ta.danger_rate == 0 and tank.arena.queries == 3)
+        hits, misses = props.stats(tank_agent.TankAgent)["danger_rate"]
+        assert(hits == 3 and misses == 3)
+    finally:
+        del tank_agent.game
+
+def flyweight0():
+    logger.debug(">>>>")
+    class Watcher(object):
+        def __init__(self):
+            self.states = []
+
+        def check_debug(self, node):
+            self.states.append(node.state)
+
+    def play(tree, fly, seed=0, watcher=None):
+        ta = action_agent.ActionAgent()
+        ta.flyweight = fly
+        if watcher is not None:
+            ta.attach_debugger(watcher)
+        ta.seed_rng(seed)
+        ta.set_fsm("common.simple_fsm")
+        ta.blackboard["test_tree"] = tree
+        ta.enable(True)
+        return ta
+    ta = play("sequence_test.sequence_test0_btree", True)
+    assert(isinstance(ta.btree, flyweight.Instance))
+    assert(ta.blackboard["count0"] == 13 and ta.blackboard["count1"] == 14)
+    ta = play("call_test.call_test0_btree", True)
+    assert(ta.blackboard["cnt0"] == 2 and ta.blackboard["cnt1"] == 4)
+    # random sequences and probabilities draw as node graphs do
+    for tree in ("random_sequence_test.random_sequence_test_btree",
+                 "probability_test.probability_test_btree"):
+        for i in range(0, 20):
+            assert(play(tree, True, i).blackboard["ret"] == play(tree, False, i).blackboard["ret"])
+    # pushed actions are finished through Node.finish
+    ta = play("parallel_test.parallel_test1_btree", True)
+    assert(ta.blackboard[22][1] == True and ta.blackboard[33][1] == True)
+    assert(ta.is_ready() == False)
+    ta.blackboard[22][0](False)
+    assert(ta.blackboard[22] is False and ta.blackboard[33] is False)
+    ta.fire_event("timeout")
+    # every agent shares the layout of the tree
+    old_prefix, loader.prefix = loader.prefix, ""
+    try:
+        fsm_name, _ = bench_suite.prepare("fly", 5, 3, bench_generator.MIXED)
+        w, agents = bench_suite.spawn(fsm_name, 50, flyweight=True)
+        bench_suite.drive(w, agents, 5)
+    finally:
+        loader.prefix = old_prefix
+    layouts = set(id(a.btree.layout) for a in agents)
+    assert(len(layouts) == 1)
+    assert(all(a.btree.footprint() < 1024 for a in agents))
+    # actions run in the order of node graphs, on trees with parallels too
+    class ActionLog(bench_suite.BenchAgent):
+        def __init__(self):
+            super(ActionLog, self).__init__()
+            self.log = []
+            self.entered = set()
+            self.unentered_leaves = 0
+
+        def bench_sync(self, node):
+            self.log.append(("enter", node.desc.debug_info))
+            node.finish(True)
+
+        def bench_async(self, node):
+            self.log.append(("enter", node.desc.debug_info))
+            self.entered.add(node)
+            super(ActionLog, self).bench_async(node)
+
+        def bench_async_leave(self, node):
+            # node graphs leave interrupted nodes not entered yet, and
+            # finished nodes once more when a parallel interrupts them
+            if node in self.entered:
+                self.entered.discard(node)
+                self.log.append(("leave", node.desc.debug_info))
+            else:
+                self.unentered_leaves += 1
+
+    def actions(fsm_name, seed, fly):
+        w = world.World()
+        agents = []
+        for i in range(0, 3):
+            a = ActionLog()
+            a.flyweight = fly
+            a.seed_rng(i, seed)
+            a.blackboard["x"] = (i % 10) / 10.0
+            a.set_fsm(fsm_name)
+            a.enable(True)
+            w.add_agent(a)
+            agents.append(a)
+        bench_suite.drive(w, agents, 10, seed)
+        return agents
+    old_prefix, loader.prefix = loader.prefix, ""
+    try:
+        for name, depth, fanout, mix in bench_suite.SCENARIOS[1:]:
+            for seed in range(0, 3):
+                fsm_name, _ = bench_suite.prepare("fly_" + name, depth, fanout, mix, seed)
+                graphs = actions(fsm_name, seed, False)
+                flys = actions(fsm_name, seed, True)
+                assert([a.log for a in graphs] == [a.log for a in flys])
+                assert(all(a.log for a in flys))
+                assert(all(a.unentered_leaves == 0 for a in flys))
+    finally:
+        loader.prefix = old_prefix
+    # debuggers see node graphs
+    watcher = Watcher()
+    ta = play("sequence_test.sequence_test0_btree", True, watcher=watcher)
+    assert(type(ta.btree).__name__ == "Root" and watcher.states)
+
+def bench0():
+    logger.debug(">>>>")
+    root = bench_generator.generate(3, 3, bench_generator.MIXED, seed=3)
+    assert(bench_generator.count_nodes(root) > 6)
+    r0 = bench_suite.run_scenario("test", 3, 3, bench_generator.MIXED, 5, 5, 1, False, 3)
+    r1 = bench_suite.run_scenario("test", 3, 3, bench_generator.MIXED, 5, 5, 1, True, 3)
+    assert(r0["visits"] > 0 and r0["visits"] == r1["visits"] and r0["events"] == r1["events"])
+    assert(r1["peak_bytes"] > 0)
+    baseline = {"test": dict(r1, visits_per_sec=r1["visits_per_sec"] * 2)}
+    regressions = bench_suite.compare({"test": r1}, baseline)
+    assert([i[:2] for i in regressions] == [("test", "visits_per_sec")])
+
+def bundle0():
+    logger.debug(">>>>")
+    e = bundle_exporter.BundleExporter()
+    e.add_target("ai2.test")
+    fd, path = tempfile.mkstemp(".bundle")
+    os.close(fd)
+    try:
+        names = e.export(path)
+        assert("ai2.test.common.simple_fsm" in names)
+        b = loader.open_bundle(path)
+        for n in names:
+            m = sys.modules[n]
+            assert(b.get_module(n).__dict__.get("root") == getattr(m, "root", None))
+        assert(b.get_module("ai2.test.common.simple_fsm").states == sys.modules["ai2.test.common.simple_fsm"].states)
+        # and the sources of the expressions of trees
+        m = b.get_module("ai2.test.if_else_test.if_else_test2_btree")
+        assert(("tv > 1", "<string>", "eval") in m.expr_sources)
+        # trees are materialized from the bundle from now on
+        loader._loaded.clear()
+        sequence0()
+        select0()
+        call0()
+        probability0()
+        shard0()
+        assert(len(loader._loaded) >= 5 and set(loader._loaded) <= set(names))
+        # equal expressions of different trees share their code objects
+        codes = {}
+        for n in ("if_else_test.if_else_test0_btree", "if_else_test.if_else_test1_btree"):
+            for desc in loader.load_btree(n).nodes:
+                if desc.category == defs.NT_COMP:
+                    codes.setdefault(desc.data[0], set()).add(id(desc.data[0]))
+        assert(codes and all(len(i) == 1 for i in codes.values()))
+    finally:
+        loader.close_bundles()
+        loader._loaded.clear()
+        os.remove(path)
+
+def jit0():
+    logger.debug(">>>>")
+    names = (
+        "until_test.until_test_btree",
+        "if_else_test.if_else_test2_btree",
+        "not_test.not_test_btree",
+        "sequence_test.sequence_test0_btree",
+    )
+    loader.use_jit = True
+    try:
+        for n in names:
+            loader.load_btree(n, force=True)
+        until = loader.get_root_desc(names[0]).children[0].children[1]
+        assert(until.node_class is nodes.Compiled)
+        assert(until.children[0].jit is None)
+        until0()
+        ifelse2()
+        not0()
+        sequence0()
+    finally:
+        loader.use_jit = False
+        for n in names:
+            loader.load_btree(n, force=True)
+
+
 def run():
     logging.basicConfig(level=logging.DEBUG)
     loader.prefix = "ai2.test."
 
     state_machine0()
     state_machine1()
+    state_machine2()
 
     sequence0()
     sequence1()
@@ -245,6 +1385,9 @@ def run():
     select1()
 
     probability0()
+    rand0()
+    sampling0()
+    batch_picks0()
 
     ifelse0()
     ifelse1()
@@ -254,6 +1397,15 @@ def run():
     parallel1()
     parallel2()
 
+    event_index0()
+    ready_queue0()
+    descriptor0()
+    pool0()
+
+    world0()
+    world1()
+    shard0()
+
     until0()
 
     not0()
@@ -261,5 +1413,23 @@ def run():
     always0()
     always1()
     call0()
+
+    expression0()
+    blackboard0()
+    trace0()
+    debug_server0()
+    debug_server1()
+    debug_filter0()
+    profiler0()
+    metrics0()
+    replay0()
+    dispatch0()
+    props0()
+    tank_danger0()
+    flyweight0()
+    bench0()
+    bundle0()
+    debug_hooks0()
+    jit0()
     logger.debug(">>> finished")
     return
@@ -0,0 +1,53 @@
+# -*- encoding: utf-8 -*-
+"""
+write the exported trees and fsms of packages into one bundle
+
+    python run.py ai2.tools.bundle_exporter.exporter ai.bundle ai_data [more packages]
+"""
+import sys
+import pkgutil
+import importlib
+
+import ai2.runtime.bundle as bundle
+
+SUFFIXES = ("_btree", "_fsm")
+
+
+class BundleExporter(object):
+    def __init__(self):
+        self.targets = []  # module or package names
+
+    def add_target(self, *args):
+        for a in args:
+            if a not in self.targets:
+                self.targets.append(a)
+
+    def collect(self):
+        """
+        :return: names of the _btree/_fsm modules of the targets, sorted
+        """
+        names = set()
+        for target in self.targets:
+            m = importlib.import_module(target)
+            if not hasattr(m, "__path__"):
+                names.add(target)
+                continue
+            for info in pkgutil.walk_packages(m.__path__, target + "."):
+                if not info.ispkg and info.name.endswith(SUFFIXES):
+                    names.add(info.name)
+        return sorted(names)
+
+    def export(self, path="ai.bundle"):
+        """
+        :return: names of the modules written
+        """
+        names = self.collect()
+        bundle.write_bundle(path, [importlib.import_module(i) for i in names])
+        return names
+
+
+def run():
+    e = BundleExporter()
+    e.add_target(*sys.argv[3:])
+    names = e.export(sys.argv[2])
+    print("%d modules written to %s" % (len(names), sys.argv[2]))
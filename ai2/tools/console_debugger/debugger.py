@@ -6,55 +6,133 @@ import threading
 import queue
 import logging
 import collections
-from xmlrpc.client import ServerProxy
+import socket
+
+import ai2.runtime.debug_protocol as protocol
 
 logger = logging.getLogger("debugger")
 
 
 class DebugClient(object):
+    """
+    client of DebugStub, traces are pushed by the stub and collected by
+    get_agent_track into data as (agent_id, location, state)
+    """
     def __init__(self, addr, port):
         self.server = None
-        self.addr_str = "http://%s:%s/" % (addr, port)
+        self.addr = (addr, int(port))
         self.agent_id = None
         self.worker = None
         self.data = []
         self.jobs = queue.Queue(16)
         self.lock = threading.Lock()
+        self.reader = protocol.FrameReader()
+        self.replies = collections.deque()  # control messages not taken yet
+        self.agents = {}  # agent number -> agent id
+        self.trees = {}  # tree id -> [debug_info by node index]
+        self.lost = 0
 
     def is_valid(self):
         return self.server is not None
 
     def connect(self):
         self.server = None
-        self.server = ServerProxy(self.addr_str)
         try:
-            ret = self.server.handshake()
-            return True, ret
+            self.server = socket.create_connection(self.addr)
+            self.server.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.send(protocol.MSG_HELLO, protocol.VERSION)
+            ret = self.wait_reply(protocol.MSG_WELCOME)
+            return True, ret[0]
         except Exception as e:
+            self.server = None
             return False, e
 
+    def send(self, msg_type, *args):
+        self.server.sendall(protocol.pack_message(msg_type, *args))
+
+    def receive(self, timeout):
+        """
+        process the frames arriving within timeout
+        :return: False if the connection is closed, None if nothing arrived
+        """
+        self.server.settimeout(timeout)
+        try:
+            data = self.server.recv(65536)
+        except (socket.timeout, BlockingIOError):
+            return None
+        if not data:
+            return False
+        for msg_type, body in self.reader.feed(data):
+            if msg_type == protocol.MSG_TRACE:
+                self.on_trace(body)
+                continue
+            args = protocol.unpack_message(body)
+            if msg_type == protocol.MSG_AGENT:
+                self.agents[args[0]] = args[1]
+            elif msg_type == protocol.MSG_TREE:
+                self.trees[args[0]] = args[2]
+            else:
+                self.replies.append((msg_type, args))
+        return True
+
+    def on_trace(self, body):
+        agent_no, lost, records = protocol.unpack_trace(body)
+        agent_id = self.agents[agent_no]
+        trees = self.trees
+        states = protocol.STATES
+        l = [(agent_id, trees[tid][index], states[sc]) for tid, index, sc, _ in records]
+        self.lock.acquire()
+        self.lost += lost
+        self.data += l
+        self.lock.release()
+
+    def wait_reply(self, msg_type):
+        while True:
+            for i, (t, args) in enumerate(self.replies):
+                if t == msg_type:
+                    del self.replies[i]
+                    return args
+            if self.receive(None) is False:
+                raise ConnectionError("debug stub closed the connection")
+
     def get_agent_list(self):
-        return self.server.get_agent_list()
+        self.send(protocol.MSG_LIST)
+        return self.wait_reply(protocol.MSG_AGENTS)[0]
 
     def set_agent_id(self, id):
         self.agent_id = id
 
-    def track_agent(self, on_off):
-        return self.server.track_agent(self.agent_id, on_off)
-
-    def get_agent_track(self):
-        ret = self.server.get_agent_track(self.agent_id)
-        if ret is False:
-            return False
-        self.lock.acquire()
-        self.data += ret
-        self.lock.release()
+    def track_agent(self, on_off, trace_filter=None):
+        return self.track_agents([self.agent_id], on_off, trace_filter)[0]
+
+    def track_agents(self, agent_ids, on_off, trace_filter=None):
+        """
+        :param agent_ids: agents to (un)subscribe, None for every agent
+                          including the ones added later
+        :param trace_filter: protocol.TraceFilter, None to get everything
+        :return: [success] by agent
+        """
+        spec = None if trace_filter is None else trace_filter.to_spec()
+        if agent_ids is None:
+            agent_ids = [None]
+        for i in agent_ids:
+            self.send(protocol.MSG_SUBSCRIBE, i, on_off, spec)
+        return [self.wait_reply(protocol.MSG_SUBSCRIBED)[1] for _ in agent_ids]
+
+    def get_agent_track(self, timeout=0.0):
+        # wait for the first frames then take whatever else arrived already
+        ret = self.receive(timeout)
+        while ret:
+            ret = self.receive(0.0)
+        return ret is not False
 
     def finish(self):
         try:
             self.track_agent(False)
         except:
             pass
+        if self.server is not None:
+            self.server.close()
         return True
 
     def start_worker(self):
@@ -89,7 +167,7 @@ class DebugClient(object):
     # outer API
     ###########################################################################
     def shutdown(self):
-        self.jobs.put(self.finish)
+        self.put_job(self.finish)
         self.worker.join()
 
     def take_data(self):
@@ -109,9 +187,8 @@ def run():
         client.set_agent_id(agent_id)
         client.track_agent(True)
     while True:
-        ret = client.get_agent_track()
+        ret = client.get_agent_track(1.0)
         if ret is False:
             break
-        for i in ret:
+        for i in client.take_data():
             print(i)
-
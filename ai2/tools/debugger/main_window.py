@@ -40,7 +40,7 @@ class DebuggerMainWindow(object):
     def poll_handler(self):
         self.comm.put_job(self.comm.get_agent_track)
         data = self.comm.take_data()
-        for location_info, state in data:
+        for _, location_info, state in data:
             file_name, node_id = location_info
             i = self.get_instance(file_name)
 
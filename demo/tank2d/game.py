@@ -10,6 +10,7 @@ from PyQt5.QtWidgets import \
     QGraphicsView, QGraphicsItem, QApplication, QGraphicsScene, QGraphicsItemGroup
 
 from ai2.runtime.debug_stub import DebugStub
+from ai2.runtime.world import World
 
 from ai2.runtime import loader
 loader.prefix = "ai_data."
@@ -403,6 +404,7 @@ class AI2AITank(AITank):
 
     def start(self):
         self.agent = tank_agent.TankAgent(self)
+        self.arena.world.add_agent(self.agent)
         self.agent.blackboard["disabled_tree"] = "disabled_btree"
         self.agent.blackboard["normal_tree"] = "walk_around_shooter_btree"
         self.agent.start("simple_tank_fsm")
@@ -412,6 +414,10 @@ class AI2AITank(AITank):
 
     def update(self):
         super(AI2AITank, self).update()
+        self.agent.invalidate("danger_rate")
+        bb = self.agent.blackboard
+        if bb.is_watched("danger_rate"):
+            bb["danger_rate"] = self.agent.danger_rate
         copied_ticks = set(self._ticks)
         for tick in copied_ticks:
             tick()
@@ -432,6 +438,7 @@ class Arena(object):
         self.clock = None
         self.time = 0
         self.dt = 1.0 / self.FPS
+        self.world = World()
 
     def start(self):
         if self.clock is None:
@@ -461,6 +468,8 @@ class Arena(object):
                 self.scene.removeItem(c.graphics)
         self.children = self.new_children
         self.new_children = []
+        # ai phase: settle all agents touched during this frame
+        self.world.tick()
 
     def set_scene(self, scene):
         self.scene = scene
@@ -6,6 +6,7 @@ import logging
 from ai2.runtime.action_agent import \
     ActionAgent, enable_register4export
 from ai2.runtime.mode import is_complete
+from ai2.runtime.props import tick_cached
 
 if is_complete():
     from PyQt5.QtCore import QPointF
@@ -178,17 +179,25 @@ class TankAgent(ActionAgent):
         ns.timer.cancel()
 
     @register4export
-    def wait_until_danger_exceed_start(self, node, interval, level):
+    def wait_until_danger_exceed_start(self, node, level):
+        # danger_rate is published to the blackboard by the tank every frame
+        # while it is watched, the watcher only hears about changes so the
+        # current danger is checked first
         ns = node.node_state = NodeState()
-        def callback():
-            if self.danger_rate > level:
+        ns.watch = None
+        if self.danger_rate > level:
+            node.finish(True)
+            return
+        def callback(danger):
+            if danger > level:
                 node.finish(True)
-        ns.timer = self.tank.add_timer(interval, callback, -1)
+        ns.watch = self.blackboard.watch("danger_rate", callback)
 
     @register4export
     def wait_until_danger_exceed_end(self, node):
         ns = node.node_state
-        ns.timer.cancel()
+        if ns.watch is not None:
+            self.blackboard.unwatch(ns.watch)
 
     @register4export
     def random_walk_start(self, node, a, b):
@@ -206,8 +215,10 @@ class TankAgent(ActionAgent):
     def target_hp(self):
         return self.attack_target.hp
 
-    @property
+    @tick_cached
     def danger_rate(self):
+        # depends on the tank and the bullets, which move every frame, the
+        # tank invalidates it after moving (see AI2AITank.update)
         return self.get_danger_rate_for_pos(self.tank.position)
 
     def get_danger_rate_for_pos(self, pos):